@@ -0,0 +1,323 @@
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+from collections import namedtuple, defaultdict
+from datetime import date
+from functools import lru_cache
+
+# 用户的订阅规则，出发地/目的地/星期为None表示不限，日期格式为YYYYMMDD
+AlertRule = namedtuple('AlertRule', ['id', 'push_token', 'origins', 'destinations', 'dep_start', 'dep_end',
+                                     'weekdays', 'min_nights', 'max_nights', 'max_price'])
+
+# 比任何YYYYMMDD都大，用于没有结束日期的规则
+_NO_END = '99999999'
+# ISO星期1-7对应的位，用于不限出发星期的规则
+_ALL_WEEKDAYS = sum(1 << day for day in range(1, 8))
+_MAX_NIGHTS = 10 ** 6
+
+
+@lru_cache(maxsize=4096)
+def _to_date(yyyymmdd):
+    return date(int(yyyymmdd[:4]), int(yyyymmdd[4:6]), int(yyyymmdd[6:]))
+
+
+def _split_codes(value):
+    if not value:
+        return None
+    return frozenset(code.strip().upper() for code in value.split(',') if code.strip()) or None
+
+
+def _to_yyyymmdd(value):
+    if not value:
+        return None
+    if isinstance(value, date):
+        return value.strftime('%Y%m%d')
+    return str(value).replace('-', '')
+
+
+def parse_rule(row):
+    """把t_alert_rule的一行转换为AlertRule
+
+    origins/destinations/weekdays在表中是逗号分隔的字符串，日期列可以是date或YYYY-MM-DD字符串。
+    """
+    weekdays = row.get('weekdays')
+    return AlertRule(
+        id=row['id'],
+        push_token=row['push_token'],
+        origins=_split_codes(row.get('origins')),
+        destinations=_split_codes(row.get('destinations')),
+        dep_start=_to_yyyymmdd(row.get('dep_start')),
+        dep_end=_to_yyyymmdd(row.get('dep_end')),
+        weekdays=frozenset(int(day) for day in str(weekdays).split(',') if day.strip()) if weekdays else None,
+        min_nights=row.get('min_nights'),
+        max_nights=row.get('max_nights'),
+        max_price=float(row['max_price']),
+    )
+
+
+class _Bucket:
+    __slots__ = ('starts', 'entries', 'candidates')
+
+    def __init__(self, rules):
+        # 每条规则预先展开成不含None的比较条件：
+        # (开始日期, max_price, 结束日期, 出发星期位掩码, 最少几晚, 最多几晚, 规则)
+        entries = [(rule.dep_start or '', rule.max_price, rule.dep_end or _NO_END,
+                    sum(1 << day for day in rule.weekdays) if rule.weekdays else _ALL_WEEKDAYS,
+                    rule.min_nights if rule.min_nights is not None else 0,
+                    rule.max_nights if rule.max_nights is not None else _MAX_NIGHTS,
+                    rule) for rule in rules]
+        entries.sort(key=lambda entry: entry[0])
+        self.entries = entries
+        self.starts = [entry[0] for entry in entries]
+        # (出发日期, 住几晚) -> (按max_price从高到低排序的规则, 对应的-max_price列表)
+        self.candidates = {}
+
+    def scan(self, dep_date, weekday_bit, nights, price, matched):
+        """逐条检查开始日期不晚于dep_date的规则"""
+        for _, max_price, end, weekdays, min_nights, max_nights, rule in \
+                self.entries[:bisect.bisect_right(self.starts, dep_date)]:
+            if (price <= max_price and dep_date <= end and weekdays & weekday_bit
+                    and min_nights <= nights <= max_nights):
+                matched.append(rule)
+
+    def cached(self, dep_date, weekday_bit, nights, price, matched):
+        """按 (出发日期, 住几晚) 缓存日期条件都满足的规则，之后只需要按价格二分查找"""
+        entry = self.candidates.get((dep_date, nights))
+        if entry is None:
+            rules = []
+            self.scan(dep_date, weekday_bit, nights, float('-inf'), rules)
+            rules.sort(key=lambda rule: -rule.max_price)
+            entry = self.candidates[(dep_date, nights)] = (rules, [-rule.max_price for rule in rules])
+        rules, neg_prices = entry
+        matched.extend(rules[:bisect.bisect_right(neg_prices, -price)])
+
+
+class AlertRuleIndex:
+    def __init__(self, rules):
+        """按航线和出发日期索引的订阅规则
+
+        每条规则按 (出发地或None, 目的地或None) 放入对应的桶，不限出发地或目的地的规则放在None的桶里，
+        查询一个价格时只看4个桶。
+
+        - 具体航线的桶：一次扫描中每个日期只出现一次，按开始日期二分查找跳过还没开始的规则后逐条检查。
+        - 含None的桶由很多航线共用：按 (出发日期, 住几晚) 缓存日期条件都满足的规则，
+          同一天的价格之后只需要一次二分查找，开销只和匹配数有关。
+          一次扫描中的日期组合只有几百个，缓存随规则一起重建。
+
+        Args:
+            rules: AlertRule列表
+        """
+        buckets = defaultdict(list)
+        for rule in rules:
+            for origin in rule.origins or (None,):
+                for destination in rule.destinations or (None,):
+                    buckets[(origin, destination)].append(rule)
+        self._buckets = {key: _Bucket(bucket_rules) for key, bucket_rules in buckets.items()}
+        self.size = len(rules)
+        # 高于所有规则max_price的价格不用检查
+        self.max_price = max((rule.max_price for rule in rules), default=0.0)
+        self.rule_ids = frozenset(rule.id for rule in rules)
+        # 同一条航线的价格是连续写入的，记住上一条航线用到的桶
+        self._route = None
+        self._route_buckets = (None, ())
+        # (出发日期, 返回日期) -> (住几晚, 出发星期位)
+        self._dates = {}
+
+    def _buckets_for(self, place_from, place_to):
+        if self._route != (place_from, place_to):
+            buckets = self._buckets
+            self._route_buckets = (
+                buckets.get((place_from, place_to)),
+                tuple(bucket for bucket in (buckets.get((place_from, None)), buckets.get((None, place_to)),
+                                            buckets.get((None, None))) if bucket is not None)
+            )
+            self._route = (place_from, place_to)
+        return self._route_buckets
+
+    def _date_info(self, dep_date, arr_date):
+        info = self._dates.get((dep_date, arr_date))
+        if info is None:
+            if len(self._dates) > 100000:
+                self._dates.clear()
+            dep = _to_date(dep_date)
+            info = self._dates[(dep_date, arr_date)] = ((_to_date(arr_date) - dep).days, 1 << dep.isoweekday())
+        return info
+
+    def match(self, place_from, place_to, dep_date, arr_date, price):
+        """返回与这个价格匹配的规则
+
+        Args:
+            dep_date: 出发日期，格式为YYYYMMDD
+            arr_date: 返回日期，格式为YYYYMMDD
+        """
+        matched = []
+        if not self.size:
+            return matched
+        nights, weekday_bit = self._date_info(dep_date, arr_date)
+        route_bucket, shared_buckets = self._buckets_for(place_from, place_to)
+        if route_bucket is not None:
+            route_bucket.scan(dep_date, weekday_bit, nights, price, matched)
+        for bucket in shared_buckets:
+            bucket.cached(dep_date, weekday_bit, nights, price, matched)
+        return matched
+
+
+class AlertRuleMatcher:
+    def __init__(self, storage, refresh_interval=300, state_path=None):
+        """把接口返回的价格与用户的订阅规则匹配，按push token收集匹配结果
+
+        规则保存在存储后端的t_alert_rule中，每refresh_interval秒重新读取一次并重建索引。
+        FlightAlert用match_prices匹配接口返回的完整价格矩阵，不受targetPrice和tripPatterns限制，
+        并且在响应指纹跳过未变化的矩阵之前匹配，新加的规则下一次扫描就能匹配到已有的价格。
+        同一条规则的同一个日期对只在第一次匹配或价格更低时通知，已通知的价格保存在state_path中。
+        pop_matches按token分组后的结构与PriceManager.update_price_info相同。
+
+        Args:
+            storage: storage.PriceStorage
+            refresh_interval: 重新读取规则的间隔(秒)
+            state_path: 可选，保存已通知价格的JSON文件
+        """
+        self.storage = storage
+        self.refresh_interval = refresh_interval
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.index = AlertRuleIndex([])
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        # 匹配到规则的价格：(place_from, place_to, dep_date, arr_date, price, 规则列表)，
+        # 取出时才按token分组，写入时每个价格只追加一次
+        self._matches = []
+        self.stats = {'checked': 0, 'matched': 0}
+        self.state_path = state_path
+        # (规则id, place_from, place_to, dep_date, arr_date) -> 已通知的价格
+        self._notified = self._load_notified()
+        self._dirty = False
+
+    def _load_notified(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return {}
+        try:
+            with open(self.state_path, 'r') as f:
+                return {tuple(entry[:5]): entry[5] for entry in json.load(f)}
+        except Exception as e:
+            self.logger.error(f"Failed to load notified alert prices: {e}")
+            return {}
+
+    def save(self):
+        """写出已通知的价格，同时清理已出发的日期和已删除的规则"""
+        if not self.state_path or not self._dirty:
+            return
+        today = date.today().strftime('%Y%m%d')
+        rule_ids = self.index.rule_ids
+        with self._lock:
+            self._notified = {key: price for key, price in self._notified.items()
+                              if key[3] >= today and (self._loaded_at is None or key[0] in rule_ids)}
+            entries = [list(key) + [price] for key, price in self._notified.items()]
+        tmp_path = f"{self.state_path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(entries, f, separators=(',', ':'))
+            os.replace(tmp_path, self.state_path)
+            self._dirty = False
+        except OSError as e:
+            self.logger.error(f"Failed to save notified alert prices: {e}")
+
+    def refresh(self, force=False):
+        """距离上次读取超过refresh_interval秒时重新读取规则，读取失败时继续使用原来的规则"""
+        if (not force and self._loaded_at is not None
+                and time.monotonic() - self._loaded_at < self.refresh_interval):
+            return False
+        self._loaded_at = time.monotonic()
+        try:
+            rules = []
+            for row in self.storage.load_alert_rules():
+                try:
+                    rules.append(parse_rule(row))
+                except (KeyError, TypeError, ValueError) as e:
+                    self.logger.warning(f"Skipped invalid alert rule {row.get('id')}: {e}")
+        except Exception as e:
+            self.logger.error(f"Failed to load alert rules, keeping {self.index.size} rules: {e}")
+            return False
+        self.index = AlertRuleIndex(rules)
+        self.logger.info(f"Loaded {len(rules)} alert rules")
+        return True
+
+    def match(self, place_from, place_to, dep_date, arr_date, price):
+        """匹配一个价格
+
+        Returns:
+            int: 匹配的规则数
+        """
+        rules = self.index.match(place_from, place_to, dep_date, arr_date, price)
+        if rules:
+            with self._lock:
+                self._matches.append((place_from, place_to, dep_date, arr_date, price, rules))
+            self.stats['matched'] += len(rules)
+        self.stats['checked'] += 1
+        return len(rules)
+
+    def match_prices(self, place_from, place_to, prices):
+        """匹配一个接口响应中的所有价格，高于所有规则max_price的价格直接跳过
+
+        Args:
+            prices: (dep_date, arr_date, price)的可迭代对象，日期格式为YYYYMMDD
+
+        Returns:
+            int: 匹配的规则数
+        """
+        index = self.index
+        if not index.size:
+            return 0
+        bound = index.max_price
+        matched = 0
+        for dep_date, arr_date, price in prices:
+            if price and float(price) <= bound:
+                matched += self.match(place_from, place_to, dep_date, arr_date, float(price))
+        return matched
+
+    def pop_matches(self, limit=None):
+        """取出并清空匹配结果，按token分组，同一个日期对保留最低价格
+
+        同一条规则已经通知过相同或更低价格的日期对不再通知。
+
+        Args:
+            limit: 可选，每个token最多保留的价格数，超出的只计数，与通知的alertMaxLines对应
+
+        Returns:
+            dict: {push_token: ({(place_from, place_to): {(dep_date, arr_date): price}}, 超出limit的价格数)}
+        """
+        with self._lock:
+            pending = self._matches
+            self._matches = []
+        notified = self._notified
+        matches = {}
+        for place_from, place_to, dep_date, arr_date, price, rules in pending:
+            tokens = set()
+            for rule in rules:
+                key = (rule.id, place_from, place_to, dep_date, arr_date)
+                previous = notified.get(key)
+                if previous is not None and price >= previous:
+                    continue
+                notified[key] = price
+                self._dirty = True
+                tokens.add(rule.push_token)
+            for token in tokens:
+                entry = matches.get(token)
+                if entry is None:
+                    entry = matches[token] = [{}, 0, 0]
+                price_info, count, omitted = entry
+                prices = price_info.get((place_from, place_to))
+                current = prices.get((dep_date, arr_date)) if prices is not None else None
+                if current is not None:
+                    if price < current:
+                        prices[(dep_date, arr_date)] = price
+                elif limit is not None and count >= limit:
+                    entry[2] += 1
+                else:
+                    if prices is None:
+                        prices = price_info[(place_from, place_to)] = {}
+                    prices[(dep_date, arr_date)] = price
+                    entry[1] += 1
+        return {token: (price_info, omitted) for token, (price_info, _, omitted) in matches.items()}
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# 比较原来逐日期strptime的处理方式和TripCalendar查表方式在大价格矩阵上的耗时
+
+import time
+import random
+import argparse
+from datetime import date, datetime, timedelta
+from price_extraction import TripCalendar, DEFAULT_TRIP_PATTERNS
+
+
+def legacy_extract(matrix, target_price):
+    """原_process_flight_info中的处理逻辑(不含写库)"""
+    found = []
+    for dep_date, prices in matrix.items():
+        weekday = time.strptime(dep_date, '%Y%m%d').tm_wday + 1
+        if weekday not in (4, 5):
+            continue
+        days_diff = (datetime.strptime(dep_date, "%Y%m%d").date() - datetime.now().date()).days
+        arr_date = (datetime.strptime(dep_date, "%Y%m%d") + timedelta(days=3)).strftime("%Y%m%d")
+        price = prices.get(arr_date, 0)
+        if price and price < target_price:
+            found.append((dep_date, arr_date, price))
+    return found
+
+
+def make_matrix(dep_days, stay_days):
+    """生成dep_days个出发日期、每个出发日期stay_days个返回日期的随机价格矩阵"""
+    today = date.today()
+    matrix = {}
+    for i in range(dep_days):
+        dep = today + timedelta(days=i)
+        matrix[dep.strftime('%Y%m%d')] = {
+            (dep + timedelta(days=j)).strftime('%Y%m%d'): random.randint(300, 2000)
+            for j in range(1, stay_days + 1)
+        }
+    return matrix
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark price matrix extraction')
+    parser.add_argument('--routes', type=int, default=500, help='模拟的航线(价格矩阵)数量')
+    parser.add_argument('--dep-days', type=int, default=365, help='每个矩阵的出发日期数')
+    parser.add_argument('--stay-days', type=int, default=15, help='每个出发日期的返回日期数')
+    args = parser.parse_args()
+
+    matrices = [make_matrix(args.dep_days, args.stay_days) for _ in range(args.routes)]
+    target_price = 800
+
+    start = time.perf_counter()
+    legacy = [legacy_extract(m, target_price) for m in matrices]
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    calendar = TripCalendar(DEFAULT_TRIP_PATTERNS)
+    batched = [calendar.extract(m, target_price) for m in matrices]
+    batched_time = time.perf_counter() - start
+
+    assert [sorted(r) for r in legacy] == [sorted(r) for r in batched], "results differ"
+
+    print(f"{args.routes} matrices x {args.dep_days} departure dates")
+    print(f"legacy loop:   {legacy_time:.3f}s")
+    print(f"trip calendar: {batched_time:.3f}s ({legacy_time / batched_time:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
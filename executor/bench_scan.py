@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# 端到端扫描性能测试
+#
+# 用fake_fare_server在本地模拟机票接口，嵌入式SQLite作为存储，
+# 分别以串行和异步模式运行FlightAlert.check_all_destinations，
+# 报告每秒处理的航线数、请求延迟的p50/p99、每条航线的写库次数和内存峰值。
+# 每组(航线数, 扫描模式)在单独的子进程中运行，内存峰值互不影响。
+# 默认跳过串行扫描每条航线之后的随机sleep，加--pacing保留。
+#
+# 用法: python bench_scan.py --routes 100 1000 10000 --modes serial async
+
+import os
+import sys
+import json
+import time
+import string
+import shutil
+import logging
+import argparse
+import itertools
+import resource
+import tempfile
+import threading
+import subprocess
+import contextlib
+
+from fake_fare_server import FakeFareServer, load_price_log
+
+CURRENT_DIR = os.path.dirname(os.path.realpath(__file__))
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def make_routes(count, recorded=None):
+    """生成正好count条航线所需的出发地和目的地
+
+    出发地数取count不超过10的最大因数，出发地和目的地不重叠，两者的组合数等于count。
+    优先使用price_log.json中记录过的机场代码，不够时补充生成的三字母代码。
+
+    Returns:
+        tuple: (出发地列表, 目的地列表)
+    """
+    recorded = recorded or []
+    origin_count = max(n for n in range(1, min(10, count) + 1) if count % n == 0)
+    origins = sorted({place_from for place_from, _ in recorded})[:origin_count]
+    codes = (''.join(letters) for letters in itertools.product(string.ascii_uppercase, repeat=3))
+    while len(origins) < origin_count:
+        code = next(codes)
+        if code not in origins:
+            origins.append(code)
+    needed = count // origin_count
+    destinations = [code for code in sorted({place_to for _, place_to in recorded}) if code not in origins]
+    while len(destinations) < needed:
+        code = next(codes)
+        if code not in origins and code not in destinations:
+            destinations.append(code)
+    return origins, destinations[:needed]
+
+
+def write_config(work_dir, server, origins, destinations, args):
+    with open(os.path.join(CURRENT_DIR, 'config.json'), 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    config.update({
+        'placeFrom': origins,
+        'placeTo': destinations,
+        'baseUrl': server.base_url,
+        'internationalBaseUrl': server.international_base_url,
+        'scanMode': args.mode,
+        'scanConcurrency': args.concurrency,
+        'scanPerHostConcurrency': args.concurrency,
+        'scanRatePerSecond': args.rate,
+        'scanBurst': args.rate,
+        'fetchInitialConcurrency': args.concurrency,
+        'storageBackend': 'sqlite',
+        'sqlitePath': os.path.join('data', 'flights.db'),
+        'shardingEnabled': False,
+        'scheduleMode': 'uniform',
+        'exportEnabled': False,
+    })
+    config_path = os.path.join(work_dir, 'config.json')
+    with open(config_path, 'w', encoding='utf-8') as f:
+        json.dump(config, f, ensure_ascii=False, indent=4)
+    # ConfigManager用国内代码替换placeTo，所以只把目的地标为国内，出发地只提供城市名
+    with open(os.path.join(work_dir, 'iata_code_domestic.json'), 'w', encoding='utf-8') as f:
+        json.dump({'code2city': {code: code for code in origins + destinations}, 'domestic': destinations}, f)
+    return config_path
+
+
+def run_one(args):
+    """在当前进程中运行一组测试，返回结果字典"""
+    base_prices = load_price_log(args.seed_from) if args.seed_from else {}
+    server = FakeFareServer(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate, change_rate=args.change_rate, base_prices=base_prices
+    ).start()
+    work_dir = tempfile.mkdtemp(prefix='bench_scan_')
+    logging.basicConfig(filename=os.path.join(work_dir, 'log.txt'), level=logging.INFO)
+
+    from flight_alert import FlightAlert
+
+    class BenchFlightAlert(FlightAlert):
+        def _pause_between_routes(self):
+            if args.pacing:
+                super()._pause_between_routes()
+
+    try:
+        origins, destinations = make_routes(args.routes[0], server.routes())
+        config_path = write_config(work_dir, server, origins, destinations, args)
+        flight_alert = BenchFlightAlert(config_path)
+        routes = len(flight_alert.get_all_routes())
+        # 吞吐量按实际扫描的航线数计算，和请求的航线数不一致时说明配置被改写了
+        assert routes == args.routes[0], f"Configured {args.routes[0]} routes but the sweep covers {routes}"
+
+        # 记录每次请求的耗时，包括失败的请求
+        latencies = []
+        latencies_lock = threading.Lock()
+        get_json = flight_alert.fare_client.get_json
+
+        def timed_get_json(*call_args, **call_kwargs):
+            start = time.perf_counter()
+            try:
+                return get_json(*call_args, **call_kwargs)
+            finally:
+                with latencies_lock:
+                    latencies.append(time.perf_counter() - start)
+
+        flight_alert.fare_client.get_json = timed_get_json
+        storage = flight_alert.price_manager.storage
+
+        sweeps = []
+        for _ in range(args.sweeps):
+            latencies.clear()
+            before = storage.stats()
+            start = time.perf_counter()
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                flight_alert.check_all_destinations()
+            elapsed = time.perf_counter() - start
+            after = storage.stats()
+            writes = sum(after.get(key, 0) - before.get(key, 0) for key in ('inserted', 'changed', 'touched'))
+            sweeps.append({
+                'seconds': elapsed,
+                'routes_per_second': routes / elapsed,
+                'fetch_p50_ms': percentile(latencies, 0.5) * 1000,
+                'fetch_p99_ms': percentile(latencies, 0.99) * 1000,
+                'writes_per_route': writes / routes,
+                'flushes': after.get('flushes', 0) - before.get('flushes', 0),
+            })
+        flight_alert.close()
+        return {
+            'mode': args.mode,
+            'routes': routes,
+            'sweeps': sweeps,
+            'server': dict(server.stats),
+            # Linux上ru_maxrss的单位是KB
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        }
+    finally:
+        server.stop()
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        else:
+            print(f"Kept {work_dir}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='端到端扫描性能测试')
+    parser.add_argument('--routes', type=int, nargs='+', default=[100, 1000, 10000], help='航线数')
+    parser.add_argument('--modes', nargs='+', default=['serial', 'async'], choices=['serial', 'async'])
+    parser.add_argument('--sweeps', type=int, default=2, help='每组连续扫描的次数，第二次起可以命中响应缓存')
+    parser.add_argument('--latency', type=float, default=0.05, help='接口平均延迟(秒)')
+    parser.add_argument('--jitter', type=float, default=0.02, help='接口延迟的随机波动范围(秒)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='接口返回HTTP 500的比例')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='接口返回限流状态的比例')
+    parser.add_argument('--change-rate', type=float, default=0.2, help='两次请求之间航线价格变化的概率')
+    parser.add_argument('--concurrency', type=int, default=8, help='异步模式的并发请求数')
+    parser.add_argument('--rate', type=float, default=1000, help='异步模式每秒最多发出的请求数')
+    parser.add_argument('--pacing', action='store_true', help='保留串行扫描每条航线之后的随机sleep')
+    parser.add_argument('--seed-from', default=os.path.join(CURRENT_DIR, 'data', 'price_log.json'),
+                        help='用price_log.json中的航线和价格生成接口数据，传空字符串则全部随机生成')
+    parser.add_argument('--keep', action='store_true', help='保留临时目录中的数据库和日志')
+    parser.add_argument('--mode', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        # 子进程：只运行一组，结果以JSON输出到最后一行
+        print(json.dumps(run_one(args)))
+        return
+
+    # 子进程沿用同样的参数，后面追加的--routes和--modes覆盖前面的
+    forwarded = sys.argv[1:]
+    for routes in args.routes:
+        for mode in args.modes:
+            command = [sys.executable, os.path.realpath(__file__)] + forwarded + [
+                '--routes', str(routes), '--modes', mode, '--mode', mode]
+            output = subprocess.run(command, check=True, stdout=subprocess.PIPE, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            server = result['server']
+            for i, sweep in enumerate(result['sweeps'], 1):
+                print(f"{result['routes']:>6} routes {mode:<6} sweep {i}: "
+                      f"{sweep['routes_per_second']:8.1f} routes/s, "
+                      f"fetch p50 {sweep['fetch_p50_ms']:6.1f}ms p99 {sweep['fetch_p99_ms']:6.1f}ms, "
+                      f"{sweep['writes_per_route']:5.2f} writes/route, {sweep['flushes']} commits")
+            print(f"{'':>6}        {mode:<6} peak RSS {result['peak_rss_mb']:.1f}MB, "
+                  f"{server['requests']} requests, {server['errors']} errors, {server['throttled']} throttled")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+import logging
+from datetime import date
+from functools import lru_cache
+
+
+@lru_cache(maxsize=4096)
+def trip_pattern(dep_date, arr_date):
+    """出行模式键：出发星期(ISO)+住几晚，例如周四出发周日返回为 '4+3'
+
+    Args:
+        dep_date: 出发日期，格式为YYYY-MM-DD
+        arr_date: 返回日期，格式为YYYY-MM-DD
+    """
+    dep = date.fromisoformat(dep_date)
+    return f"{dep.isoweekday()}+{(date.fromisoformat(arr_date) - dep).days}"
+
+
+# 与trip_pattern相同的键，在SQL中计算
+_TRIP_PATTERN_SQL = "CONCAT(WEEKDAY(c.dep_date) + 1, '+', DATEDIFF(c.arr_date, c.dep_date))"
+
+
+class BestDeals:
+    def __init__(self, pool):
+        """t_flight_best_deal：每个出发地、目的地、出行模式当前最便宜的未出发航班
+
+        由PriceWriter在写入t_flight_price_current的同一个事务里增量维护：
+        每次flush只重新计算有价格变化的航线，数据来自PriceIndex中该航线的全部日期，
+        航线不在索引中时才回到数据库按航线重新计算。表中有已出发的航班时(跨天后)整表重建一次。
+        最优价格查询和API只读这张小表，不再扫描t_flight_price_current。
+
+        Args:
+            pool: db_pool.ConnectionPool
+        """
+        self.pool = pool
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._built_on = None
+
+    @staticmethod
+    def create_tables(cursor):
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS t_flight_best_deal (
+                place_from VARCHAR(3) NOT NULL,
+                place_to VARCHAR(3) NOT NULL,
+                trip_pattern VARCHAR(8) NOT NULL,
+                is_roundtrip TINYINT(1) NOT NULL,
+                dep_date DATE NOT NULL,
+                arr_date DATE NOT NULL,
+                price DECIMAL(10,2) NOT NULL,
+                last_checked TIMESTAMP NOT NULL,
+                currency VARCHAR(3) DEFAULT 'CNY',
+                PRIMARY KEY (place_from, place_to, trip_pattern, is_roundtrip),
+                KEY from_price_idx (place_from, price),
+                KEY price_idx (price)
+            )
+        """)
+
+    def rebuild(self, cursor):
+        """从t_flight_price_current重建整表，建表后和跨天时调用"""
+        cursor.execute("DELETE FROM t_flight_best_deal")
+        # 同价的多个日期用INSERT IGNORE保留出发日期最早的一个
+        cursor.execute(f"""
+            INSERT IGNORE INTO t_flight_best_deal
+            (place_from, place_to, trip_pattern, is_roundtrip, dep_date, arr_date, price, last_checked, currency)
+            SELECT c.place_from, c.place_to, {_TRIP_PATTERN_SQL}, c.is_roundtrip,
+                   c.dep_date, c.arr_date, c.price, c.last_checked, c.currency
+            FROM t_flight_price_current c
+            JOIN (
+                SELECT place_from, place_to, is_roundtrip,
+                       CONCAT(WEEKDAY(dep_date) + 1, '+', DATEDIFF(arr_date, dep_date)) AS trip_pattern,
+                       MIN(price) AS price
+                FROM t_flight_price_current
+                WHERE dep_date >= CURDATE()
+                GROUP BY place_from, place_to, is_roundtrip, trip_pattern
+            ) b ON c.place_from = b.place_from AND c.place_to = b.place_to AND c.is_roundtrip = b.is_roundtrip
+               AND {_TRIP_PATTERN_SQL} = b.trip_pattern AND c.price = b.price
+            WHERE c.dep_date >= CURDATE()
+            ORDER BY c.dep_date
+        """)
+        self._built_on = date.today()
+        self.logger.info(f"Rebuilt t_flight_best_deal with {cursor.rowcount} deals")
+
+    def _expired(self, cursor):
+        """今天第一次写入时检查表里是否有已出发的航班"""
+        if self._built_on == date.today():
+            return False
+        cursor.execute("SELECT COUNT(*) FROM t_flight_best_deal WHERE dep_date < CURDATE()")
+        if cursor.fetchone()[0] == 0:
+            self._built_on = date.today()
+            return False
+        return True
+
+    def _recompute_route(self, cursor, place_from, place_to, is_roundtrip):
+        cursor.execute("DELETE FROM t_flight_best_deal WHERE place_from = %s AND place_to = %s AND is_roundtrip = %s",
+                       (place_from, place_to, is_roundtrip))
+        cursor.execute(f"""
+            INSERT IGNORE INTO t_flight_best_deal
+            (place_from, place_to, trip_pattern, is_roundtrip, dep_date, arr_date, price, last_checked, currency)
+            SELECT c.place_from, c.place_to, {_TRIP_PATTERN_SQL}, c.is_roundtrip,
+                   c.dep_date, c.arr_date, c.price, c.last_checked, c.currency
+            FROM t_flight_price_current c
+            WHERE c.place_from = %s AND c.place_to = %s AND c.is_roundtrip = %s AND c.dep_date >= CURDATE()
+            ORDER BY c.price, c.dep_date
+        """, (place_from, place_to, is_roundtrip))
+
+    def update_routes(self, cursor, routes, index, checked_at):
+        """重新计算有价格变化的航线的最优价格，在调用方的事务中执行
+
+        航线已经没有价格的出行模式从表中删除，和_recompute_route的结果一致。
+
+        Args:
+            cursor: 写入t_flight_price_current所用事务的游标
+            routes: 有变化的航线，{(place_from, place_to, is_roundtrip): currency}
+            index: PriceIndex，航线在索引中时直接用内存中的价格计算
+            checked_at: 写入的last_checked
+        """
+        if self._expired(cursor):
+            # 跨天后已出发的航班不再算作最优价格
+            self.rebuild(cursor)
+            return
+
+        today = date.today().isoformat()
+        rows = []
+        for (place_from, place_to, is_roundtrip), currency in routes.items():
+            prices = index.route_prices(place_from, place_to, is_roundtrip)
+            if prices is None:
+                self._recompute_route(cursor, place_from, place_to, is_roundtrip)
+                continue
+            best = {}
+            for (dep_date, arr_date), price in prices.items():
+                if dep_date < today:
+                    continue
+                pattern = trip_pattern(dep_date, arr_date)
+                current = best.get(pattern)
+                if current is None or (price, dep_date) < (current[2], current[0]):
+                    best[pattern] = (dep_date, arr_date, price)
+
+            query = "DELETE FROM t_flight_best_deal WHERE place_from = %s AND place_to = %s AND is_roundtrip = %s"
+            params = [place_from, place_to, is_roundtrip]
+            if best:
+                query += f" AND trip_pattern NOT IN ({', '.join(['%s'] * len(best))})"
+                params.extend(best)
+            cursor.execute(query, params)
+            for pattern, (dep_date, arr_date, price) in best.items():
+                rows.append((place_from, place_to, pattern, is_roundtrip, dep_date, arr_date, price,
+                             checked_at, currency))
+
+        if rows:
+            cursor.executemany("""
+                INSERT INTO t_flight_best_deal
+                (place_from, place_to, trip_pattern, is_roundtrip, dep_date, arr_date, price, last_checked, currency)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE dep_date = VALUES(dep_date), arr_date = VALUES(arr_date),
+                                        price = VALUES(price), last_checked = VALUES(last_checked),
+                                        currency = VALUES(currency)
+            """, rows)
+
+    def touch_routes(self, cursor, routes, checked_at):
+        """价格未变的航线只刷新last_checked"""
+        routes = list(routes)
+        for i in range(0, len(routes), 500):
+            chunk = routes[i:i + 500]
+            placeholders = ', '.join(['(%s, %s, %s)'] * len(chunk))
+            params = [checked_at]
+            for route in chunk:
+                params.extend(route)
+            cursor.execute(f"""
+                UPDATE t_flight_best_deal SET last_checked = %s
+                WHERE (place_from, place_to, is_roundtrip) IN ({placeholders})
+            """, params)
+
+    def query(self, place_from=None, max_price=None, limit=5):
+        """按价格从低到高返回最优价格
+
+        Args:
+            place_from: 可选，出发地代码或代码列表
+            max_price: 可选，最高价格
+            limit: 返回结果数量
+
+        Returns:
+            list: 字典列表，字段与t_flight_price_current相同
+        """
+        if isinstance(place_from, str):
+            place_from = [place_from]
+
+        query = """
+            SELECT place_from, place_to, dep_date, arr_date, price, last_checked, is_roundtrip, trip_pattern
+            FROM t_flight_best_deal
+            WHERE dep_date >= CURDATE()
+        """
+        params = []
+        if place_from:
+            query += f" AND place_from IN ({', '.join(['%s'] * len(place_from))})"
+            params.extend(place_from)
+        if max_price:
+            query += " AND price <= %s"
+            params.append(max_price)
+        query += " ORDER BY price ASC LIMIT %s"
+        params.append(limit)
+
+        with self.pool.connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(query, params)
+            results = cursor.fetchall()
+            cursor.close()
+        return results
@@ -1,23 +1,31 @@
 import json
 import os
-import mysql.connector
 import logging
-from credentials import get_database_config
+from storage import create_storage
 
 class ConfigManager:
-    def __init__(self, config_path, db_config=None):
+    def __init__(self, config_path, db_config=None, iata_snapshot_path=None, storage=None):
         """Initialize the ConfigManager
         
         Args:
             config_path: Path to the configuration JSON file
             db_config: MySQL database configuration dictionary (host, user, password, database)
                       If None, default values will be used
+            iata_snapshot_path: Local snapshot of t_iata_code
+                      (default: data/iata_snapshot.json next to the config file)
+            storage: storage.PriceStorage used for IATA lookups
+                      (default: the backend selected by storageBackend in the config file)
         """
         self.config_path = config_path
-        self.db_config = db_config or get_database_config()
+        self.db_config = db_config
+        self.iata_snapshot_path = iata_snapshot_path or os.path.join(
+            os.path.dirname(os.path.realpath(config_path)), 'data', 'iata_snapshot.json')
+        self.iata_version = None
         self.city2code = {}
         self.code2city = {}
         self.config = self._load_config()
+        self.storage = storage or create_storage(self.config, db_config,
+                                                 base_dir=os.path.dirname(os.path.realpath(config_path)))
         self._load_iata_codes()
     
     def _load_config(self):
@@ -31,34 +39,73 @@ class ConfigManager:
             return {}
     
     def _load_iata_codes(self):
-        """Load IATA codes from MySQL database"""
+        """Load IATA codes from the local snapshot, or from storage if there is none
+        
+        With a snapshot no database access is needed at startup; refresh_iata_codes
+        reloads the maps when t_iata_code has changed.
+        """
+        if self._load_iata_snapshot():
+            return
+        self.refresh_iata_codes(force=True)
+    
+    def _apply_iata_codes(self, code2city, domestic_codes):
+        self.code2city = dict(code2city)
+        self.city2code = {iata_name: iata_code for iata_code, iata_name in code2city.items()}
+        
+        # Update placeTo in config if it exists
+        if 'placeTo' in self.config:
+            self.config['placeTo'] = list(domestic_codes)
+    
+    def _load_iata_snapshot(self):
         try:
-            # Connect to MySQL database
-            conn = mysql.connector.connect(**self.db_config)
-            cursor = conn.cursor()
-            
-            # Query all IATA codes (you can filter by domestic=1 if needed)
-            cursor.execute("SELECT iata_code, iata_name FROM t_iata_code")
-            
-            # Process the results
-            for iata_code, iata_name in cursor:
-                self.code2city[iata_code] = iata_name
-                self.city2code[iata_name] = iata_code
-            
-            # Update placeTo in config if it exists
-            if 'placeTo' in self.config:
-                # Get all domestic airport codes
-                cursor.execute("SELECT iata_code FROM t_iata_code WHERE domestic = 1")
-                domestic_codes = [row[0] for row in cursor.fetchall()]
-                self.config['placeTo'] = domestic_codes
+            with open(self.iata_snapshot_path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+            self._apply_iata_codes(snapshot['code2city'], snapshot['domestic'])
+            self.iata_version = snapshot['version']
+            logging.info(f"Loaded {len(self.code2city)} IATA codes from snapshot (version {self.iata_version})")
+            return True
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logging.error(f"Failed to load IATA snapshot: {e}")
+            return False
+    
+    def _save_iata_snapshot(self, code2city, domestic_codes):
+        tmp_path = f"{self.iata_snapshot_path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.iata_snapshot_path), exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': self.iata_version, 'code2city': code2city, 'domestic': domestic_codes},
+                          f, ensure_ascii=False)
+            os.replace(tmp_path, self.iata_snapshot_path)
+        except OSError as e:
+            logging.error(f"Failed to save IATA snapshot: {e}")
+    
+    def refresh_iata_codes(self, force=False):
+        """Reload IATA codes from storage if t_iata_code changed since the snapshot
+        
+        Args:
+            force: Reload even if the table version is unchanged
             
-            cursor.close()
-            conn.close()
+        Returns:
+            bool: True if the maps were reloaded
+        """
+        try:
+            # 表没有变化时不用重新读取
+            version = self.storage.iata_version()
+            if not force and version == self.iata_version:
+                return False
+            code2city, domestic_codes = self.storage.load_iata_codes()
             
-            logging.info(f"Loaded {len(self.code2city)} IATA codes from database")
+            self.iata_version = version
+            self._apply_iata_codes(code2city, domestic_codes)
+            self._save_iata_snapshot(code2city, domestic_codes)
+            logging.info(f"Loaded {len(self.code2city)} IATA codes from database (version {version})")
+            return True
             
         except Exception as e:
             logging.error(f"Failed to load IATA codes from database: {e}")
+            return False
     
     def get_city_code(self, city):
         """Get IATA code for a city name"""
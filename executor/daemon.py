@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import signal
+import logging
+import threading
+from datetime import datetime, timedelta
+from metrics import REGISTRY, MetricsServer
+
+
+class FlightAlertDaemon:
+    def __init__(self, flight_alert, status_path=None, interval=None, metrics_port=None, metrics_host='127.0.0.1',
+                 profiler=None):
+        """常驻进程模式，按sleepTime定时执行扫描
+
+        FlightAlert实例(配置、IATA代码、连接池和价格索引)在多次扫描之间一直保留，
+        不再每次由cron重新启动进程。
+
+        Args:
+            flight_alert: FlightAlert实例
+            status_path: 可选，状态JSON文件路径，每次状态变化时写入
+            interval: 可选，两次扫描之间的间隔(秒)，默认读取配置sleepTime
+            metrics_port: 可选，指标HTTP接口的端口，提供/metrics和/metrics.json，不设置时不启动
+            metrics_host: 指标HTTP接口监听的地址，默认只监听本机
+            profiler: 可选，profiling.SweepProfiler，每次扫描结束时写出这次扫描的记录
+        """
+        self.flight_alert = flight_alert
+        self.status_path = status_path
+        self.interval = interval or flight_alert.config_manager.get_config('sleepTime') or 600
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.metrics_port = metrics_port
+        self.metrics_host = metrics_host
+        self.metrics_server = None
+        self.profiler = profiler
+        self._stop_event = threading.Event()
+        self._status_lock = threading.RLock()
+        self._status = {
+            'pid': os.getpid(),
+            'state': 'starting',
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'interval': self.interval,
+            'sweeps': 0,
+            'failed_sweeps': 0,
+            'last_sweep_started': None,
+            'last_sweep_finished': None,
+            'last_sweep_duration': None,
+            'next_sweep_at': None,
+            'last_error': None,
+        }
+
+    def status(self):
+        """返回当前状态的副本，包括通知队列和各机票接口的状态"""
+        with self._status_lock:
+            status = dict(self._status)
+        status['notifications'] = self.flight_alert.notification_manager.stats()
+        status['endpoints'] = {name: guard.stats() for name, guard in self.flight_alert.fetch_guards.items()}
+        return status
+
+    def _update_status(self, **changes):
+        with self._status_lock:
+            self._status.update(changes)
+            snapshot = dict(self._status)
+
+        if not self.status_path:
+            return
+        # 先写临时文件再替换，避免读到写了一半的状态
+        tmp_path = f"{self.status_path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(snapshot, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.status_path)
+        except OSError as e:
+            self.logger.error(f"Failed to write daemon status: {e}")
+
+    def stop(self, signum=None, frame=None):
+        """请求停止，正在处理的航线完成后结束扫描并退出"""
+        if signum is not None:
+            self.logger.info(f"Received signal {signum}, stopping")
+        self._stop_event.set()
+        self.flight_alert.stop_event.set()
+        self._update_status(state='stopping')
+
+    def install_signal_handlers(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+    def run_sweep(self):
+        """执行一次扫描"""
+        started = time.monotonic()
+        self._update_status(state='sweeping', last_sweep_started=datetime.now().isoformat(timespec='seconds'))
+        try:
+            self.flight_alert.check_all_destinations()
+        except Exception as e:
+            self.logger.exception(f"Sweep failed: {e}")
+            with self._status_lock:
+                self._status['failed_sweeps'] += 1
+            self._update_status(last_error=str(e))
+        finally:
+            duration = time.monotonic() - started
+            with self._status_lock:
+                self._status['sweeps'] += 1
+            self._update_status(last_sweep_finished=datetime.now().isoformat(timespec='seconds'),
+                                last_sweep_duration=round(duration, 3))
+            self.logger.info(f"Sweep finished in {duration:.1f}s")
+            if self.profiler:
+                try:
+                    self.profiler.flush()
+                except OSError as e:
+                    self.logger.error(f"Failed to write sweep profile: {e}")
+
+    def run(self):
+        """主循环：扫描，然后等待到下一个周期，直到收到停止信号"""
+        self.logger.info(f"Daemon started, sweeping every {self.interval}s")
+        if self.metrics_port:
+            try:
+                self.metrics_server = MetricsServer(REGISTRY, self.metrics_host, self.metrics_port).start()
+            except OSError as e:
+                self.logger.error(f"Failed to start metrics server on port {self.metrics_port}: {e}")
+        try:
+            while not self._stop_event.is_set():
+                cycle_start = time.monotonic()
+                self.run_sweep()
+
+                # 扫描时间计入周期，保证按sleepTime的节奏执行
+                wait = max(0, self.interval - (time.monotonic() - cycle_start))
+                next_sweep = datetime.now() + timedelta(seconds=wait)
+                self._update_status(state='idle', next_sweep_at=next_sweep.isoformat(timespec='seconds'))
+                self._stop_event.wait(wait)
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        """写出缓冲的价格，停止后台任务并关闭数据库连接"""
+        try:
+            self.flight_alert.price_manager.save_prices()
+        except Exception as e:
+            self.logger.error(f"Error flushing prices on shutdown: {e}")
+        self.flight_alert.close()
+        if self.metrics_server:
+            self.metrics_server.stop()
+        self._update_status(state='stopped', next_sweep_at=None)
+        self.logger.info("Daemon stopped")
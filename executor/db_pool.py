@@ -0,0 +1,173 @@
+import os
+import queue
+import threading
+import time
+import logging
+from contextlib import contextmanager
+import mysql.connector
+
+logger = logging.getLogger(__name__)
+
+# 按数据库配置共享连接池，PriceManager和ConfigManager使用同一个
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    def __init__(self, db_config, size=5, checkout_timeout=30, connect_attempts=3, connect_delay=2):
+        """有上限的MySQL长连接池
+
+        Args:
+            db_config: MySQL数据库配置字典
+            size: 连接池最大连接数
+            checkout_timeout: 等待空闲连接的最长时间(秒)
+            connect_attempts: 新建连接失败时的最大尝试次数
+            connect_delay: 新建连接失败后的重试间隔(秒)
+        """
+        self.db_config = db_config
+        self.size = size
+        self.checkout_timeout = checkout_timeout
+        self.connect_attempts = connect_attempts
+        self.connect_delay = connect_delay
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'checkouts': 0,
+            'connects': 0,
+            'reconnects': 0,
+            'wait_total': 0.0,
+            'wait_max': 0.0,
+        }
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def _connect(self):
+        """新建连接，失败时重试"""
+        last_error = None
+        for attempt in range(1, self.connect_attempts + 1):
+            try:
+                conn = mysql.connector.connect(**self.db_config)
+                with self._stats_lock:
+                    self._stats['connects'] += 1
+                return conn
+            except mysql.connector.Error as err:
+                last_error = err
+                self.logger.warning(f"数据库连接失败(尝试 {attempt}/{self.connect_attempts}): {err}")
+                if attempt < self.connect_attempts:
+                    time.sleep(self.connect_delay)
+
+        self.logger.error(f"无法连接到数据库，已重试 {self.connect_attempts} 次: {last_error}")
+        raise last_error
+
+    def _is_healthy(self, conn):
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def _checkout(self):
+        start = time.monotonic()
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            raise TimeoutError(f"No database connection available after {self.checkout_timeout}s")
+        wait = time.monotonic() - start
+
+        with self._stats_lock:
+            self._stats['checkouts'] += 1
+            self._stats['wait_total'] += wait
+            self._stats['wait_max'] = max(self._stats['wait_max'], wait)
+        if wait > 1:
+            self.logger.warning(f"Waited {wait:.2f}s for a database connection")
+
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+
+            # 取出时做健康检查，断开的连接直接丢弃并重新连接
+            if self._is_healthy(conn):
+                return conn
+            with self._stats_lock:
+                self._stats['reconnects'] += 1
+            self._close_quietly(conn)
+            return self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _checkin(self, conn, broken=False):
+        try:
+            if broken:
+                self._close_quietly(conn)
+            else:
+                self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def connection(self):
+        """借出一个连接，使用完自动归还
+
+        归还前总会回滚：写入方已经自己提交，只读的使用者留下的事务也要结束，
+        否则InnoDB的REPEATABLE READ快照会一直保留，下一个借到这个连接的人读到的是旧数据。
+        出现异常时如果是数据库连接层面的错误则丢弃该连接。
+        """
+        conn = self._checkout()
+        broken = False
+        try:
+            yield conn
+        except Exception as e:
+            broken = isinstance(e, (mysql.connector.errors.InterfaceError,
+                                    mysql.connector.errors.OperationalError))
+            raise
+        finally:
+            if not broken:
+                try:
+                    conn.rollback()
+                except Exception:
+                    broken = True
+            self._checkin(conn, broken)
+
+    def stats(self):
+        """返回连接池统计信息，包括等待连接的总耗时和最大耗时"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['size'] = self.size
+        stats['idle'] = self._idle.qsize()
+        stats['wait_avg'] = stats['wait_total'] / stats['checkouts'] if stats['checkouts'] else 0.0
+        return stats
+
+    def close(self):
+        """关闭所有空闲连接"""
+        while True:
+            try:
+                self._close_quietly(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+
+def get_pool(db_config):
+    """获取与db_config对应的共享连接池
+
+    连接池大小和等待超时可以通过环境变量FLIGHT_DB_POOL_SIZE和FLIGHT_DB_POOL_TIMEOUT配置。
+    """
+    key = tuple(sorted((k, str(v)) for k, v in db_config.items()))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(
+                db_config,
+                size=int(os.environ.get('FLIGHT_DB_POOL_SIZE', '5')),
+                checkout_timeout=float(os.environ.get('FLIGHT_DB_POOL_TIMEOUT', '30')),
+            )
+            _pools[key] = pool
+            logger.info(f"Created database connection pool (size={pool.size}) for {db_config.get('host')}")
+        return pool
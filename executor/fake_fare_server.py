@@ -0,0 +1,232 @@
+import json
+import time
+import random
+import zlib
+import argparse
+import threading
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+def load_price_log(path):
+    """从导出的price_log.json读取每条航线的最低价格，作为生成价格矩阵的基准
+
+    Returns:
+        dict: {(place_from, place_to): 最低价格}
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        rows = json.load(f)
+    base_prices = {}
+    for row in rows:
+        key = (row['place_from'], row['place_to'])
+        price = float(row['price'])
+        if key not in base_prices or price < base_prices[key]:
+            base_prices[key] = price
+    return base_prices
+
+
+class FakeFareServer:
+    def __init__(self, host='127.0.0.1', port=0, latency=0.05, jitter=0.02, error_rate=0.0, throttle_rate=0.0,
+                 change_rate=0.2, days=60, max_nights=7, base_prices=None, seed=0):
+        """本地的机票接口替身，用于离线测试和扫描性能测试
+
+        - 路径中包含lowestPrice时返回国内接口的roundTripPrice价格矩阵
+        - 路径中包含flightlist时返回国际接口的flightItems列表
+        每个请求先等待latency±jitter秒，再按error_rate返回HTTP 500，
+        按throttle_rate返回status为2的限流响应。
+
+        价格由航线和版本号确定：同一版本的响应完全相同，每次请求以change_rate的概率
+        让这条航线的版本加一，约十分之一的日期对价格随之变化，用来模拟接口数据的更新频率。
+        响应只由航线和版本号计算得出，航线数很多时也不占用内存。
+
+        Args:
+            host: 监听地址
+            port: 监听端口，0表示随机端口
+            latency: 平均响应延迟(秒)
+            jitter: 延迟的随机波动范围(秒)
+            error_rate: 返回HTTP 500的比例
+            throttle_rate: 返回status为2的比例
+            change_rate: 每次请求航线价格变化的概率
+            days: 价格矩阵覆盖今天之后的天数
+            max_nights: 价格矩阵中返回日期最多比出发日期晚的天数
+            base_prices: 可选，{(出发地, 目的地): 基准价格}，通常来自load_price_log；
+                         未包含的航线根据航线代码生成400-2000之间的基准价格
+            seed: 随机数种子
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.change_rate = change_rate
+        self.days = days
+        self.max_nights = max_nights
+        self.base_prices = base_prices or {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._versions = {}
+        self.stats = {'requests': 0, 'errors': 0, 'throttled': 0, 'not_found': 0}
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def base_url(self):
+        """可以直接写入配置baseUrl的国内接口地址"""
+        return f"{self.url}/itinerary/api/12808/lowestPrice?"
+
+    @property
+    def international_base_url(self):
+        """可以直接写入配置internationalBaseUrl的国际接口地址"""
+        return f"{self.url}/international/search/api/flightlist"
+
+    def routes(self):
+        """base_prices中的所有航线"""
+        return list(self.base_prices)
+
+    def _base_price(self, place_from, place_to):
+        price = self.base_prices.get((place_from, place_to))
+        if price is None:
+            price = 400 + zlib.crc32(f"{place_from}-{place_to}".encode()) % 1600
+        return price
+
+    def _next_version(self, route):
+        with self._lock:
+            version = self._versions.get(route, 0)
+            if route in self._versions and self._random.random() < self.change_rate:
+                version += 1
+            self._versions[route] = version
+            return version
+
+    def _prices(self, place_from, place_to):
+        """生成这条航线当前版本的 (出发日期, 返回日期, 价格) 列表，日期格式为YYYYMMDD"""
+        route = (place_from, place_to)
+        version = self._next_version(route)
+        base = self._base_price(place_from, place_to)
+        route_seed = zlib.crc32(f"{place_from}-{place_to}".encode())
+        today = date.today()
+        prices = []
+        for offset in range(self.days):
+            dep = today + timedelta(days=offset)
+            dep_text = dep.strftime('%Y%m%d')
+            for nights in range(1, self.max_nights + 1):
+                cell = route_seed * 1000003 + offset * 31 + nights
+                # 每个版本轮到约十分之一的日期对变价，不需要保存历史价格
+                cell_version = (version + cell % 10) // 10
+                factor = 0.6 + zlib.crc32(f"{cell}-{cell_version}".encode()) % 1200 / 1000
+                price = round(base * factor / 10) * 10
+                arr = dep + timedelta(days=nights)
+                prices.append((dep_text, arr.strftime('%Y%m%d'), price))
+        return prices
+
+    def domestic_payload(self, place_from, place_to):
+        matrix = {}
+        for dep, arr, price in self._prices(place_from, place_to):
+            matrix.setdefault(dep, {})[arr] = price
+        return {'status': 0, 'msg': 'success', 'data': {'roundTripPrice': matrix}}
+
+    def international_payload(self, place_from, place_to):
+        items = [{'depDate': dep, 'arrDate': arr, 'price': price, 'dcity': place_from, 'acity': place_to}
+                 for dep, arr, price in self._prices(place_from, place_to)]
+        return {'status': 0, 'msg': 'success', 'data': {'flightItems': items}}
+
+    def _respond(self, path, params):
+        """返回 (HTTP状态码, 响应内容)"""
+        if self.latency or self.jitter:
+            time.sleep(max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter)))
+        with self._lock:
+            self.stats['requests'] += 1
+            roll = self._random.random()
+        if roll < self.error_rate:
+            with self._lock:
+                self.stats['errors'] += 1
+            return 500, {'status': 1, 'msg': 'internal error'}
+        if roll < self.error_rate + self.throttle_rate:
+            with self._lock:
+                self.stats['throttled'] += 1
+            return 200, {'status': 2, 'msg': 'too many requests', 'data': None}
+
+        place_from = params.get('dcity', [''])[0]
+        place_to = params.get('acity', [''])[0]
+        if 'lowestPrice' in path:
+            return 200, self.domestic_payload(place_from, place_to)
+        if 'flightlist' in path:
+            return 200, self.international_payload(place_from, place_to)
+        with self._lock:
+            self.stats['not_found'] += 1
+        return 404, {'status': 1, 'msg': 'not found'}
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # 长连接上响应头和响应体分两次发送时，Nagle和延迟ACK会让每个请求多等约40ms：
+            # 缓冲写入使两者一起发出(handle_one_request结束时flush)，同时关闭Nagle
+            wbufsize = 64 * 1024
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                code, payload = server._respond(parsed.path, parse_qs(parsed.query))
+                body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        """在后台线程中开始服务"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='fake-fare-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread:
+            self._thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地机票接口替身，返回模拟的价格矩阵')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8808)
+    parser.add_argument('--latency', type=float, default=0.05, help='平均响应延迟(秒)')
+    parser.add_argument('--jitter', type=float, default=0.02, help='延迟的随机波动范围(秒)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回HTTP 500的比例')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='返回status为2的比例')
+    parser.add_argument('--change-rate', type=float, default=0.2, help='每次请求航线价格变化的概率')
+    parser.add_argument('--days', type=int, default=60, help='价格矩阵覆盖的天数')
+    parser.add_argument('--seed-from', help='用price_log.json中记录的价格作为各航线的基准价格')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    server = FakeFareServer(
+        args.host, args.port, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate, change_rate=args.change_rate, days=args.days,
+        base_prices=load_price_log(args.seed_from) if args.seed_from else None, seed=args.seed
+    )
+    print(f"Serving fake fares on {server.base_url} and {server.international_base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(f"{datetime.now().isoformat(timespec='seconds')} {server.stats}")
+
+
+if __name__ == "__main__":
+    main()
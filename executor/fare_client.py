@@ -0,0 +1,217 @@
+import time
+import socket
+import logging
+import threading
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+from metrics import FETCH_SECONDS, FETCH_ERRORS
+
+try:
+    import brotli  # noqa: F401  urllib3只有在安装了brotli时才能解码br
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    ACCEPT_ENCODING = 'gzip, deflate'
+
+DEFAULT_USER_AGENT = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
+
+# 记录当前线程这次请求中建立新连接花费的时间
+_timing = threading.local()
+
+
+class _CachedDnsMixin:
+    """新建连接时通过_dns_cache解析host，只作用于机票接口的连接，不影响进程里的其他socket"""
+
+    def _new_conn(self):
+        host = self._dns_host
+        try:
+            addresses = _get_dns_cache().resolve(host, self.port)
+        except socket.gaierror:
+            # 解析失败交给urllib3自己处理，抛出它的NameResolutionError
+            return super()._new_conn()
+
+        last_error = None
+        for address in addresses:
+            # 只替换用来建立TCP连接的地址，TLS的SNI和证书校验仍然使用self.host
+            self._dns_host = address
+            try:
+                return super()._new_conn()
+            except (NewConnectionError, ConnectTimeoutError) as e:
+                last_error = e
+            finally:
+                self._dns_host = host
+        # 缓存的地址都连不上，可能已经过期，下次重新解析
+        _get_dns_cache().invalidate(host, self.port)
+        raise last_error
+
+
+class _TimedHTTPConnection(_CachedDnsMixin, HTTPConnection):
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        _timing.connect = getattr(_timing, 'connect', 0.0) + time.perf_counter() - start
+
+
+class _TimedHTTPSConnection(_CachedDnsMixin, HTTPSConnection):
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        _timing.connect = getattr(_timing, 'connect', 0.0) + time.perf_counter() - start
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _TimedHTTPAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TimedHTTPConnectionPool,
+            'https': _TimedHTTPSConnectionPool,
+        }
+
+
+class _DnsCache:
+    """带TTL的DNS解析缓存，避免每次新建连接都做DNS查询"""
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, host, port):
+        """返回host解析出的IP地址列表，保持getaddrinfo返回的顺序
+
+        Raises:
+            socket.gaierror: 解析失败
+        """
+        key = (host, port)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry and now - entry[0] < self.ttl:
+                return entry[1]
+        addresses = []
+        for _, _, _, _, sockaddr in socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM):
+            if sockaddr[0] not in addresses:
+                addresses.append(sockaddr[0])
+        with self._lock:
+            self._cache[key] = (now, addresses)
+        return addresses
+
+    def invalidate(self, host, port):
+        with self._lock:
+            self._cache.pop((host, port), None)
+
+
+_dns_cache = None
+_dns_cache_lock = threading.Lock()
+
+
+def _get_dns_cache(ttl=300):
+    """返回机票接口连接共用的DNS缓存，第一次调用时创建"""
+    global _dns_cache
+    with _dns_cache_lock:
+        if _dns_cache is None:
+            _dns_cache = _DnsCache(ttl)
+        return _dns_cache
+
+
+class FareClient:
+    def __init__(self, connect_timeout=3, read_timeout=5, pool_maxsize=16, user_agent=None, dns_ttl=300):
+        """国内和国际机票接口共用的HTTP客户端
+
+        每个host一个长连接池，连接复用；请求gzip/brotli压缩；
+        机票接口的连接解析host时使用缓存的DNS结果(dns_ttl秒)，不影响数据库、推送等其他连接。
+        每次请求的耗时拆分为建立连接、首字节(TTFB)和下载三部分，按接口分别统计。
+
+        Args:
+            connect_timeout: 建立连接的超时时间(秒)
+            read_timeout: 读取响应的超时时间(秒)
+            pool_maxsize: 每个host最多保持的连接数，应不小于并发请求数
+            user_agent: 可选，请求使用的User-Agent
+            dns_ttl: DNS缓存时间(秒)
+        """
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.logger = logging.getLogger(self.__class__.__name__)
+        _get_dns_cache(dns_ttl)
+
+        self.session = requests.Session()
+        adapter = _TimedHTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            'User-Agent': user_agent or DEFAULT_USER_AGENT,
+            'Accept-Encoding': ACCEPT_ENCODING,
+            'Connection': 'keep-alive',
+        })
+
+        self._stats_lock = threading.Lock()
+        self._stats = {}
+
+    def _record(self, endpoint, ok, connect, ttfb, download):
+        with self._stats_lock:
+            stats = self._stats.setdefault(endpoint, {
+                'requests': 0, 'errors': 0, 'new_connections': 0,
+                'connect_time': 0.0, 'ttfb_time': 0.0, 'download_time': 0.0,
+            })
+            stats['requests'] += 1
+            if not ok:
+                stats['errors'] += 1
+            if connect > 0:
+                stats['new_connections'] += 1
+            stats['connect_time'] += connect
+            stats['ttfb_time'] += ttfb
+            stats['download_time'] += download
+        FETCH_SECONDS.observe(connect + ttfb + download, endpoint)
+        if not ok:
+            FETCH_ERRORS.inc(1, endpoint)
+
+    def get_json(self, url, params=None, read_timeout=None):
+        """发送GET请求并返回解析后的JSON
+
+        Raises:
+            requests.RequestException: 请求失败或HTTP状态码不是2xx
+        """
+        endpoint = urlparse(url).netloc + urlparse(url).path
+        _timing.connect = 0.0
+        start = time.perf_counter()
+        headers_at = download_done = None
+        try:
+            response = self.session.get(
+                url, params=params, stream=True,
+                timeout=(self.connect_timeout, read_timeout or self.read_timeout)
+            )
+            headers_at = time.perf_counter()
+            response.raise_for_status()
+            response.content  # 读完响应体
+            download_done = time.perf_counter()
+            return response.json()
+        finally:
+            end = download_done or time.perf_counter()
+            connect = _timing.connect
+            ttfb = (headers_at or end) - start - connect
+            download = end - headers_at if headers_at else 0.0
+            self._record(endpoint, download_done is not None, connect, max(0.0, ttfb), download)
+
+    def stats(self):
+        """按接口返回请求数、错误数、新建连接数和平均耗时(毫秒)"""
+        with self._stats_lock:
+            snapshot = {endpoint: dict(stats) for endpoint, stats in self._stats.items()}
+        for stats in snapshot.values():
+            count = stats['requests'] or 1
+            for phase in ('connect', 'ttfb', 'download'):
+                stats[f'{phase}_avg_ms'] = stats[f'{phase}_time'] / count * 1000
+        return snapshot
+
+    def close(self):
+        self.session.close()
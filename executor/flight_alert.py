@@ -10,11 +10,27 @@ import os
 import time
 import random
 import logging
-from datetime import datetime, timedelta
+import argparse
+import threading
 import requests
 from config_manager import ConfigManager
 from price_manager import PriceManager
 from notification_manager import NotificationManager
+from fare_client import FareClient
+from throttle_control import EndpointGuard, CircuitOpenError
+from scan_engine import AsyncScanEngine
+from daemon import FlightAlertDaemon
+from route_scheduler import RouteScheduler
+from response_cache import ResponseFingerprints
+from shard_lease import ShardCoordinator
+from sweep_checkpoint import SweepCheckpoint
+from price_extraction import TripCalendar, load_trip_patterns
+from price_export import PriceExporter
+from alert_rules import AlertRuleMatcher
+from price_stats import PriceStats
+import metrics
+import profiling
+from profiling import SweepProfiler
 from credentials import get_database_config
 from dotenv import load_dotenv
 
@@ -25,7 +41,25 @@ class FlightAlert:
         
         self.db_config = db_config or get_database_config()
         self.config_manager = ConfigManager(config_path, self.db_config)
-        self.price_manager = PriceManager(self.db_config)
+        self.data_dir = os.path.join(os.path.dirname(os.path.realpath(config_path)), 'data')
+        # 用户订阅规则，接口返回的每个价格按航线和日期只检查候选规则
+        self.alert_rules = AlertRuleMatcher(
+            self.config_manager.storage,
+            refresh_interval=self.config_manager.get_config('alertRulesRefreshInterval') or 300,
+            state_path=os.path.join(self.data_dir, 'alert_notified.json')
+        )
+        # 每条航线和日期对的滚动价格统计，alertMode为anomaly时只通知明显低于航线中位数的新低价
+        self.alert_mode = self.config_manager.get_config('alertMode') or 'threshold'
+        self.price_stats = PriceStats(
+            os.path.join(self.data_dir, 'price_stats.json'),
+            alpha=self.config_manager.get_config('priceStatsAlpha') or 0.2,
+            half_life=(self.config_manager.get_config('priceStatsHalfLife') or 30) * 86400,
+            drop_ratio=self.config_manager.get_config('anomalyDropRatio') or 0.2,
+            min_samples=self.config_manager.get_config('anomalyMinSamples') or 20
+        )
+        # 存储后端由配置storageBackend选择(mysql或sqlite)，ConfigManager和PriceManager共用
+        self.price_manager = PriceManager(storage=self.config_manager.storage, alert_rules=self.alert_rules,
+                                          price_stats=self.price_stats)
         
         # 从.env文件中获取PUSH_TOKEN而不是从配置文件获取SCKEY
         push_token = os.environ.get('PUSH_TOKEN')
@@ -35,9 +69,96 @@ class FlightAlert:
             
         self.notification_manager = NotificationManager(
             push_token,
-            {'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'}
+            {'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'},
+            min_interval=self.config_manager.get_config('notifyMinInterval') or 3.0,
+            coalesce_window=self.config_manager.get_config('notifyCoalesceWindow') or 5.0
         )
         self.logger = logging.getLogger(self.__class__.__name__)
+        
+        # 国内和国际机票接口共用的长连接HTTP客户端
+        self.fare_client = FareClient(
+            connect_timeout=self.config_manager.get_config('httpConnectTimeout') or 3,
+            read_timeout=self.config_manager.get_config('httpReadTimeout') or 3,
+            pool_maxsize=self.config_manager.get_config('scanConcurrency') or 8
+        )
+        # 按接口根据限流信号自适应调整并发，连续失败时熔断
+        max_concurrency = self.config_manager.get_config('scanConcurrency') or 8
+        guard_options = dict(
+            max_limit=max_concurrency,
+            initial_limit=self.config_manager.get_config('fetchInitialConcurrency') or 2,
+            failure_threshold=self.config_manager.get_config('circuitFailureThreshold') or 5,
+            reset_timeout=self.config_manager.get_config('circuitResetTimeout') or 60
+        )
+        self.fetch_guards = {
+            # 国内接口返回status == 2表示被限流
+            'domestic': EndpointGuard('domestic', is_throttled=lambda info: info.get('status') == 2, **guard_options),
+            'international': EndpointGuard('international', **guard_options),
+        }
+        # 设置后扫描会在当前航线处理完后提前结束
+        self.stop_event = threading.Event()
+        
+        self.trip_patterns = load_trip_patterns(self.config_manager.get_config('tripPatterns'))
+        # 参与响应指纹计算，修改tripPatterns后重启时价格矩阵未变的航线也会按新的出行模式重新解析
+        self._trip_patterns_key = [[pattern.name, sorted(pattern.dep_weekdays), pattern.nights, pattern.max_horizon]
+                                   for pattern in self.trip_patterns]
+        self._trip_calendar = None
+        
+        # 价格矩阵和上次完全相同时跳过处理
+        self.response_fingerprints = ResponseFingerprints(
+            os.path.join(self.data_dir, 'response_fingerprints.json'),
+            ttl=self.config_manager.get_config('responseCacheTtl') or 21600
+        )
+        
+        # 扫描进度，中断后下次运行从断点继续；写进度前先把缓冲的价格写入数据库
+        self.sweep_checkpoint = SweepCheckpoint(
+            os.path.join(self.data_dir, 'sweep_checkpoint.json'),
+            on_save=self.price_manager.flush
+        )
+        
+        # 分片、自适应调度和增量导出需要MySQL，嵌入式存储后端不支持
+        mysql_features = [key for key in ('shardingEnabled', 'exportEnabled') if self.config_manager.get_config(key)]
+        if self.config_manager.get_config('scheduleMode') == 'adaptive':
+            mysql_features.append('scheduleMode')
+        if self.price_manager.pool is None and mysql_features:
+            self.logger.warning(f"{', '.join(mysql_features)} need the mysql storage backend, "
+                                f"disabled for {self.price_manager.storage.name}")
+        has_pool = self.price_manager.pool is not None
+        
+        self.shard_coordinator = None
+        if has_pool and self.config_manager.get_config('shardingEnabled'):
+            # 多个执行器通过数据库租约表划分航线
+            self.shard_coordinator = ShardCoordinator(
+                self.price_manager.pool,
+                shard_count=self.config_manager.get_config('shardCount') or 64,
+                lease_ttl=self.config_manager.get_config('shardLeaseTtl') or 120
+            )
+            try:
+                self.shard_coordinator.start()
+            except Exception as e:
+                self.logger.error(f"Failed to start shard coordinator: {e}")
+        
+        self.route_scheduler = None
+        if has_pool and self.config_manager.get_config('scheduleMode') == 'adaptive':
+            # 按价格波动、出发日期和目标价格安排航线的查询频率
+            self.route_scheduler = RouteScheduler(
+                self.price_manager.pool,
+                target_price=self.config_manager.get_config('targetPrice'),
+                budget_per_hour=self.config_manager.get_config('requestBudgetPerHour') or 3000,
+                sweep_interval=self.config_manager.get_config('sleepTime') or 600,
+                min_interval=self.config_manager.get_config('routeMinInterval') or 600,
+                max_interval=self.config_manager.get_config('routeMaxInterval') or 86400,
+                state_path=os.path.join(self.data_dir, 'route_schedule.json')
+            )
+        
+        self.price_exporter = None
+        if has_pool and self.config_manager.get_config('exportEnabled'):
+            # 每次扫描后导出价格增量，客户端按游标只下载变化的记录
+            self.price_exporter = PriceExporter(
+                self.price_manager.pool,
+                os.path.join(self.data_dir, 'export'),
+                max_deltas=self.config_manager.get_config('exportMaxDeltas') or 48,
+                compact_ratio=self.config_manager.get_config('exportCompactRatio') or 0.5
+            )
 
     def get_flight_response(self, place_from, place_to, flight_way='Roundtrip', is_direct=True, army=False):
         params = {
@@ -48,14 +169,13 @@ class FlightAlert:
             "army": 'true' if army else 'false',
         }
         try:
-            response = requests.get(
-                self.config_manager.get_config('baseUrl'), 
-                params=params, 
-                headers=self.notification_manager.headers,
-                timeout=3
-            )
-            response.raise_for_status()
-            return response.json()
+            with profiling.span('fetch', f"{place_from}-{place_to}"):
+                return self.fetch_guards['domestic'].call(
+                    self.fare_client.get_json, self.config_manager.get_config('baseUrl'), params=params
+                )
+        except CircuitOpenError as e:
+            self.logger.warning(f"Skipped {place_from}->{place_to}: {e}")
+            return None
         except requests.RequestException as e:
             self.logger.error(f"Failed to get flight info from {place_to} to {place_from} with error: {e}")
             return None
@@ -68,46 +188,77 @@ class FlightAlert:
             dep_date: 可选，出发日期，格式为YYYYMMDD
             arr_date: 可选，返回日期，格式为YYYYMMDD
             max_price: 可选，最高价格，如果不指定则使用配置文件中的targetPrice
+
+        Returns:
+            bool: 是否成功取得价格数据，见fetch_succeeded
         """
         flight_info = self.get_flight_response(place_from, place_to)
+        self._handle_flight_info(flight_info, place_from, place_to, dep_date, arr_date, max_price)
+        return self.fetch_succeeded(flight_info)
+
+    @staticmethod
+    def fetch_succeeded(flight_info):
+        """get_flight_response是否取得了价格数据
+
+        熔断、HTTP错误时返回None，被限流时status为2，这些航线在扫描进度中不算完成。
+        """
+        return bool(flight_info) and flight_info.get('status') != 2
+
+    def _handle_flight_info(self, flight_info, place_from, place_to, dep_date=None, arr_date=None, max_price=None):
+        """处理get_flight_response返回的结果，串行和异步扫描共用"""
         if not flight_info or flight_info['status'] == 2:
             return
         
         target_price = max_price if max_price is not None else self.config_manager.get_config('targetPrice')
+        results = flight_info['data'].get('roundTripPrice', {})
+        # 订阅规则匹配完整的价格矩阵，不受targetPrice和tripPatterns限制，也不因矩阵未变化而跳过
+        with profiling.span('rules', f"{place_from}-{place_to}"):
+            self.alert_rules.match_prices(place_from, place_to, (
+                (dep, arr, price) for dep, arr_prices in results.items() for arr, price in arr_prices.items()))
         
         if dep_date and arr_date:
             # 指定日期查询模式
-            results = flight_info['data'].get('roundTripPrice', {})
             price = results.get(dep_date, {}).get(arr_date, 0)
             
             if price and price < target_price:
-                self.price_manager.update_price(place_to, dep_date, arr_date, price)
+                self.price_manager.update_price(place_to, dep_date, arr_date, price, place_from=place_from)
         else:
-            # 自动查询模式
+            # 自动查询模式，价格矩阵与上一次相同则跳过解析和写库
+            cache_key = f"{place_from}-{place_to}-Roundtrip"
+            fingerprint = ResponseFingerprints.fingerprint(results, target_price, self._trip_patterns_key)
+            if self.response_fingerprints.is_unchanged(cache_key, fingerprint):
+                self.logger.debug(f"Price matrix unchanged for {place_from}->{place_to}, skipped")
+                return
+            
             self._process_flight_info(flight_info, place_from, place_to, target_price=target_price)
+            self.response_fingerprints.remember(cache_key, fingerprint)
         
 
-    def _process_flight_info(self, flight_info, place_from, place_to, days_diff=28, flight_way='Roundtrip', target_price=None):
-        results = flight_info['data'].get('roundTripPrice' if flight_way == 'Roundtrip' else 'oneWayPrice', {})
+    @property
+    def trip_calendar(self):
+        """按出行模式预先计算好的日期表，跨天后自动重建"""
+        if self._trip_calendar is None or not self._trip_calendar.is_current():
+            self._trip_calendar = TripCalendar(self.trip_patterns)
+        return self._trip_calendar
+
+    def _process_flight_info(self, flight_info, place_from, place_to, flight_way='Roundtrip', target_price=None):
+        if flight_way != 'Roundtrip':
+            return
+        results = flight_info['data'].get('roundTripPrice', {})
         
         if target_price is None:
             target_price = self.config_manager.get_config('targetPrice')
         
-        for dep_date, prices in results.items():
-            weekday = time.strptime(dep_date, '%Y%m%d').tm_wday + 1
-            if weekday not in (4, 5):  # 只查询周四和周五
-                continue
-                
-            days_diff = (datetime.strptime(dep_date, "%Y%m%d").date() - datetime.now().date()).days
-            if days_diff > days_diff:
-                continue
-                
-            arr_date = (datetime.strptime(dep_date, "%Y%m%d") + timedelta(days=3)).strftime("%Y%m%d")
-            
-            if flight_way == 'Roundtrip':
-                price = prices.get(arr_date, 0)
-                if price and price < target_price:
-                    self.price_manager.update_price(place_to, dep_date, arr_date, price, place_from=place_from)
+        # 按配置的出行模式(默认周四->周日、周五->周一)一次性取出所有符合条件的价格
+        route = f"{place_from}-{place_to}"
+        start = time.perf_counter()
+        with profiling.span('parse', route):
+            prices = list(self.trip_calendar.extract(results, target_price))
+        metrics.PARSE_SECONDS.observe(time.perf_counter() - start, 'domestic')
+        metrics.PRICES_EXTRACTED.inc(len(prices), 'domestic')
+        with profiling.span('persist', route):
+            for dep_date, arr_date, price in prices:
+                self.price_manager.update_price(place_to, dep_date, arr_date, price, place_from=place_from)
 
     def check_flight_price_with_dates(self, place_from, place_to, dep_date, arr_date):
         """检查指定出发地、目的地和往返日期的航班价格
@@ -121,15 +272,11 @@ class FlightAlert:
         if not flight_info or flight_info['status'] == 2:
             return
         
-        results = flight_info['data'].get('roundTripPrice', {})
-        price = results.get(dep_date, {}).get(arr_date, 0)
-        
-        if price and price < self.config_manager.get_config('targetPrice'):
-            self.price_manager.update_price(place_to, dep_date, arr_date, price)
-            self._send_price_alerts()
+        self._handle_flight_info(flight_info, place_from, place_to, dep_date, arr_date)
+        self._send_price_alerts()
 
-    def check_all_destinations(self):
-        """检查所有出发地到所有目的地的航班价格"""
+    def get_all_routes(self):
+        """返回所有(出发地, 目的地)组合，跳过出发地和目的地相同的航线"""
         place_from_list = self.config_manager.get_config('placeFrom')
         # 如果placeFrom还是字符串格式，转换为列表以兼容旧配置
         if isinstance(place_from_list, str):
@@ -140,98 +287,164 @@ class FlightAlert:
         if isinstance(destinations, str):
             destinations = [destinations]
         
-        for place_from in place_from_list:
-            for place_to in destinations:
-                if place_to == place_from:
-                    continue
-                    
+        return [(place_from, place_to)
+                for place_from in place_from_list
+                for place_to in destinations
+                if place_to != place_from]
+
+    def check_all_destinations(self):
+        """检查所有出发地到所有目的地的航班价格"""
+        sweep_start = time.monotonic()
+        # 启动时用的是本地IATA快照，每次扫描前检查t_iata_code是否有变化
+        self.config_manager.refresh_iata_codes()
+        self.price_manager.refresh_alert_rules()
+        routes = all_routes = self.get_all_routes()
+        if self.shard_coordinator:
+            try:
+                self.shard_coordinator.heartbeat()
+            except Exception as e:
+                self.logger.error(f"Shard heartbeat failed, using last known shards: {e}")
+            routes = self.shard_coordinator.filter_routes(routes)
+        if self.route_scheduler:
+            routes = self.route_scheduler.select(routes)
+        self.response_fingerprints.reset_stats()
+        checkpoint = self.sweep_checkpoint
+        # 以全部航线为键，分片和自适应调度每次选出的航线不同时也能恢复进度；
+        # 自适应调度已经按优先级排序，不再按起始偏移轮转
+        routes = checkpoint.begin(routes, route_set=all_routes, rotate=self.route_scheduler is None)
+        metrics.SWEEP_ROUTES.inc(len(routes))
+        
+        if self.config_manager.get_config('scanMode') == 'async':
+            # 异步并发扫描，用令牌桶限速代替固定sleep
+            AsyncScanEngine(self).run(routes, on_route_done=self._route_done,
+                                      on_route_failed=checkpoint.mark_failed)
+        else:
+            for place_from, place_to in routes:
+                if self.stop_event.is_set():
+                    self.logger.info("Stop requested, ending sweep early")
+                    break
                 print(f'Processing flights from {place_from} to {place_to}...')
-                self.check_flight_price(place_from, place_to)
-                time.sleep(random.randrange(1, 4) + random.random())
+                if self.check_flight_price(place_from, place_to):
+                    self._route_done(place_from, place_to)
+                else:
+                    checkpoint.mark_failed(place_from, place_to)
+                self._pause_between_routes()
+        
+        if self.stop_event.is_set():
+            # 被中断，保存进度，下次从断点继续
+            checkpoint.flush()
+        else:
+            # 请求失败的航线留到下次运行重试，全部成功时才记为完成
+            checkpoint.finish()
+        
+        fingerprints = self.response_fingerprints
+        summary = (f"Response cache: {fingerprints.hits} unchanged of "
+                   f"{fingerprints.hits + fingerprints.misses} responses skipped")
+        print(summary)
+        self.logger.info(summary)
+        fingerprints.save()
+        self.price_stats.save()
+        self.alert_rules.save()
+        if self.route_scheduler:
+            self.route_scheduler.save()
+        
+        for name, guard in self.fetch_guards.items():
+            self.logger.info(f"Fetch guard {name}: {guard.stats()}")
+        for endpoint, stats in self.fare_client.stats().items():
+            self.logger.info(f"HTTP {endpoint}: {stats['requests']} requests, {stats['errors']} errors, "
+                             f"{stats['new_connections']} new connections, connect {stats['connect_avg_ms']:.1f}ms, "
+                             f"ttfb {stats['ttfb_avg_ms']:.1f}ms, download {stats['download_avg_ms']:.1f}ms")
         
         # Save any pending updates to the database
         self._send_price_alerts()
         self.price_manager.save_prices()
+        self.export_prices()
+        # 价格历史的日汇总和归档，按historyMaintenanceInterval间隔执行
+        self.price_manager.maintain_history(self.stop_event)
+        metrics.SWEEP_SECONDS.observe(time.monotonic() - sweep_start)
 
-    def _send_price_alerts(self):
-        """Send notifications for price updates"""
-        if not self.price_manager.update_price_info:
+    def _route_done(self, place_from, place_to):
+        """航线请求成功并处理完：记入扫描进度，自适应调度从现在开始计算下次查询的时间"""
+        self.sweep_checkpoint.mark_done(place_from, place_to)
+        if self.route_scheduler:
+            self.route_scheduler.mark_polled(place_from, place_to)
+
+    def _pause_between_routes(self):
+        """串行扫描时每条航线之后的随机间隔
+
+        接口健康时并发上限升高，sleep相应缩短；被限流时恢复原来的间隔。
+        """
+        time.sleep((random.randrange(1, 4) + random.random()) * self.fetch_guards['domestic'].pacing_factor)
+
+    def export_prices(self):
+        """导出本次扫描后的价格增量，数据库不可用时跳过，下次扫描再导出"""
+        if not self.price_exporter or self.price_manager.is_degraded():
             return
+        try:
+            self.price_exporter.export()
+        except Exception as e:
+            self.logger.error(f"Failed to export prices: {e}")
+
+    def _format_price_alert(self, price_info, omitted=0):
+        """把 {(出发地, 目的地): {(出发日期, 返回日期): 价格}} 格式化为通知内容
+
+        消息按出发地和目的地分组，超过alertMaxLines条时截断。
+
+        Args:
+            price_info: 要通知的价格
+            omitted: 已经被截断、不在price_info中的价格数
+        """
+        max_lines = self.config_manager.get_config('alertMaxLines') or 200
+        lines = []
+        
+        for (place_from, place_to), prices in price_info.items():
+            if not prices:
+                continue
+            if len(lines) >= max_lines:
+                omitted += len(prices)
+                continue
             
-        message = ''
+            city_from = self.config_manager.get_city_name(place_from)
+            city_to = self.config_manager.get_city_name(place_to)
+            lines.append(f'{city_from}->{city_to}:')
+            for (dep_date, arr_date), price in prices.items():
+                if len(lines) >= max_lines:
+                    omitted += 1
+                    continue
+                dep_date_formatted = f"{dep_date[:4]}-{dep_date[4:6]}-{dep_date[6:]}"
+                arr_date_formatted = f"{arr_date[:4]}-{arr_date[4:6]}-{arr_date[6:]}"
+                lines.append(f'  departure: {dep_date_formatted}, return: {arr_date_formatted}, price: {price}')
         
-        # 获取最近的价格更新，从数据库中查询以获取完整的路线信息
+        if omitted:
+            lines.append(f'... and {omitted} more price updates')
+        
+        return '\n'.join(lines) + '\n' if lines else None
+
+    def _send_price_alerts(self):
+        """Send notifications for price updates
+        
+        update_price_info已经按(出发地, 目的地)分组并记录了出发地，不需要再查询数据库；
+        alertMode为anomaly时只发送PriceStats判断的异常低价，同一个低价不会在之后的扫描中重复通知；
+        用户订阅规则匹配到的价格按push token分别发送，每个价格只发送一次。
+        """
         try:
-            # 计算需要通知的更新数量
-            total_updates = sum(
-                len(arr_dates) for dates in self.price_manager.update_price_info.values()
-                for arr_dates in dates.values()
-            )
-            
-            if total_updates == 0:
-                return
-                
-            # 从数据库获取最新的价格更新信息
-            recent_updates = self.price_manager.get_latest_prices(limit=total_updates * 2)  # 多取一些以确保包含所有更新
-            
-            # 处理每个价格更新
-            for place_to, dates in self.price_manager.update_price_info.items():
-                for dep_date, arr_dates in dates.items():
-                    for arr_date, price in arr_dates.items():
-                        # 查找对应的数据库记录以获取出发地信息
-                        matching_record = None
-                        for record in recent_updates:
-                            if (record['place_to'] == place_to and 
-                                record['dep_date'].strftime('%Y%m%d') == dep_date and 
-                                record['arr_date'].strftime('%Y%m%d') == arr_date):
-                                matching_record = record
-                                break
-                        
-                        if matching_record:
-                            city_from = self.config_manager.get_city_name(matching_record['place_from'])
-                            city_to = self.config_manager.get_city_name(place_to)
-                            dep_date_formatted = f"{dep_date[:4]}-{dep_date[4:6]}-{dep_date[6:]}"
-                            arr_date_formatted = f"{arr_date[:4]}-{arr_date[4:6]}-{arr_date[6:]}"
-                            message += f'{city_from}->{city_to}, departure: {dep_date_formatted}, return: {arr_date_formatted}, price: {price}\n'
-                        else:
-                            # 如果找不到匹配记录，使用默认的第一个出发地
-                            place_from_list = self.config_manager.get_config('placeFrom')
-                            if isinstance(place_from_list, str):
-                                default_place_from = place_from_list
-                            else:
-                                default_place_from = place_from_list[0] if place_from_list else 'SZX'
-                            
-                            city_from = self.config_manager.get_city_name(default_place_from)
-                            city_to = self.config_manager.get_city_name(place_to)
-                            dep_date_formatted = f"{dep_date[:4]}-{dep_date[4:6]}-{dep_date[6:]}"
-                            arr_date_formatted = f"{arr_date[:4]}-{arr_date[4:6]}-{arr_date[6:]}"
-                            message += f'{city_from}->{city_to}, departure: {dep_date_formatted}, return: {arr_date_formatted}, price: {price}\n'
+            if self.alert_mode == 'anomaly':
+                price_info = self.price_stats.pop_anomalies()
+            else:
+                price_info = self.price_manager.update_price_info
+            if price_info:
+                message = self._format_price_alert(price_info)
+                if message:
+                    self.notification_manager.send_notification(message)
             
-            if message:
-                self.notification_manager.send_notification(message)
+            max_lines = self.config_manager.get_config('alertMaxLines') or 200
+            for token, (price_info, omitted) in self.alert_rules.pop_matches(limit=max_lines).items():
+                message = self._format_price_alert(price_info, omitted)
+                if message:
+                    self.notification_manager.send_notification(message, token=token)
                 
         except Exception as e:
             self.logger.error(f"Error sending price alerts: {e}")
-            # 降级处理：如果数据库查询失败，使用配置中的第一个出发地
-            place_from_list = self.config_manager.get_config('placeFrom')
-            if isinstance(place_from_list, str):
-                default_place_from = place_from_list
-            else:
-                default_place_from = place_from_list[0] if place_from_list else 'SZX'
-                
-            city_from = self.config_manager.get_city_name(default_place_from)
-            message = ''
-            
-            for place_to, dates in self.price_manager.update_price_info.items():
-                city_to = self.config_manager.get_city_name(place_to)
-                for dep_date, arr_dates in dates.items():
-                    for arr_date, price in arr_dates.items():
-                        dep_date_formatted = f"{dep_date[:4]}-{dep_date[4:6]}-{dep_date[6:]}"
-                        arr_date_formatted = f"{arr_date[:4]}-{arr_date[4:6]}-{arr_date[6:]}"
-                        message += f'{city_from}->{city_to}, departure: {dep_date_formatted}, return: {arr_date_formatted}, price: {price}\n'
-            
-            if message:
-                self.notification_manager.send_notification(message)
 
     def get_international_flight_response(self, place_from, place_to, flight_way='Roundtrip', is_direct=True):
         """获取国际航班信息
@@ -250,14 +463,16 @@ class FlightAlert:
             "searchIndex": 1,
         }
         try:
-            response = requests.get(
-                self.config_manager.get_config('internationalBaseUrl'), 
-                params=params, 
-                headers=self.notification_manager.headers,
-                timeout=5  # 国际航班查询可能需要更长的超时时间
-            )
-            response.raise_for_status()
-            return response.json()
+            with profiling.span('fetch', f"{place_from}-{place_to}"):
+                return self.fetch_guards['international'].call(
+                    self.fare_client.get_json,
+                    self.config_manager.get_config('internationalBaseUrl'),
+                    params=params,
+                    read_timeout=self.config_manager.get_config('internationalReadTimeout') or 5  # 国际航班查询可能需要更长的超时时间
+                )
+        except CircuitOpenError as e:
+            self.logger.warning(f"Skipped international {place_from}->{place_to}: {e}")
+            return None
         except requests.RequestException as e:
             self.logger.error(f"Failed to get international flight info from {place_to} to {place_from} with error: {e}")
             return None
@@ -276,6 +491,10 @@ class FlightAlert:
             return
         
         target_price = max_price if max_price is not None else self.config_manager.get_config('internationalTargetPrice')
+        with profiling.span('rules', f"{place_from}-{place_to}"):
+            self.alert_rules.match_prices(place_from, place_to, (
+                (item['depDate'], item['arrDate'], item.get('price'))
+                for item in flight_info['data'].get('flightItems', [])))
         
         if dep_date and arr_date:
             # 指定日期查询模式
@@ -284,7 +503,7 @@ class FlightAlert:
                 if item['depDate'] == dep_date and item['arrDate'] == arr_date:
                     price = float(item.get('price', 0))
                     if price and price < target_price:
-                        self.price_manager.update_price(place_to, dep_date, arr_date, price)
+                        self.price_manager.update_price(place_to, dep_date, arr_date, price, place_from=place_from)
                 break
         else:
             # 自动查询模式
@@ -297,22 +516,32 @@ class FlightAlert:
         if target_price is None:
             target_price = self.config_manager.get_config('internationalTargetPrice')
         
+        calendar = self.trip_calendar
         results = flight_info['data'].get('flightItems', [])
-        for item in results:
-            dep_date = item['depDate']
-            arr_date = item['arrDate']
+        route = f"{place_from}-{place_to}"
+        start = time.perf_counter()
+        with profiling.span('parse', route):
+            prices = []
+            for item in results:
+                dep_date = item['depDate']
+                arr_date = item['arrDate']
             
-            weekday = time.strptime(dep_date, '%Y%m%d').tm_wday + 1
-            if weekday not in (4, 5):  # 只查询周四和周五
-                continue
+                # 日期表中没有的日期已经出发或超出查询范围
+                weekday = calendar.weekday.get(dep_date)
+                if weekday not in (4, 5):  # 只查询周四和周五
+                    continue
                 
-            days_diff = (datetime.strptime(dep_date, "%Y%m%d").date() - datetime.now().date()).days
-            if days_diff > 60:  # 国际航班可以查询更长时间范围
-                continue
+                if calendar.days_ahead[dep_date] > 60:  # 国际航班可以查询更长时间范围
+                    continue
             
-            price = float(item.get('price', 0))
-            if price and price < target_price:
-                self.price_manager.update_price(place_to, dep_date, arr_date, price)
+                price = float(item.get('price', 0))
+                if price and price < target_price:
+                    prices.append((dep_date, arr_date, price))
+        metrics.PARSE_SECONDS.observe(time.perf_counter() - start, 'international')
+        metrics.PRICES_EXTRACTED.inc(len(prices), 'international')
+        with profiling.span('persist', route):
+            for dep_date, arr_date, price in prices:
+                self.price_manager.update_price(place_to, dep_date, arr_date, price, place_from=place_from)
 
     def show_best_deals(self, place_from=None, max_price=None, limit=5):
         """显示最优惠的机票价格
@@ -337,15 +566,8 @@ class FlightAlert:
         if max_price is None:
             max_price = self.config_manager.get_config('targetPrice')
         
-        # 收集所有出发地的最优价格
-        all_deals = []
-        for pf in place_from_list:
-            deals = self.price_manager.get_best_deals(pf, max_price, limit)
-            all_deals.extend(deals)
-        
-        # 按价格排序并取前limit个
-        all_deals.sort(key=lambda x: x['price'])
-        best_deals = all_deals[:limit]
+        # 所有出发地一次查询，结果已按价格排序
+        best_deals = self.price_manager.get_best_deals(place_from_list, max_price, limit)
         
         print(f"\n当前最优惠的{limit}个航班价格:")
         print("-" * 80)
@@ -389,7 +611,25 @@ class FlightAlert:
         self._send_price_alerts()
         self.price_manager.save_prices()
 
+    def close(self):
+        """停止后台任务：发送完队列中的通知、关闭HTTP连接、释放分片租约并关闭价格日志"""
+        self.notification_manager.close()
+        self.fare_client.close()
+        if self.shard_coordinator:
+            self.shard_coordinator.stop()
+        self.price_manager.close()
+
 def main():
+    parser = argparse.ArgumentParser(description='Flight ticket price alert')
+    parser.add_argument('--daemon', action='store_true',
+                        help='常驻运行，按配置中的sleepTime定时扫描，收到SIGTERM后退出')
+    parser.add_argument('--profile', action='store_true',
+                        help='记录每条航线fetch/rules/parse/persist/alert各阶段的耗时并采样调用栈，'
+                             '结束时(--daemon模式下每次扫描结束时)写入data/profile')
+    parser.add_argument('--profile-interval', type=float, default=5,
+                        help='--profile模式下调用栈的采样间隔(毫秒)，0表示只记录阶段耗时')
+    args = parser.parse_args()
+    
     current_dir = os.path.dirname(os.path.realpath(__file__))
     config_path = os.path.join(current_dir, 'config.json')
     log_file_path = os.path.join(current_dir, 'log.txt')
@@ -399,7 +639,27 @@ def main():
 
     logging.basicConfig(filename=log_file_path, level=logging.INFO)
     
+    start = time.perf_counter()
     flight_alert = FlightAlert(config_path, db_config)
+    logging.info(f"Startup finished in {time.perf_counter() - start:.3f}s")
+    
+    profiler = None
+    if args.profile:
+        profiler = SweepProfiler(os.path.join(current_dir, 'data', 'profile'),
+                                 sample_interval=args.profile_interval / 1000).start()
+    
+    if args.daemon:
+        status_path = os.path.join(current_dir, 'data', 'daemon_status.json')
+        daemon = FlightAlertDaemon(flight_alert, status_path=status_path,
+                                   metrics_port=flight_alert.config_manager.get_config('metricsPort'),
+                                   profiler=profiler)
+        daemon.install_signal_handlers()
+        try:
+            daemon.run()
+        finally:
+            if profiler:
+                profiler.stop()
+        return
     
     # 检查所有目的地
     flight_alert.check_all_destinations()
@@ -407,6 +667,15 @@ def main():
     # 显示最优惠的航班价格
     flight_alert.show_best_deals()
     
+    # 等待后台队列中的通知发送完毕，释放分片租约
+    flight_alert.close()
+    
+    if profiler:
+        profiler.stop()
+    
+    # 单次运行没有指标接口，结束时把指标写入JSON文件
+    metrics.REGISTRY.dump_json(os.path.join(current_dir, 'data', 'metrics.json'))
+    
     # 检查特定目的地（还未测试）
     # from_city_code = "SZX"  # 深圳
     # to_city_code = "BJS"    # 北京
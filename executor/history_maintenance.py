@@ -0,0 +1,217 @@
+import time
+import logging
+from datetime import date
+
+
+class HistoryMaintenance:
+    # 同一时间只有一个执行器做维护
+    LOCK_NAME = 'flight_history_maintenance'
+
+    def __init__(self, pool, batch_size=2000, batch_pause=0.2, max_run_seconds=60, interval=3600):
+        """t_flight_price_history的日汇总和归档
+
+        - 日汇总：按(航线, 日期对, 变价日期)把价格变化汇总成最低价、最高价和收盘价，
+          写入t_flight_price_daily。按id顺序增量处理，进度保存在t_maintenance_state中，
+          只处理上一次运行时已经存在的id，避免漏掉当时还未提交的事务。
+        - 归档：出发日期在上个月及更早、且已经汇总过的记录按月移到t_flight_price_history_archive。
+
+        每批最多batch_size条记录、各自一个短事务，批之间暂停batch_pause秒，
+        单次运行最多max_run_seconds秒，剩下的下次继续，不会长时间锁表影响扫描写入。
+        上次运行的时间和汇总进度一起保存在t_maintenance_state中，
+        每次启动一个进程的cron模式下也按interval的间隔执行，而不是每次运行都维护。
+
+        Args:
+            pool: db_pool.ConnectionPool
+            batch_size: 每批处理的记录数
+            batch_pause: 批之间暂停的秒数
+            max_run_seconds: 单次运行的时间上限(秒)
+            interval: 两次运行的最小间隔(秒)，所有执行器共用
+        """
+        self.pool = pool
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.max_run_seconds = max_run_seconds
+        self.interval = interval
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._last_run = None
+        self.stats = {'runs': 0, 'rolled_up': 0, 'archived': 0}
+
+    @staticmethod
+    def create_tables(cursor):
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS t_flight_price_daily (
+                place_from VARCHAR(3) NOT NULL,
+                place_to VARCHAR(3) NOT NULL,
+                dep_date DATE NOT NULL,
+                arr_date DATE NOT NULL,
+                is_roundtrip TINYINT(1) NOT NULL,
+                day DATE NOT NULL,
+                min_price DECIMAL(10,2) NOT NULL,
+                max_price DECIMAL(10,2) NOT NULL,
+                close_price DECIMAL(10,2) NOT NULL,
+                changes INT NOT NULL,
+                PRIMARY KEY (place_from, place_to, dep_date, arr_date, is_roundtrip, day)
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS t_flight_price_history_archive (
+                id INT PRIMARY KEY,
+                place_from VARCHAR(3) NOT NULL,
+                place_to VARCHAR(3) NOT NULL,
+                dep_date DATE NOT NULL,
+                arr_date DATE NOT NULL,
+                old_price DECIMAL(10,2) NOT NULL,
+                new_price DECIMAL(10,2) NOT NULL,
+                changed_at TIMESTAMP NOT NULL,
+                is_roundtrip TINYINT(1) NOT NULL,
+                currency VARCHAR(3) DEFAULT 'CNY',
+                KEY route_date_changed_idx (place_from, place_to, dep_date, arr_date, is_roundtrip, changed_at)
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS t_maintenance_state (
+                name VARCHAR(64) PRIMARY KEY,
+                value BIGINT NOT NULL
+            )
+        """)
+
+    @staticmethod
+    def _get_state(cursor, name):
+        cursor.execute("SELECT value FROM t_maintenance_state WHERE name = %s", (name,))
+        row = cursor.fetchone()
+        return row[0] if row else 0
+
+    @staticmethod
+    def _set_state(cursor, name, value):
+        cursor.execute("""
+            INSERT INTO t_maintenance_state (name, value) VALUES (%s, %s)
+            ON DUPLICATE KEY UPDATE value = VALUES(value)
+        """, (name, value))
+
+    def _rollup_batch(self, cursor, watermark, horizon):
+        """汇总(watermark, min(watermark + batch_size, horizon)]之间的记录
+
+        同一天的记录可能跨批次，按id顺序处理，后一批的收盘价覆盖前一批。
+
+        Returns:
+            tuple: (新的watermark, 写入的汇总行数)
+        """
+        upper = min(watermark + self.batch_size, horizon)
+        cursor.execute("""
+            INSERT INTO t_flight_price_daily
+            (place_from, place_to, dep_date, arr_date, is_roundtrip, day, min_price, max_price, close_price, changes)
+            SELECT place_from, place_to, dep_date, arr_date, is_roundtrip, DATE(changed_at),
+                   MIN(LEAST(old_price, new_price)), MAX(GREATEST(old_price, new_price)),
+                   SUBSTRING_INDEX(GROUP_CONCAT(new_price ORDER BY id DESC), ',', 1), COUNT(*)
+            FROM t_flight_price_history
+            WHERE id > %s AND id <= %s
+            GROUP BY place_from, place_to, dep_date, arr_date, is_roundtrip, DATE(changed_at)
+            ON DUPLICATE KEY UPDATE min_price = LEAST(min_price, VALUES(min_price)),
+                                    max_price = GREATEST(max_price, VALUES(max_price)),
+                                    close_price = VALUES(close_price),
+                                    changes = changes + VALUES(changes)
+        """, (watermark, upper))
+        rolled_up = cursor.rowcount
+        self._set_state(cursor, 'history_rollup_watermark', upper)
+        return upper, rolled_up
+
+    def _archive_batch(self, cursor, cutoff, watermark):
+        """把出发日期早于cutoff且已汇总的一批记录移到归档表
+
+        Returns:
+            int: 移动的记录数
+        """
+        cursor.execute("""
+            SELECT id FROM t_flight_price_history
+            WHERE dep_date < %s AND id <= %s
+            ORDER BY dep_date LIMIT %s
+        """, (cutoff, watermark, self.batch_size))
+        ids = [row[0] for row in cursor.fetchall()]
+        if not ids:
+            return 0
+        placeholders = ', '.join(['%s'] * len(ids))
+        cursor.execute(f"""
+            INSERT IGNORE INTO t_flight_price_history_archive
+            (id, place_from, place_to, dep_date, arr_date, old_price, new_price, changed_at, is_roundtrip, currency)
+            SELECT id, place_from, place_to, dep_date, arr_date, old_price, new_price, changed_at, is_roundtrip, currency
+            FROM t_flight_price_history WHERE id IN ({placeholders})
+        """, ids)
+        cursor.execute(f"DELETE FROM t_flight_price_history WHERE id IN ({placeholders})", ids)
+        return len(ids)
+
+    def run(self, stop_event=None, min_interval=None):
+        """执行一轮日汇总和归档，其他执行器正在维护时直接返回
+
+        Args:
+            stop_event: 可选，设置后在当前批结束后停止
+            min_interval: 可选，距离任意执行器上次运行不到该秒数时不执行
+
+        Returns:
+            dict: 本轮汇总和归档的记录数，因为min_interval跳过时为None
+        """
+        start = time.monotonic()
+        result = {'rolled_up': 0, 'archived': 0}
+
+        def should_stop():
+            return (time.monotonic() - start >= self.max_run_seconds
+                    or (stop_event is not None and stop_event.is_set()))
+
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT GET_LOCK(%s, 0)", (self.LOCK_NAME,))
+            if cursor.fetchone()[0] != 1:
+                cursor.close()
+                self.logger.info("History maintenance is running on another executor, skipped")
+                return result
+            try:
+                # 上次运行时间用数据库时间记录，和各执行器的本机时钟无关
+                cursor.execute("SELECT UNIX_TIMESTAMP()")
+                now = cursor.fetchone()[0]
+                if min_interval is not None and now - self._get_state(cursor, 'history_maintenance_last_run') < min_interval:
+                    conn.rollback()
+                    return None
+                self._set_state(cursor, 'history_maintenance_last_run', now)
+                watermark = self._get_state(cursor, 'history_rollup_watermark')
+                horizon = self._get_state(cursor, 'history_rollup_horizon')
+                # 下次只处理到现在的最大id，这之前的事务到那时都已经提交
+                cursor.execute("SELECT COALESCE(MAX(id), 0) FROM t_flight_price_history")
+                self._set_state(cursor, 'history_rollup_horizon', cursor.fetchone()[0])
+                conn.commit()
+
+                while watermark < horizon and not should_stop():
+                    watermark, rolled_up = self._rollup_batch(cursor, watermark, horizon)
+                    conn.commit()
+                    result['rolled_up'] += rolled_up
+                    time.sleep(self.batch_pause)
+
+                # 按月归档：上个月及更早出发的航班
+                cutoff = date.today().replace(day=1)
+                while not should_stop():
+                    archived = self._archive_batch(cursor, cutoff, watermark)
+                    conn.commit()
+                    if not archived:
+                        break
+                    result['archived'] += archived
+                    time.sleep(self.batch_pause)
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (self.LOCK_NAME,))
+                cursor.fetchone()
+                cursor.close()
+
+        self.stats['runs'] += 1
+        self.stats['rolled_up'] += result['rolled_up']
+        self.stats['archived'] += result['archived']
+        self.logger.info(f"History maintenance: {result['rolled_up']} daily rollup rows, "
+                         f"{result['archived']} rows archived in {time.monotonic() - start:.1f}s")
+        return result
+
+    def run_if_due(self, stop_event=None):
+        """距离上次运行(t_maintenance_state中记录的任意执行器)超过interval秒时执行一轮维护"""
+        # 常驻进程内先用本地时间判断，避免每次扫描都访问数据库
+        if self._last_run is not None and time.monotonic() - self._last_run < self.interval:
+            return None
+        self._last_run = time.monotonic()
+        return self.run(stop_event, min_interval=self.interval)
@@ -0,0 +1,262 @@
+import os
+import json
+import bisect
+import logging
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# 延迟直方图的默认分桶上限(秒)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# 扫描耗时的分桶上限(秒)
+SWEEP_BUCKETS = (10, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200)
+
+
+def _format_labels(labelnames, labels, extra=None):
+    pairs = list(zip(labelnames, labels))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            return dict(self._values)
+
+    def to_prometheus(self, values):
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {value}" for labels, value in values.items()]
+
+    def to_dict(self, values):
+        return [{'labels': dict(zip(self.labelnames, labels)), 'value': value} for labels, value in values.items()]
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # labels -> [各分桶计数(最后一个是+Inf), 总和]
+        self._values = {}
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def collect(self):
+        with self._lock:
+            return {labels: (list(counts), total) for labels, (counts, total) in self._values.items()}
+
+    def _quantile(self, counts, q):
+        """按分桶估计分位数，取所在分桶的上限"""
+        count = sum(counts)
+        if not count:
+            return 0.0
+        rank = q * count
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                return bound if bound != float('inf') else self.buckets[-1]
+        return self.buckets[-1]
+
+    def to_prometheus(self, values):
+        lines = []
+        for labels, (counts, total) in values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, ('le', le))} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {total}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+    def to_dict(self, values):
+        samples = []
+        for labels, (counts, total) in values.items():
+            count = sum(counts)
+            samples.append({
+                'labels': dict(zip(self.labelnames, labels)),
+                'count': count,
+                'sum': total,
+                'avg': total / count if count else 0.0,
+                'p50': self._quantile(counts, 0.5),
+                'p99': self._quantile(counts, 0.99),
+                'buckets': {('+Inf' if bound == float('inf') else str(bound)): bucket_count
+                            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts)},
+            })
+        return samples
+
+
+class CallbackMetric(Counter):
+    def __init__(self, name, help, callback, type='counter', labelnames=()):
+        """在采集时调用callback取值的指标，用来导出各模块已经在统计的计数，不增加热路径的开销
+
+        Args:
+            callback: 返回 {标签值元组: 数值} 的函数
+            type: counter或gauge
+        """
+        super().__init__(name, help, labelnames)
+        self.type = type
+        self.callback = callback
+
+    def collect(self):
+        return self.callback()
+
+
+class MetricsRegistry:
+    def __init__(self):
+        """进程内的指标集合，以Prometheus文本格式或JSON导出"""
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None and not isinstance(metric, CallbackMetric):
+                return existing
+            # 回调指标以最后一次注册为准，例如重新创建PriceManager之后
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def register_callback(self, name, help, callback, type='counter', labelnames=()):
+        return self._register(CallbackMetric(name, help, callback, type, labelnames))
+
+    def _collect(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            try:
+                yield metric, metric.collect()
+            except Exception as e:
+                logger.error(f"Failed to collect metric {metric.name}: {e}")
+
+    def to_prometheus(self):
+        lines = []
+        for metric, values in self._collect():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.to_prometheus(values))
+        return '\n'.join(lines) + '\n'
+
+    def to_dict(self):
+        return {
+            'generated_at': datetime.now().isoformat(timespec='seconds'),
+            'metrics': {metric.name: {'type': metric.type, 'help': metric.help, 'samples': metric.to_dict(values)}
+                        for metric, values in self._collect()},
+        }
+
+    def dump_json(self, path):
+        """把当前所有指标写入JSON文件，单次运行结束时调用"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+
+class MetricsServer:
+    def __init__(self, registry, host='127.0.0.1', port=9108):
+        """常驻模式下的指标HTTP接口
+
+        - /metrics: Prometheus文本格式
+        - /metrics.json: JSON格式，直方图附带按分桶估计的p50/p99
+        """
+        self.registry = registry
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    def _handler_class(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?', 1)[0]
+                if path == '/metrics':
+                    body = registry.to_prometheus().encode('utf-8')
+                    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+                elif path == '/metrics.json':
+                    body = json.dumps(registry.to_dict(), ensure_ascii=False).encode('utf-8')
+                    content_type = 'application/json; charset=utf-8'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='metrics-server', daemon=True)
+        self._thread.start()
+        host, port = self.httpd.server_address[:2]
+        logger.info(f"Metrics available on http://{host}:{port}/metrics")
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread:
+            self._thread.join()
+
+
+REGISTRY = MetricsRegistry()
+
+FETCH_SECONDS = REGISTRY.histogram(
+    'flight_fetch_seconds', 'Fare API request latency', ['endpoint'])
+FETCH_ERRORS = REGISTRY.counter(
+    'flight_fetch_errors_total', 'Fare API requests that failed or returned a non-2xx status', ['endpoint'])
+PARSE_SECONDS = REGISTRY.histogram(
+    'flight_parse_seconds', 'Time to extract matching prices from one fare response', ['kind'])
+PRICES_EXTRACTED = REGISTRY.counter(
+    'flight_prices_extracted_total', 'Prices under the target price extracted from fare responses', ['kind'])
+DB_SECONDS = REGISTRY.histogram(
+    'flight_db_seconds', 'Price storage write latency per batch', ['backend', 'operation'])
+NOTIFY_SECONDS = REGISTRY.histogram(
+    'flight_notify_seconds', 'Time from queueing an alert to delivering it', ['outcome'])
+SWEEP_SECONDS = REGISTRY.histogram(
+    'flight_sweep_seconds', 'Duration of a full sweep', buckets=SWEEP_BUCKETS)
+SWEEP_ROUTES = REGISTRY.counter(
+    'flight_sweep_routes_total', 'Routes scheduled across all sweeps')
@@ -0,0 +1,330 @@
+import logging
+from price_writer import PriceWriter
+from best_deals import BestDeals
+from history_maintenance import HistoryMaintenance
+from storage import PriceStorage
+
+
+class MySQLStorage(PriceStorage):
+    name = 'mysql'
+    # Bump when the DDL in _create_tables changes
+    SCHEMA_VERSION = 6
+    
+    def __init__(self, pool, batch_size=500, flush_interval=5.0, touch_interval=60.0, index_size=200000,
+                 history_options=None):
+        """MySQL storage backend
+        
+        Price writes are buffered by PriceWriter and flushed in bulk; t_flight_best_deal
+        and the history rollups are maintained alongside.
+        
+        Args:
+            pool: db_pool.ConnectionPool
+            batch_size: Number of buffered price updates that triggers a flush
+            flush_interval: Seconds after which buffered price updates are flushed
+            touch_interval: Seconds between bulk last_checked refreshes of unchanged prices
+            index_size: Maximum number of current prices kept in the in-memory index
+            history_options: Keyword arguments for HistoryMaintenance (batch_size, batch_pause, ...)
+        """
+        self.pool = pool
+        self.batch_size = batch_size
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.best_deals = BestDeals(self.pool)
+        self.history = HistoryMaintenance(self.pool, **(history_options or {}))
+        self.writer = PriceWriter(self.pool, batch_size=batch_size, flush_interval=flush_interval,
+                                  touch_interval=touch_interval, index_size=index_size,
+                                  best_deals=self.best_deals)
+    
+    def ensure_schema(self):
+        return self._check_db_tables()
+    
+    def _check_db_tables(self):
+        """Check the schema version and create the tables only if it is missing or older
+        
+        Returns:
+            bool: True if the schema is up to date
+        """
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    cursor.execute("SELECT version FROM t_schema_version WHERE component = 'price'")
+                    row = cursor.fetchone()
+                except Exception:
+                    row = None  # t_schema_version does not exist yet
+                cursor.close()
+                
+                if row and row[0] >= self.SCHEMA_VERSION:
+                    return True
+                
+                self._create_tables(conn, from_version=row[0] if row else 0)
+            self.logger.info(f"Database tables created/upgraded to schema version {self.SCHEMA_VERSION}")
+            return True
+            
+        except Exception as e:
+            self.logger.error(f"Error checking/creating database tables: {e}")
+            return False
+    
+    def _create_tables(self, conn, from_version=0):
+        """Create the price tables if needed and upgrade them from an older schema version
+        
+        Args:
+            conn: Database connection
+            from_version: Schema version recorded in t_schema_version (0 if none)
+        """
+        cursor = conn.cursor()
+        try:
+            # Check if t_flight_price_current table exists
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS t_flight_price_current (
+                    id INT PRIMARY KEY AUTO_INCREMENT,
+                    place_from VARCHAR(3) NOT NULL,
+                    place_to VARCHAR(3) NOT NULL,
+                    dep_date DATE NOT NULL,
+                    arr_date DATE NOT NULL,
+                    price DECIMAL(10,2) NOT NULL,
+                    last_checked TIMESTAMP NOT NULL,
+                    first_seen TIMESTAMP NOT NULL,
+                    is_roundtrip TINYINT(1) NOT NULL,
+                    currency VARCHAR(3) DEFAULT 'CNY',
+                    row_updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+                    UNIQUE KEY route_date_idx (place_from, place_to, dep_date, arr_date, is_roundtrip),
+                    KEY last_checked_idx (last_checked),
+                    KEY row_updated_idx (row_updated_at)
+                )
+            """)
+            if from_version < 3:
+                # Version 3: index on last_checked
+                try:
+                    cursor.execute("CREATE INDEX last_checked_idx ON t_flight_price_current (last_checked)")
+                except Exception:
+                    pass  # Table was just created with the index
+            if from_version < 6:
+                # Version 6: server-assigned change time for PriceExporter and PriceIndex.sync.
+                # last_checked is the writer's observation time, which can be older than the commit
+                # (journal replay, write-behind buffering, other shard nodes)
+                try:
+                    cursor.execute("""
+                        ALTER TABLE t_flight_price_current
+                        ADD COLUMN row_updated_at TIMESTAMP(6) NOT NULL
+                            DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+                        ADD KEY row_updated_idx (row_updated_at)
+                    """)
+                except Exception:
+                    pass  # Table was just created with the column
+            self._create_removal_log(cursor)
+        
+            # Check if t_flight_price_history table exists
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS t_flight_price_history (
+                    id INT PRIMARY KEY AUTO_INCREMENT,
+                    place_from VARCHAR(3) NOT NULL,
+                    place_to VARCHAR(3) NOT NULL,
+                    dep_date DATE NOT NULL,
+                    arr_date DATE NOT NULL,
+                    old_price DECIMAL(10,2) NOT NULL,
+                    new_price DECIMAL(10,2) NOT NULL,
+                    changed_at TIMESTAMP NOT NULL,
+                    is_roundtrip TINYINT(1) NOT NULL,
+                    currency VARCHAR(3) DEFAULT 'CNY',
+                    KEY route_date_changed_idx (place_from, place_to, dep_date, arr_date, is_roundtrip,
+                                                changed_at, old_price, new_price),
+                    KEY dep_date_idx (dep_date),
+                    KEY changed_at_idx (changed_at)
+                )
+            """)
+            if from_version < 4:
+                # Version 4: covering index for get_price_history, dep_date for archival,
+                # changed_at for the route scheduler's recent-change counts
+                for index_ddl in ("CREATE INDEX route_date_changed_idx ON t_flight_price_history "
+                                  "(place_from, place_to, dep_date, arr_date, is_roundtrip, changed_at, old_price, new_price)",
+                                  "CREATE INDEX dep_date_idx ON t_flight_price_history (dep_date)",
+                                  "CREATE INDEX changed_at_idx ON t_flight_price_history (changed_at)"):
+                    try:
+                        cursor.execute(index_ddl)
+                    except Exception:
+                        pass  # Table was just created with the index
+            self.history.create_tables(cursor)
+            
+            self.best_deals.create_tables(cursor)
+            if from_version < 2:
+                # Version 2: t_flight_best_deal summary table
+                self.best_deals.rebuild(cursor)
+            
+            # Version 5: per-user alert rules, see alert_rules.AlertRuleMatcher
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS t_alert_rule (
+                    id INT PRIMARY KEY AUTO_INCREMENT,
+                    push_token VARCHAR(64) NOT NULL,
+                    origins VARCHAR(255) NULL COMMENT 'Comma-separated IATA codes, NULL for any',
+                    destinations VARCHAR(1024) NULL COMMENT 'Comma-separated IATA codes, NULL for any',
+                    dep_start DATE NULL,
+                    dep_end DATE NULL,
+                    weekdays VARCHAR(16) NULL COMMENT 'Comma-separated ISO departure weekdays, NULL for any',
+                    min_nights INT NULL,
+                    max_nights INT NULL,
+                    max_price DECIMAL(10,2) NOT NULL,
+                    enabled TINYINT(1) NOT NULL DEFAULT 1,
+                    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                    KEY push_token_idx (push_token)
+                )
+            """)
+            
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS t_schema_version (
+                    component VARCHAR(32) PRIMARY KEY,
+                    version INT NOT NULL
+                )
+            """)
+            cursor.execute("""
+                INSERT INTO t_schema_version (component, version) VALUES ('price', %s)
+                ON DUPLICATE KEY UPDATE version = VALUES(version)
+            """, (self.SCHEMA_VERSION,))
+        
+            conn.commit()
+        finally:
+            cursor.close()
+    
+    def submit(self, place_from, place_to, dep_date, arr_date, price, is_roundtrip=1, currency='CNY',
+               observed_at=None):
+        # Buffered; written to the database in bulk by PriceWriter.flush
+        return self.writer.submit(place_from, place_to, dep_date, arr_date, price, is_roundtrip, currency,
+                                  observed_at=observed_at)
+    
+    def flush(self):
+        return self.writer.flush()
+    
+    def _create_removal_log(self, cursor):
+        """Record rows deleted from t_flight_price_current for export tombstones and PriceIndex.sync"""
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS t_flight_price_removed (
+                id BIGINT PRIMARY KEY AUTO_INCREMENT,
+                place_from VARCHAR(3) NOT NULL,
+                place_to VARCHAR(3) NOT NULL,
+                dep_date DATE NOT NULL,
+                arr_date DATE NOT NULL,
+                is_roundtrip TINYINT(1) NOT NULL,
+                removed_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+                KEY removed_at_idx (removed_at)
+            )
+        """)
+        try:
+            cursor.execute("DROP TRIGGER IF EXISTS t_flight_price_current_removed")
+            cursor.execute("""
+                CREATE TRIGGER t_flight_price_current_removed AFTER DELETE ON t_flight_price_current
+                FOR EACH ROW
+                    INSERT INTO t_flight_price_removed (place_from, place_to, dep_date, arr_date, is_roundtrip)
+                    VALUES (OLD.place_from, OLD.place_to, OLD.dep_date, OLD.arr_date, OLD.is_roundtrip)
+            """)
+        except Exception as e:
+            # Creating triggers needs the TRIGGER privilege (and SUPER with binary logging on some servers)
+            self.logger.warning(f"Could not create the t_flight_price_current delete trigger, "
+                                f"exports will not include tombstones for deleted rows: {e}")
+    
+    def drain(self):
+        return self.writer.drain()
+    
+    def invalidate(self, place_from=None, place_to=None):
+        self.writer.index.invalidate(place_from, place_to)
+    
+    def get_price_history(self, place_from, place_to, dep_date, arr_date, is_roundtrip=1):
+        with self.pool.connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+        
+            # Both halves are served from route_date_changed_idx; departed dates live in the archive
+            key = (place_from, place_to, dep_date, arr_date, is_roundtrip)
+            cursor.execute("""
+                SELECT old_price, new_price, changed_at
+                FROM t_flight_price_history
+                WHERE place_from = %s AND place_to = %s AND dep_date = %s AND arr_date = %s AND is_roundtrip = %s
+                UNION ALL
+                SELECT old_price, new_price, changed_at
+                FROM t_flight_price_history_archive
+                WHERE place_from = %s AND place_to = %s AND dep_date = %s AND arr_date = %s AND is_roundtrip = %s
+                ORDER BY changed_at ASC
+            """, key + key)
+        
+            history = cursor.fetchall()
+        
+            cursor.close()
+        
+            return history
+    
+    def get_latest_prices(self, place_from=None, place_to=None, limit=10):
+        with self.pool.connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+        
+            query = """
+                SELECT c.place_from, c.place_to, c.dep_date, c.arr_date, 
+                       c.price, c.last_checked, c.is_roundtrip, c.currency
+                FROM t_flight_price_current c
+                WHERE 1=1
+            """
+            params = []
+        
+            if place_from:
+                query += " AND c.place_from = %s"
+                params.append(place_from)
+            
+            if place_to:
+                query += " AND c.place_to = %s"
+                params.append(place_to)
+            
+            query += " ORDER BY c.last_checked DESC LIMIT %s"
+            params.append(limit)
+        
+            cursor.execute(query, params)
+            results = cursor.fetchall()
+        
+            cursor.close()
+        
+            return results
+    
+    def get_best_deals(self, place_from=None, max_price=None, limit=5):
+        return self.best_deals.query(place_from, max_price, limit)
+    
+    def iata_version(self):
+        # CHECKSUM TABLE changes whenever t_iata_code changes
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("CHECKSUM TABLE t_iata_code")
+            version = str(cursor.fetchone()[1])
+            cursor.close()
+        return version
+    
+    def load_iata_codes(self):
+        # One scan for both the name map and the domestic list
+        code2city = {}
+        domestic_codes = []
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT iata_code, iata_name, domestic FROM t_iata_code")
+            for iata_code, iata_name, domestic in cursor:
+                code2city[iata_code] = iata_name
+                if domestic == 1:
+                    domestic_codes.append(iata_code)
+            cursor.close()
+        return code2city, domestic_codes
+    
+    def load_alert_rules(self):
+        with self.pool.connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute("""
+                SELECT id, push_token, origins, destinations, dep_start, dep_end, weekdays,
+                       min_nights, max_nights, max_price
+                FROM t_alert_rule
+                WHERE enabled = 1 AND (dep_end IS NULL OR dep_end >= CURDATE())
+            """)
+            rules = cursor.fetchall()
+            cursor.close()
+        return rules
+    
+    def maintain_history(self, stop_event=None):
+        return self.history.run_if_due(stop_event)
+    
+    def stats(self):
+        stats = dict(self.writer.stats)
+        stats['pool'] = self.pool.stats()
+        return stats
+    
+    def close(self):
+        self.pool.close()
@@ -1,43 +1,160 @@
+import time
+import queue
+import threading
 import requests
 import logging
 from datetime import datetime
+from metrics import NOTIFY_SECONDS
+import profiling
 
 class NotificationManager:
-    def __init__(self, sckey, headers=None):
+    def __init__(self, sckey, headers=None, async_dispatch=True, min_interval=3.0,
+                 coalesce_window=5.0, max_retries=3, timeout=10):
+        """PushPlus通知
+
+        开启async_dispatch时，send_notification只把消息放入队列立即返回，
+        由后台线程发送：复用同一个HTTP会话，两次发送之间至少间隔min_interval秒，
+        coalesce_window秒内标题相同的消息合并成一条，失败时按指数退避重试。
+
+        Args:
+            sckey: PushPlus token
+            headers: 请求头
+            async_dispatch: 是否使用后台队列发送
+            min_interval: 两次发送的最短间隔(秒)，与PushPlus的频率限制一致
+            coalesce_window: 合并消息的时间窗口(秒)
+            max_retries: 发送失败时的最大重试次数
+            timeout: 请求超时时间(秒)
+        """
         self.sckey = sckey
         self.headers = headers or {}
+        self.async_dispatch = async_dispatch
+        self.min_interval = min_interval
+        self.coalesce_window = coalesce_window
+        self.max_retries = max_retries
+        self.timeout = timeout
         self.logger = logging.getLogger(self.__class__.__name__)
-    
-    def send_notification(self, message, title="Flight Price Alert"):
+        self.session = requests.Session()
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self._last_sent = 0.0
+        self._stats_lock = threading.Lock()
+        self._stats = {'queued': 0, 'sent': 0, 'failed': 0, 'coalesced': 0,
+                       'latency_total': 0.0, 'latency_max': 0.0}
+
+    def send_notification(self, message, title="Flight Price Alert", token=None):
         """Send notification through PushPlus service
-        
+
         Args:
             message: Message content
             title: Notification title
-        
+            token: Optional PushPlus token of another recipient (default: sckey)
+
         Returns:
-            bool: True if successful, False otherwise
+            bool: True if successful (or queued in async mode), False otherwise
         """
-        if not self.sckey:
+        token = token or self.sckey
+        if not token:
             self.logger.warning("No SCKEY provided, cannot send notification")
             return False
-        
+
+        if not self.async_dispatch:
+            return self._deliver(message, title, token)
+
+        self._ensure_worker()
+        self._queue.put((token, title, message, time.monotonic()))
+        with self._stats_lock:
+            self._stats['queued'] += 1
+        return True
+
+    def _ensure_worker(self):
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._dispatch_loop, name='notification-dispatch', daemon=True)
+                self._worker.start()
+
+    def _dispatch_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+
+            # 在合并窗口内收集更多消息，按标题分组
+            batch = [item]
+            stop = False
+            deadline = time.monotonic() + self.coalesce_window
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    next_item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if next_item is None:
+                    stop = True
+                    break
+                batch.append(next_item)
+
+            # 只合并发给同一个接收者、标题相同的消息
+            groups = {}
+            for token, title, message, enqueued_at in batch:
+                groups.setdefault((token, title), []).append((message, enqueued_at))
+
+            for (token, title), items in groups.items():
+                message = '\n'.join(str(m) for m, _ in items)
+                ok = self._deliver(message, title, token)
+                now = time.monotonic()
+                with self._stats_lock:
+                    self._stats['sent' if ok else 'failed'] += len(items)
+                    self._stats['coalesced'] += len(items) - 1
+                    for _, enqueued_at in items:
+                        latency = now - enqueued_at
+                        self._stats['latency_total'] += latency
+                        self._stats['latency_max'] = max(self._stats['latency_max'], latency)
+                for _, enqueued_at in items:
+                    NOTIFY_SECONDS.observe(now - enqueued_at, 'sent' if ok else 'failed')
+
+            if stop:
+                return
+
+    def _deliver(self, message, title, token=None):
+        """发送一条消息，失败时按指数退避重试"""
+        for attempt in range(self.max_retries + 1):
+            # 客户端限速，避免超过PushPlus的频率限制
+            wait = self._last_sent + self.min_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            self._last_sent = time.monotonic()
+
+            # 异步发送时记录在通知线程中，与扫描线程的阶段重叠
+            with profiling.span('alert'):
+                ok = self._post(message, title, token)
+            if ok:
+                return True
+            if attempt < self.max_retries:
+                backoff = 2 ** attempt
+                self.logger.warning(f"Notification failed, retrying in {backoff}s ({attempt + 1}/{self.max_retries})")
+                time.sleep(backoff)
+        return False
+
+    def _post(self, message, title, token=None):
         try:
             timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             formatted_message = f"[{timestamp}]\n\n{message}"
-            
+
             # PushPlus API
             url = f"https://www.pushplus.plus/send"
             data = {
-                "token": self.sckey,
+                "token": token or self.sckey,
                 "title": title,
                 "content": formatted_message,
                 "template": "html"
             }
-            
-            response = requests.post(url, json=data, headers=self.headers)
+
+            response = self.session.post(url, json=data, headers=self.headers, timeout=self.timeout)
             response.raise_for_status()
-            
+
             result = response.json()
             if result.get("code") == 200:
                 self.logger.info("Notification sent successfully")
@@ -45,16 +162,37 @@ class NotificationManager:
             else:
                 self.logger.error(f"Failed to send notification: {result.get('msg')}")
                 return False
-                
+
         except Exception as e:
             self.logger.error(f"Error sending notification: {e}")
             return False
-        
+
+    def stats(self):
+        """返回发送队列深度和延迟统计"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        done = stats['sent'] + stats['failed']
+        stats['queue_depth'] = self._queue.qsize()
+        stats['latency_avg'] = stats['latency_total'] / done if done else 0.0
+        return stats
+
+    def close(self, timeout=60):
+        """等待队列中的消息发送完毕后停止后台线程"""
+        with self._worker_lock:
+            worker = self._worker
+        if worker is None or not worker.is_alive():
+            return
+        self._queue.put(None)
+        worker.join(timeout)
+        if worker.is_alive():
+            self.logger.warning(f"Notification queue not drained after {timeout}s")
+
 if __name__ == "__main__":
-    messages = ["深圳->北京, departure: 2025-06-05, return: 2025-06-08, price: 750", 
+    messages = ["深圳->北京, departure: 2025-06-05, return: 2025-06-08, price: 750",
                 "深圳->上海, departure: 2025-06-05, return: 2025-06-08, price: 750",
                 "深圳->上海, departure: 2025-06-05, return: 2025-06-08, price: 750",
                 "深圳->上海, departure: 2025-06-05, return: 2025-06-08, price: 750",
                 "深圳->上海, departure: 2025-06-05, return: 2025-06-08, price: 750"]
     notification_manager = NotificationManager("")
-    notification_manager.send_notification(messages)
\ No newline at end of file
+    notification_manager.send_notification(messages)
+    notification_manager.close()
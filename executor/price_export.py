@@ -0,0 +1,209 @@
+import os
+import json
+import time
+import logging
+from datetime import datetime
+
+# 导出文件中每行的字段顺序，行用数组表示以减小体积
+COLUMNS = ['place_from', 'place_to', 'dep_date', 'arr_date', 'price', 'last_checked', 'is_roundtrip']
+
+
+class PriceExporter:
+    # manifest中游标的含义，和旧manifest不一致时重新生成快照
+    CURSOR_SOURCE = 'row_updated_at'
+
+    def __init__(self, pool, export_dir, max_deltas=48, compact_ratio=0.5, commit_lag=60, removed_retention_days=7):
+        """把t_flight_price_current增量导出为JSON，客户端按游标只同步变化的记录
+
+        export_dir中的文件：
+        - manifest.json: 当前的基准快照、增量文件列表和最新游标，最后写入
+        - base-<游标>.json: 某一时刻所有未出发航班的完整快照
+        - delta-<序号>-<起始游标>-<结束游标>.ndjson: 游标之后有变化的记录，每行一条；
+          price和last_checked为null的行是删除标记(已出发或被删除的记录)
+
+        游标是row_updated_at的时间戳(秒)，由数据库在写入时设置，和写入方观测价格的时间(last_checked)、
+        本机时区都无关。语句开始执行到提交之间有一段时间，游标最多推进到数据库当前时间减commit_lag，
+        最近commit_lag秒内的记录下次会再导出一次，客户端按key覆盖，重复的记录没有影响。
+        客户端保存manifest里的cursor，下次只下载from >= 自己游标的增量文件，
+        按(place_from, place_to, dep_date, arr_date, is_roundtrip)覆盖或删除；
+        自己的游标早于base_cursor时重新下载基准快照。
+        增量文件数超过max_deltas或增量总行数超过快照行数的compact_ratio时重新生成快照并删除旧增量。
+        所有文件先写临时文件再改名，客户端不会读到写了一半的文件。
+
+        Args:
+            pool: db_pool.ConnectionPool
+            export_dir: 导出目录
+            max_deltas: 最多保留的增量文件数
+            compact_ratio: 增量总行数与快照行数之比超过该值时合并
+            commit_lag: 写入语句开始到提交最长的时间(秒)，游标不会超过数据库当前时间减该值
+            removed_retention_days: t_flight_price_removed中删除记录保留的天数
+        """
+        self.pool = pool
+        self.export_dir = export_dir
+        self.max_deltas = max_deltas
+        self.compact_ratio = compact_ratio
+        self.commit_lag = commit_lag
+        self.removed_retention_days = removed_retention_days
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.manifest_path = os.path.join(export_dir, 'manifest.json')
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, 'r') as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            self.logger.error(f"Failed to load export manifest, rebuilding snapshot: {e}")
+            return None
+        if manifest.get('cursor_source') != self.CURSOR_SOURCE:
+            self.logger.info("Export manifest uses an older cursor, rebuilding snapshot")
+            return None
+        return manifest
+
+    def _write_atomic(self, name, write):
+        path = os.path.join(self.export_dir, name)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            write(f)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _row(place_from, place_to, dep_date, arr_date, price, last_checked, is_roundtrip):
+        return [place_from, place_to, dep_date.isoformat(), arr_date.isoformat(), float(price),
+                last_checked.isoformat(timespec='seconds'), is_roundtrip]
+
+    @staticmethod
+    def _tombstone(place_from, place_to, dep_date, arr_date, is_roundtrip):
+        return [place_from, place_to, dep_date.isoformat(), arr_date.isoformat(), None, None, is_roundtrip]
+
+    def _query(self, since=None, since_date=None):
+        """读取since之后有变化的记录和删除标记，since为None时读取所有未出发的记录
+
+        Args:
+            since: 上次导出的游标
+            since_date: 上次导出时数据库的日期(YYYY-MM-DD)，这之后出发的记录输出删除标记
+
+        Returns:
+            tuple: (行列表, 新游标, 数据库当前日期)
+        """
+        query = """
+            SELECT place_from, place_to, dep_date, arr_date, price, last_checked, is_roundtrip
+            FROM t_flight_price_current
+            WHERE dep_date >= CURDATE()
+        """
+        params = []
+        if since is not None:
+            query += " AND row_updated_at > FROM_UNIXTIME(%s)"
+            params.append(since)
+
+        rows = []
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            # 时间戳都在数据库里换算，和本机时区无关
+            cursor.execute("SELECT UNIX_TIMESTAMP(NOW(6)), CURDATE()")
+            now_ts, today = cursor.fetchone()
+            cursor.execute(query, params)
+            for record in cursor:
+                rows.append(self._row(*record))
+
+            if since is not None:
+                if since_date and since_date < today.isoformat():
+                    # 上次导出之后已经出发的记录
+                    cursor.execute("""
+                        SELECT place_from, place_to, dep_date, arr_date, is_roundtrip
+                        FROM t_flight_price_current
+                        WHERE dep_date >= %s AND dep_date < CURDATE()
+                    """, (since_date,))
+                    rows.extend(self._tombstone(*record) for record in cursor)
+                cursor.execute("""
+                    SELECT place_from, place_to, dep_date, arr_date, is_roundtrip
+                    FROM t_flight_price_removed
+                    WHERE removed_at > FROM_UNIXTIME(%s) AND dep_date >= CURDATE()
+                """, (since,))
+                rows.extend(self._tombstone(*record) for record in cursor)
+            cursor.close()
+        cursor_ts = round(float(now_ts) - self.commit_lag, 6)
+        return rows, max(since or 0, cursor_ts), today.isoformat()
+
+    def _prune_removed(self):
+        """删除已经超过保留天数的删除记录，合并快照后调用"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM t_flight_price_removed WHERE removed_at < NOW() - INTERVAL %s DAY",
+                           (self.removed_retention_days,))
+            conn.commit()
+            cursor.close()
+
+    def _write_base(self):
+        rows, cursor_ts, today = self._query()
+        name = f"base-{int(cursor_ts)}.json"
+        self._write_atomic(name, lambda f: json.dump(
+            {'columns': COLUMNS, 'cursor': cursor_ts, 'rows': rows},
+            f, ensure_ascii=False, separators=(',', ':')))
+        return {
+            'columns': COLUMNS,
+            'cursor_source': self.CURSOR_SOURCE,
+            'base': name,
+            'base_cursor': cursor_ts,
+            'base_rows': len(rows),
+            'cursor': cursor_ts,
+            'date': today,
+            'deltas': [],
+        }
+
+    def _remove_unreferenced(self, manifest):
+        keep = {'manifest.json', manifest['base']} | {delta['file'] for delta in manifest['deltas']}
+        for name in os.listdir(self.export_dir):
+            if name in keep or not (name.startswith('base-') or name.startswith('delta-')):
+                continue
+            try:
+                os.remove(os.path.join(self.export_dir, name))
+            except OSError as e:
+                self.logger.warning(f"Failed to remove old export file {name}: {e}")
+
+    def export(self):
+        """写出上次导出以来的增量，需要时合并为新的快照
+
+        Returns:
+            dict: 新的manifest
+        """
+        start = time.monotonic()
+        os.makedirs(self.export_dir, exist_ok=True)
+        manifest = self._load_manifest()
+
+        if manifest is None:
+            manifest = self._write_base()
+            written = manifest['base_rows']
+        else:
+            rows, cursor_ts, today = self._query(manifest['cursor'], manifest.get('date'))
+            written = len(rows)
+            if rows:
+                # 两次导出的游标可能相同，文件名带上递增序号避免重名
+                manifest['seq'] = manifest.get('seq', 0) + 1
+                name = f"delta-{manifest['seq']}-{int(manifest['cursor'])}-{int(cursor_ts)}.ndjson"
+                self._write_atomic(name, lambda f: f.writelines(
+                    json.dumps(row, ensure_ascii=False, separators=(',', ':')) + '\n' for row in rows))
+                manifest['deltas'].append({'file': name, 'from': manifest['cursor'], 'to': cursor_ts,
+                                           'rows': len(rows)})
+            manifest['cursor'] = cursor_ts
+            manifest['date'] = today
+
+            delta_rows = sum(delta['rows'] for delta in manifest['deltas'])
+            if (len(manifest['deltas']) > self.max_deltas
+                    or delta_rows > manifest['base_rows'] * self.compact_ratio):
+                self.logger.info(f"Compacting {len(manifest['deltas'])} export deltas ({delta_rows} rows)")
+                seq = manifest.get('seq', 0)
+                manifest = self._write_base()
+                manifest['seq'] = seq
+                try:
+                    self._prune_removed()
+                except Exception as e:
+                    self.logger.warning(f"Failed to prune t_flight_price_removed: {e}")
+
+        manifest['generated_at'] = datetime.now().isoformat(timespec='seconds')
+        self._write_atomic('manifest.json', lambda f: json.dump(manifest, f, separators=(',', ':')))
+        self._remove_unreferenced(manifest)
+        self.logger.info(f"Exported {written} prices to {self.export_dir} in {time.monotonic() - start:.2f}s, "
+                         f"cursor {manifest['cursor']}, {len(manifest['deltas'])} deltas")
+        return manifest
@@ -0,0 +1,96 @@
+from collections import namedtuple
+from datetime import date, timedelta
+
+# 出行模式：出发星期(ISO，周一为1)、住几晚、最远提前多少天(None为不限)
+TripPattern = namedtuple('TripPattern', ['name', 'dep_weekdays', 'nights', 'max_horizon'])
+
+# 与原来的逻辑一致：周四出发周日返回，周五出发周一返回
+DEFAULT_TRIP_PATTERNS = [
+    TripPattern('thu-sun', frozenset([4]), 3, None),
+    TripPattern('fri-mon', frozenset([5]), 3, None),
+]
+
+
+def load_trip_patterns(config_value):
+    """从配置tripPatterns解析出行模式列表，未配置时使用默认的周四/周五出发
+
+    配置示例: [{"name": "thu-sun", "depWeekdays": [4], "nights": 3, "maxHorizon": 60}]
+    """
+    if not config_value:
+        return list(DEFAULT_TRIP_PATTERNS)
+    return [
+        TripPattern(
+            item.get('name') or f"{'/'.join(map(str, item['depWeekdays']))}+{item['nights']}",
+            frozenset(item['depWeekdays']),
+            int(item['nights']),
+            item.get('maxHorizon'),
+        )
+        for item in config_value
+    ]
+
+
+class TripCalendar:
+    def __init__(self, patterns, today=None, days=400):
+        """一次运行内共用的日期表
+
+        预先算好从today开始days天内每个YYYYMMDD字符串对应的星期和距今天数，
+        并根据出行模式生成 出发日期 -> [返回日期, ...] 的对照表，
+        处理价格矩阵时只需要查表，不再对每个日期调用strptime。
+
+        Args:
+            patterns: TripPattern列表
+            today: 计算距今天数的基准日期，默认是今天
+            days: 日期表覆盖的天数
+        """
+        self.today = today or date.today()
+        self.patterns = patterns
+        self.weekday = {}
+        self.days_ahead = {}
+        self.trips = {}
+
+        dates = [self.today + timedelta(days=i) for i in range(days)]
+        keys = [d.strftime('%Y%m%d') for d in dates]
+        for i, (d, key) in enumerate(zip(dates, keys)):
+            self.weekday[key] = d.isoweekday()
+            self.days_ahead[key] = i
+
+        for i, key in enumerate(keys):
+            returns = []
+            for pattern in patterns:
+                if self.weekday[key] not in pattern.dep_weekdays:
+                    continue
+                if pattern.max_horizon is not None and i > pattern.max_horizon:
+                    continue
+                arr_index = i + pattern.nights
+                arr_key = keys[arr_index] if arr_index < len(keys) else \
+                    (self.today + timedelta(days=arr_index)).strftime('%Y%m%d')
+                if arr_key not in returns:
+                    returns.append(arr_key)
+            if returns:
+                self.trips[key] = returns
+
+    def is_current(self):
+        """日期表是否仍然对应今天，跨天后需要重建"""
+        return self.today == date.today()
+
+    def extract(self, matrix, target_price):
+        """从往返价格矩阵中一次性取出所有符合出行模式且低于目标价格的价格
+
+        Args:
+            matrix: roundTripPrice，格式为 {出发日期: {返回日期: 价格}}
+            target_price: 目标价格
+
+        Returns:
+            list: [(出发日期, 返回日期, 价格), ...]
+        """
+        trips = self.trips
+        found = []
+        for dep_date, prices in matrix.items():
+            returns = trips.get(dep_date)
+            if not returns:
+                continue
+            for arr_date in returns:
+                price = prices.get(arr_date, 0)
+                if price and price < target_price:
+                    found.append((dep_date, arr_date, price))
+        return found
@@ -0,0 +1,188 @@
+import threading
+import logging
+from collections import OrderedDict
+
+
+class PriceIndex:
+    def __init__(self, pool, max_entries=200000, sync_window=60):
+        """t_flight_price_current的进程内索引
+
+        以航线(place_from, place_to, is_roundtrip)为单位缓存每个(出发日期, 返回日期)的当前价格，
+        航线在索引中即表示该航线的全部日期都已知，不在索引中的航线需要先load_route。
+        总记录数超过max_entries时按最近最少使用淘汰整条航线。
+
+        其他执行器写入同一批记录时，sync按数据库分配的row_updated_at读取上次同步之后变化的
+        t_flight_price_current记录(包括其他执行器新插入的日期)和t_flight_price_removed中删除的记录，
+        更新索引中已有的航线；也可以调用invalidate直接丢弃某些航线。
+        语句开始执行到提交之间有一段时间，同步游标最多推进到数据库当前时间减sync_window，
+        最近sync_window秒内的记录下次会再读一次，提交较晚的记录不会漏掉。
+
+        Args:
+            pool: db_pool.ConnectionPool
+            max_entries: 索引最多保存的价格记录数
+            sync_window: 写入语句开始到提交最长的时间(秒)，sync每次向前多读的时间
+        """
+        self.pool = pool
+        self.max_entries = max_entries
+        self.sync_window = sync_window
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._lock = threading.RLock()
+        # (place_from, place_to, is_roundtrip) -> {(dep_date, arr_date): price}
+        self._routes = OrderedDict()
+        self._size = 0
+        # 数据库时间的UNIX时间戳，sync读取row_updated_at在它之后的记录
+        self._sync_cursor = None
+        self.stats = {'lookups': 0, 'route_loads': 0, 'evictions': 0, 'synced': 0}
+
+    def __len__(self):
+        return self._size
+
+    def _put_route(self, route, prices):
+        if route in self._routes:
+            self._size -= len(self._routes.pop(route))
+        self._routes[route] = prices
+        self._size += len(prices)
+        self._evict()
+
+    def _evict(self):
+        # 最近使用的航线在末尾，至少保留一条
+        while self._size > self.max_entries and len(self._routes) > 1:
+            _, evicted = self._routes.popitem(last=False)
+            self._size -= len(evicted)
+            self.stats['evictions'] += 1
+
+    def load(self):
+        """启动时一次性加载所有未出发日期的当前价格"""
+        with self._lock:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT UNIX_TIMESTAMP(NOW(6))")
+                self._sync_cursor = float(cursor.fetchone()[0]) - self.sync_window
+
+                cursor.execute("""
+                    SELECT place_from, place_to, is_roundtrip, dep_date, arr_date, price
+                    FROM t_flight_price_current
+                    WHERE dep_date >= CURDATE()
+                    ORDER BY place_from, place_to, is_roundtrip
+                """)
+                routes = {}
+                for place_from, place_to, is_roundtrip, dep_date, arr_date, price in cursor:
+                    routes.setdefault((place_from, place_to, is_roundtrip), {})[
+                        (dep_date.isoformat(), arr_date.isoformat())] = float(price)
+                cursor.close()
+
+            self._routes.clear()
+            self._size = 0
+            for route, prices in routes.items():
+                if self._size + len(prices) > self.max_entries:
+                    break
+                self._put_route(route, prices)
+            self.logger.info(f"Loaded {self._size} current prices for {len(self._routes)} routes into index")
+
+    def load_route(self, place_from, place_to, is_roundtrip):
+        """航线不在索引中时读取该航线所有日期的当前价格"""
+        route = (place_from, place_to, is_roundtrip)
+        with self._lock:
+            if route in self._routes:
+                self._routes.move_to_end(route)
+                return
+
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT dep_date, arr_date, price FROM t_flight_price_current
+                    WHERE place_from = %s AND place_to = %s AND is_roundtrip = %s AND dep_date >= CURDATE()
+                """, (place_from, place_to, is_roundtrip))
+                prices = {(dep_date.isoformat(), arr_date.isoformat()): float(price)
+                          for dep_date, arr_date, price in cursor.fetchall()}
+                cursor.close()
+            self._put_route(route, prices)
+            self.stats['route_loads'] += 1
+
+    def get(self, place_from, place_to, dep_date, arr_date, is_roundtrip):
+        """返回当前价格，没有记录时返回None
+
+        调用前需要保证航线已经通过load或load_route加载。
+        """
+        with self._lock:
+            self.stats['lookups'] += 1
+            return self._routes[(place_from, place_to, is_roundtrip)].get((dep_date, arr_date))
+
+    def route_prices(self, place_from, place_to, is_roundtrip):
+        """返回航线所有日期价格的副本，航线不在索引中时返回None"""
+        with self._lock:
+            prices = self._routes.get((place_from, place_to, is_roundtrip))
+            return dict(prices) if prices is not None else None
+
+    def set(self, place_from, place_to, dep_date, arr_date, is_roundtrip, price):
+        with self._lock:
+            route = (place_from, place_to, is_roundtrip)
+            prices = self._routes.get(route)
+            if prices is None:
+                return
+            if (dep_date, arr_date) not in prices:
+                self._size += 1
+                self._routes.move_to_end(route)
+                prices[(dep_date, arr_date)] = price
+                self._evict()
+            else:
+                prices[(dep_date, arr_date)] = price
+
+    def _discard(self, place_from, place_to, dep_date, arr_date, is_roundtrip):
+        prices = self._routes.get((place_from, place_to, is_roundtrip))
+        if prices is not None and prices.pop((dep_date, arr_date), None) is not None:
+            self._size -= 1
+
+    def invalidate(self, place_from=None, place_to=None):
+        """丢弃匹配的航线，下次访问时重新从数据库读取"""
+        with self._lock:
+            for route in [r for r in self._routes
+                          if (place_from is None or r[0] == place_from)
+                          and (place_to is None or r[1] == place_to)]:
+                self._size -= len(self._routes.pop(route))
+
+    def sync(self, skip=()):
+        """应用其他执行器写入的价格变化
+
+        读取t_flight_price_current中row_updated_at在同步游标之后的记录，更新索引中已有航线的价格，
+        t_flight_price_removed中删除的记录从索引中去掉。只更新已经在索引中的航线，
+        不在索引中的航线下次访问时由load_route读取最新数据。
+
+        Args:
+            skip: 可选，(place_from, place_to, dep_date, arr_date, is_roundtrip)集合，
+                  这些记录在索引中的价格比数据库新(还在写缓冲中)，不用数据库的值覆盖
+
+        Returns:
+            int: 读到的变化记录数
+        """
+        with self._lock:
+            if self._sync_cursor is None:
+                return 0
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                # 时间戳都在数据库里换算，和本机时区无关
+                cursor.execute("SELECT UNIX_TIMESTAMP(NOW(6))")
+                now_ts = float(cursor.fetchone()[0])
+                cursor.execute("""
+                    SELECT place_from, place_to, dep_date, arr_date, price, is_roundtrip
+                    FROM t_flight_price_current
+                    WHERE row_updated_at > FROM_UNIXTIME(%s) AND dep_date >= CURDATE()
+                """, (self._sync_cursor,))
+                changed = cursor.fetchall()
+                cursor.execute("""
+                    SELECT place_from, place_to, dep_date, arr_date, is_roundtrip
+                    FROM t_flight_price_removed
+                    WHERE removed_at > FROM_UNIXTIME(%s)
+                """, (self._sync_cursor,))
+                removed = cursor.fetchall()
+                cursor.close()
+
+            for place_from, place_to, dep_date, arr_date, price, is_roundtrip in changed:
+                dep_date, arr_date = dep_date.isoformat(), arr_date.isoformat()
+                if (place_from, place_to, dep_date, arr_date, is_roundtrip) not in skip:
+                    self.set(place_from, place_to, dep_date, arr_date, is_roundtrip, float(price))
+            for place_from, place_to, dep_date, arr_date, is_roundtrip in removed:
+                self._discard(place_from, place_to, dep_date.isoformat(), arr_date.isoformat(), is_roundtrip)
+            self._sync_cursor = max(self._sync_cursor, round(now_ts - self.sync_window, 6))
+            self.stats['synced'] += len(changed) + len(removed)
+            return len(changed) + len(removed)
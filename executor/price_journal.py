@@ -0,0 +1,106 @@
+import os
+import json
+import logging
+import threading
+
+
+class PriceJournal:
+    def __init__(self, path):
+        """数据库不可用时的本地价格日志
+
+        每条价格观测以一行JSON追加写入path并fsync，数据库恢复后按写入顺序重放。
+        重放时先把日志改名为 path.replay，新的观测继续写入新的日志文件，互不干扰。
+
+        Args:
+            path: 日志文件路径
+        """
+        self.path = path
+        self.replay_path = f"{path}.replay"
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._lock = threading.Lock()
+        self._file = None
+        self._maybe_pending = True
+
+    def append(self, record):
+        """追加一条记录并落盘"""
+        line = json.dumps(record, ensure_ascii=False, separators=(',', ':'))
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._maybe_pending = True
+            self._file.write(line + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def has_pending(self):
+        """是否有等待重放的记录，没有写入过记录时不访问文件系统"""
+        if not self._maybe_pending:
+            return False
+        self._maybe_pending = any(os.path.exists(p) and os.path.getsize(p) > 0 for p in (self.replay_path, self.path))
+        return self._maybe_pending
+
+    def _read(self, path):
+        records = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # 进程崩溃时最后一行可能只写了一半
+                    self.logger.warning(f"Skipping corrupt journal line {line_no} in {path}")
+        return records
+
+    def replay(self, apply_batch, batch_size=500):
+        """按写入顺序重放日志
+
+        Args:
+            apply_batch: 写入一批记录的函数，失败时抛出异常
+            batch_size: 每批记录数
+
+        Returns:
+            int: 重放的记录数
+
+        Raises:
+            Exception: apply_batch抛出的异常，未重放的记录保留在 path.replay 中
+        """
+        total = 0
+        while True:
+            with self._lock:
+                # 上次重放没完成的记录排在前面，处理完再轮转当前日志
+                if not os.path.exists(self.replay_path) and os.path.exists(self.path):
+                    if self._file is not None:
+                        self._file.close()
+                        self._file = None
+                    os.replace(self.path, self.replay_path)
+            if not os.path.exists(self.replay_path):
+                if total:
+                    self.logger.info(f"Replayed {total} journaled prices")
+                return total
+
+            records = self._read(self.replay_path)
+            replayed = 0
+            try:
+                for i in range(0, len(records), batch_size):
+                    apply_batch(records[i:i + batch_size])
+                    replayed = min(len(records), i + batch_size)
+            except Exception:
+                remaining = records[replayed:]
+                tmp_path = f"{self.replay_path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    for record in remaining:
+                        f.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+                os.replace(tmp_path, self.replay_path)
+                self.logger.error(f"Journal replay stopped, {len(remaining)} records left")
+                raise
+
+            os.remove(self.replay_path)
+            total += len(records)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
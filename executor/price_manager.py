@@ -1,101 +1,66 @@
 from collections import defaultdict
+import os
 import time
-from datetime import datetime
-import mysql.connector
 import logging
-from credentials import get_database_config
+from datetime import datetime
+from price_journal import PriceJournal
+import metrics
 
 class PriceManager:
-    def __init__(self, db_config=None):
+    def __init__(self, db_config=None, batch_size=500, flush_interval=5.0, touch_interval=60.0, index_size=200000,
+                 journal_path=None, degraded_retry=30.0, history_options=None, storage=None, alert_rules=None,
+                 price_stats=None):
         """Initialize the PriceManager
         
         Args:
-            db_config: MySQL database configuration dictionary
+            db_config: MySQL database configuration dictionary, used when no storage is given
+            batch_size: Number of buffered price updates that triggers a flush
+            flush_interval: Seconds after which buffered price updates are flushed
+            touch_interval: Seconds between bulk last_checked refreshes of unchanged prices
+            index_size: Maximum number of current prices kept in the in-memory index
+            journal_path: Local journal used while the database is unreachable
+                          (default: data/price_journal.ndjson next to this module)
+            degraded_retry: Seconds to stay in DB degraded mode before trying the database again
+            history_options: Keyword arguments for HistoryMaintenance (batch_size, batch_pause, ...)
+            storage: storage.PriceStorage backend (default: MySQL using db_config and the options above)
+            alert_rules: Optional alert_rules.AlertRuleMatcher whose rules are reloaded from the storage
+                         by refresh_alert_rules; FlightAlert matches full fare responses against it
+            price_stats: Optional price_stats.PriceStats that every incoming price is observed by
         """
-        self.update_price_info = defaultdict(lambda: defaultdict(dict))
-        self.db_config = db_config or get_database_config()
+        # (place_from, place_to) -> {(dep_date, arr_date): price}, used for alerts
+        self.update_price_info = defaultdict(dict)
         self.logger = logging.getLogger(self.__class__.__name__)
-        self._check_db_tables()
+        if storage is None:
+            from credentials import get_database_config
+            from db_pool import get_pool
+            from mysql_storage import MySQLStorage
+            storage = MySQLStorage(get_pool(db_config or get_database_config()), batch_size=batch_size,
+                                   flush_interval=flush_interval, touch_interval=touch_interval,
+                                   index_size=index_size, history_options=history_options)
+        self.storage = storage
+        self.alert_rules = alert_rules
+        self.price_stats = price_stats
+        # MySQL connection pool for sharding, adaptive scheduling and exports; None for embedded backends
+        self.pool = storage.pool
+        self.journal = PriceJournal(journal_path or os.path.join(
+            os.path.dirname(os.path.realpath(__file__)), 'data', 'price_journal.ndjson'))
+        self.degraded_retry = degraded_retry
+        self._degraded_until = 0.0
+        # Checked lazily on first database access so startup needs no DB round trip
+        self._schema_ready = False
+        # Write counts are read from the storage stats at scrape time, update_price does no extra counting
+        metrics.REGISTRY.register_callback(
+            'flight_db_writes_total', 'Price writes by outcome: insert, change or noop (price unchanged)',
+            self._write_counts, labelnames=['kind'])
     
-    def _check_db_tables(self):
-        """Check if the required database tables exist and create them if needed"""
-        try:
-            conn = mysql.connector.connect(**self.db_config)
-            cursor = conn.cursor()
-            
-            # Check if t_flight_price_current table exists
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS t_flight_price_current (
-                    id INT PRIMARY KEY AUTO_INCREMENT,
-                    place_from VARCHAR(3) NOT NULL,
-                    place_to VARCHAR(3) NOT NULL,
-                    dep_date DATE NOT NULL,
-                    arr_date DATE NOT NULL,
-                    price DECIMAL(10,2) NOT NULL,
-                    last_checked TIMESTAMP NOT NULL,
-                    first_seen TIMESTAMP NOT NULL,
-                    is_roundtrip TINYINT(1) NOT NULL,
-                    currency VARCHAR(3) DEFAULT 'CNY',
-                    UNIQUE KEY route_date_idx (place_from, place_to, dep_date, arr_date, is_roundtrip)
-                )
-            """)
-            
-            # Check if t_flight_price_history table exists
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS t_flight_price_history (
-                    id INT PRIMARY KEY AUTO_INCREMENT,
-                    place_from VARCHAR(3) NOT NULL,
-                    place_to VARCHAR(3) NOT NULL,
-                    dep_date DATE NOT NULL,
-                    arr_date DATE NOT NULL,
-                    old_price DECIMAL(10,2) NOT NULL,
-                    new_price DECIMAL(10,2) NOT NULL,
-                    changed_at TIMESTAMP NOT NULL,
-                    is_roundtrip TINYINT(1) NOT NULL,
-                    currency VARCHAR(3) DEFAULT 'CNY'
-                )
-            """)
-            
-            conn.commit()
-            cursor.close()
-            conn.close()
-            self.logger.info("Database tables checked and created if needed")
-            
-        except Exception as e:
-            self.logger.error(f"Error checking/creating database tables: {e}")
+    def _write_counts(self):
+        stats = self.storage.stats()
+        return {('insert',): stats.get('inserted', 0), ('change',): stats.get('changed', 0),
+                ('noop',): stats.get('unchanged', 0)}
     
-    def _connect_with_retry(self, max_retries=3, retry_delay=2):
-        """连接数据库，并在失败时重试
-        
-        Args:
-            max_retries: 最大重试次数
-            retry_delay: 重试延迟(秒)
-        
-        Returns:
-            connection: MySQL连接对象
-        """
-        retries = 0
-        last_error = None
-        
-        while retries < max_retries:
-            try:
-                # 添加连接超时设置
-                conn_config = self.db_config.copy()
-                conn_config['connect_timeout'] = 10  # 10秒连接超时
-                
-                conn = mysql.connector.connect(**conn_config)
-                return conn
-            except mysql.connector.Error as err:
-                last_error = err
-                retries += 1
-                self.logger.warning(f"数据库连接失败(尝试 {retries}/{max_retries}): {err}")
-                
-                if retries < max_retries:
-                    time.sleep(retry_delay)
-        
-        # 所有重试都失败
-        self.logger.error(f"无法连接到数据库，已重试 {max_retries} 次: {last_error}")
-        raise last_error
+    def _ensure_schema(self):
+        if not self._schema_ready:
+            self._schema_ready = self.storage.ensure_schema()
     
     def update_price(self, place_to, dep_date, arr_date, new_price, place_from='SZX', is_roundtrip=1, currency='CNY'):
         """Update flight price in the database
@@ -113,88 +78,136 @@ class PriceManager:
             bool: True if price was inserted or changed, False if unchanged
         """
         # Update local cache for notifications
-        self.update_price_info[place_to][dep_date][arr_date] = new_price
+        self.update_price_info[(place_from, place_to)][(dep_date, arr_date)] = new_price
+        if self.price_stats is not None:
+            # O(1) per price: running min/EWMA and a bucketed quantile sketch, no history query
+            self.price_stats.observe(place_from, place_to, dep_date, arr_date, new_price)
+        
+        # Format dates for MySQL (YYYY-MM-DD)
+        dep_date_formatted = f"{dep_date[:4]}-{dep_date[4:6]}-{dep_date[6:]}"
+        arr_date_formatted = f"{arr_date[:4]}-{arr_date[4:6]}-{arr_date[6:]}"
+        record = {
+            'place_from': place_from, 'place_to': place_to,
+            'dep_date': dep_date_formatted, 'arr_date': arr_date_formatted,
+            'price': float(new_price), 'is_roundtrip': is_roundtrip, 'currency': currency,
+            'observed_at': datetime.now().isoformat(),
+        }
+        
+        if self.is_degraded():
+            # Fail fast while the database is down; replayed once it is back
+            self.journal.append(record)
+            return False
         
         try:
-            # Format dates for MySQL (YYYY-MM-DD)
-            dep_date_formatted = f"{dep_date[:4]}-{dep_date[4:6]}-{dep_date[6:]}"
-            arr_date_formatted = f"{arr_date[:4]}-{arr_date[4:6]}-{arr_date[6:]}"
-            
-            conn = self._connect_with_retry()
-            cursor = conn.cursor()
+            self._ensure_schema()
+            if self.journal.has_pending():
+                self.replay_journal()
             
-            # Check if record exists and get current price
-            cursor.execute("""
-                SELECT id, price, first_seen FROM t_flight_price_current 
-                WHERE place_from = %s AND place_to = %s AND dep_date = %s AND arr_date = %s AND is_roundtrip = %s
-            """, (place_from, place_to, dep_date_formatted, arr_date_formatted, is_roundtrip))
-            
-            result = cursor.fetchone()
-            now = datetime.now()
-            
-            if result:  # Record exists
-                record_id, current_price, first_seen = result
-                
-                if float(current_price) != float(new_price):  # Price changed
-                    # Insert into history
-                    cursor.execute("""
-                        INSERT INTO t_flight_price_history 
-                        (place_from, place_to, dep_date, arr_date, old_price, new_price, changed_at, is_roundtrip, currency)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    """, (place_from, place_to, dep_date_formatted, arr_date_formatted, current_price, new_price, now, is_roundtrip, currency))
-                    
-                    # Update current price
-                    cursor.execute("""
-                        UPDATE t_flight_price_current 
-                        SET price = %s, last_checked = %s
-                        WHERE id = %s
-                    """, (new_price, now, record_id))
-                    
-                    conn.commit()
-                    self.logger.info(f"Updated price for {place_from}->{place_to}, {dep_date}->{arr_date}: {current_price} -> {new_price}")
-                    
-                    cursor.close()
-                    conn.close()
-                    return True  # Price changed
-                else:
-                    # Just update timestamp
-                    cursor.execute("""
-                        UPDATE t_flight_price_current 
-                        SET last_checked = %s
-                        WHERE id = %s
-                    """, (now, record_id))
-                    
-                    conn.commit()
-                    self.logger.debug(f"Price unchanged for {place_from}->{place_to}, {dep_date}->{arr_date}: {new_price}")
-                    
-                    cursor.close()
-                    conn.close()
-                    return False  # Price unchanged
-            else:
-                # First time seeing this route+date
-                cursor.execute("""
-                    INSERT INTO t_flight_price_current
-                    (place_from, place_to, dep_date, arr_date, price, last_checked, first_seen, is_roundtrip, currency)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """, (place_from, place_to, dep_date_formatted, arr_date_formatted, new_price, now, now, is_roundtrip, currency))
-                
-                conn.commit()
-                self.logger.info(f"New price entry for {place_from}->{place_to}, {dep_date}->{arr_date}: {new_price}")
-                
-                cursor.close()
-                conn.close()
-                return True  # New price entry
+            return self.storage.submit(place_from, place_to, dep_date_formatted, arr_date_formatted,
+                                       new_price, is_roundtrip, currency)
                 
         except Exception as e:
             self.logger.error(f"Error updating flight price in database: {e}")
+            spilled = self._enter_degraded()
+            key = (place_from, place_to, dep_date_formatted, arr_date_formatted, is_roundtrip)
+            if key not in spilled:
+                self.journal.append(record)
             return False
     
+    def is_degraded(self):
+        """True while the database is considered down and writes go to the journal"""
+        return time.monotonic() < self._degraded_until
+    
+    def _enter_degraded(self):
+        """Switch to DB degraded mode and move unwritten buffered prices to the journal
+        
+        Returns:
+            set: Keys of the buffered prices that were journaled
+        """
+        self._degraded_until = time.monotonic() + self.degraded_retry
+        self.logger.warning(f"Database unavailable, journaling prices for the next {self.degraded_retry}s")
+        
+        spilled = set()
+        for place_from, place_to, dep_date, arr_date, price, observed_at, _, is_roundtrip, currency in self.storage.drain():
+            self.journal.append({
+                'place_from': place_from, 'place_to': place_to,
+                'dep_date': dep_date, 'arr_date': arr_date,
+                'price': price, 'is_roundtrip': is_roundtrip, 'currency': currency,
+                'observed_at': observed_at.isoformat(),
+            })
+            spilled.add((place_from, place_to, dep_date, arr_date, is_roundtrip))
+        return spilled
+    
+    def _apply_journal_batch(self, records):
+        for record in records:
+            self.storage.submit(record['place_from'], record['place_to'], record['dep_date'], record['arr_date'],
+                                record['price'], record['is_roundtrip'], record['currency'],
+                                observed_at=datetime.fromisoformat(record['observed_at']))
+        self.storage.flush()
+    
+    def replay_journal(self):
+        """Bulk-load journaled prices into the database in the order they were observed"""
+        return self.journal.replay(self._apply_journal_batch, batch_size=self.storage.batch_size)
+    
+    def flush(self):
+        """Write all buffered price updates to the database
+        
+        On failure the buffered prices are moved to the local journal.
+        """
+        if self.is_degraded():
+            return 0
+        try:
+            self._ensure_schema()
+            if self.journal.has_pending():
+                self.replay_journal()
+            return self.storage.flush()
+        except Exception as e:
+            self.logger.error(f"Error flushing price updates: {e}")
+            self._enter_degraded()
+            return 0
+    
+    def refresh_alert_rules(self, force=False):
+        """Reload the alert rules if their refresh interval has passed"""
+        if self.alert_rules is None or self.is_degraded():
+            return False
+        try:
+            self._ensure_schema()
+            return self.alert_rules.refresh(force)
+        except Exception as e:
+            self.logger.error(f"Error refreshing alert rules: {e}")
+            return False
+    
+    def maintain_history(self, stop_event=None):
+        """Roll up and archive price history if the maintenance interval has passed"""
+        if self.is_degraded():
+            return None
+        try:
+            self._ensure_schema()
+            return self.storage.maintain_history(stop_event)
+        except Exception as e:
+            self.logger.error(f"Error maintaining price history: {e}")
+            return None
+    
+    def close(self):
+        """Flush buffered prices and release the journal and storage"""
+        self.flush()
+        self.journal.close()
+        self.storage.close()
+    
+    def invalidate_prices(self, place_from=None, place_to=None):
+        """Drop cached current prices so they are re-read from the database
+        
+        Use when another executor has written the same routes.
+        """
+        self.storage.invalidate(place_from, place_to)
+    
     def save_prices(self, code2city=None):
         """Save any pending price updates to database
         
-        This method now just clears the update_price_info cache since all prices
-        are already written to the database in update_price method
+        Flushes the storage write buffer and clears the update_price_info cache
         """
+        self.flush()
+        
         if not self.update_price_info:
             return
             
@@ -202,8 +215,18 @@ class PriceManager:
         update_count = sum(len(dates) for dates in self.update_price_info.values())
         self.logger.info(f"Processed {update_count} price updates")
         
+        writer_stats = self.storage.stats()
+        self.logger.info(f"Price writer ({self.storage.name}): {writer_stats['inserted']} new, {writer_stats['changed']} changed, "
+                         f"{writer_stats['unchanged']} unchanged ({writer_stats['touched']} touched), {writer_stats['flushes']} flushes "
+                         f"in {writer_stats['flush_time']:.2f}s")
+        
+        pool_stats = writer_stats.get('pool')
+        if pool_stats:
+            self.logger.info(f"DB pool: {pool_stats['checkouts']} checkouts, {pool_stats['connects']} connects, "
+                             f"avg wait {pool_stats['wait_avg'] * 1000:.1f}ms, max wait {pool_stats['wait_max'] * 1000:.1f}ms")
+        
         # Reset update info
-        self.update_price_info = defaultdict(lambda: defaultdict(dict))
+        self.update_price_info = defaultdict(dict)
     
     def get_price_history(self, place_from, place_to, dep_date, arr_date, is_roundtrip=1):
         """Get price history for a specific route and date
@@ -211,27 +234,17 @@ class PriceManager:
         Returns:
             list: List of dictionaries with price history
         """
+        # Make buffered writes visible to the query
+        self.flush()
+        if self.is_degraded():
+            return []
+        
         try:
-            # Format dates for MySQL (YYYY-MM-DD)
+            # Format dates as YYYY-MM-DD
             dep_date_formatted = f"{dep_date[:4]}-{dep_date[4:6]}-{dep_date[6:]}" if len(dep_date) == 8 else dep_date
             arr_date_formatted = f"{arr_date[:4]}-{arr_date[4:6]}-{arr_date[6:]}" if len(arr_date) == 8 else arr_date
-            
-            conn = self._connect_with_retry()
-            cursor = conn.cursor(dictionary=True)
-            
-            cursor.execute("""
-                SELECT old_price, new_price, changed_at
-                FROM t_flight_price_history
-                WHERE place_from = %s AND place_to = %s AND dep_date = %s AND arr_date = %s AND is_roundtrip = %s
-                ORDER BY changed_at ASC
-            """, (place_from, place_to, dep_date_formatted, arr_date_formatted, is_roundtrip))
-            
-            history = cursor.fetchall()
-            
-            cursor.close()
-            conn.close()
-            
-            return history
+            return self.storage.get_price_history(place_from, place_to, dep_date_formatted, arr_date_formatted,
+                                                  is_roundtrip)
             
         except Exception as e:
             self.logger.error(f"Error retrieving price history: {e}")
@@ -248,36 +261,13 @@ class PriceManager:
         Returns:
             list: List of dictionaries with price data
         """
+        # Make buffered writes visible to the query
+        self.flush()
+        if self.is_degraded():
+            return []
+        
         try:
-            conn = self._connect_with_retry()
-            cursor = conn.cursor(dictionary=True)
-            
-            query = """
-                SELECT c.place_from, c.place_to, c.dep_date, c.arr_date, 
-                       c.price, c.last_checked, c.is_roundtrip, c.currency
-                FROM t_flight_price_current c
-                WHERE 1=1
-            """
-            params = []
-            
-            if place_from:
-                query += " AND c.place_from = %s"
-                params.append(place_from)
-                
-            if place_to:
-                query += " AND c.place_to = %s"
-                params.append(place_to)
-                
-            query += " ORDER BY c.last_checked DESC LIMIT %s"
-            params.append(limit)
-            
-            cursor.execute(query, params)
-            results = cursor.fetchall()
-            
-            cursor.close()
-            conn.close()
-            
-            return results
+            return self.storage.get_latest_prices(place_from, place_to, limit)
             
         except Exception as e:
             self.logger.error(f"Error retrieving latest prices: {e}")
@@ -286,45 +276,23 @@ class PriceManager:
     def get_best_deals(self, place_from=None, max_price=None, limit=5):
         """Get the best current flight deals
         
+        The cheapest upcoming fare per origin, destination and trip pattern.
+        
         Args:
-            place_from: Optional filter by origin
+            place_from: Optional origin IATA code or list of codes
             max_price: Maximum price to consider
             limit: Number of results to return
             
         Returns:
             list: List of dictionaries with price data
         """
+        # Make buffered writes visible to the query
+        self.flush()
+        if self.is_degraded():
+            return []
+        
         try:
-            conn = self._connect_with_retry()
-            cursor = conn.cursor(dictionary=True)
-            
-            query = """
-                SELECT c.place_from, c.place_to, c.dep_date, c.arr_date, 
-                       c.price, c.last_checked, c.is_roundtrip
-                FROM t_flight_price_current c
-                WHERE 1=1 ODER BY c.dep_date DESC
-            """
-            params = []
-            
-            if place_from:
-                query += " AND c.place_from = %s"
-                params.append(place_from)
-                
-            if max_price:
-                query += " AND c.price <= %s"
-                params.append(max_price)
-                
-            query += " ORDER BY c.price ASC LIMIT %s"
-            params.append(limit)
-            
-            cursor.execute(query, params)
-            results = cursor.fetchall()
-            
-            cursor.close()
-            conn.close()
-            
-            return results
-            
+            return self.storage.get_best_deals(place_from, max_price, limit)
         except Exception as e:
             self.logger.error(f"Error retrieving best deals: {e}")
-            return []
\ No newline at end of file
+            return []
@@ -0,0 +1,238 @@
+import os
+import json
+import math
+import time
+import logging
+import threading
+from collections import defaultdict
+from datetime import date
+
+
+class QuantileSketch:
+    def __init__(self, relative_accuracy=0.02, half_life=30 * 86400, buckets=None, start=None):
+        """带时间衰减的流式分位数草图
+
+        价格按对数分桶(相对误差relative_accuracy)，每个桶只记录权重，一条航线最多几百个桶。
+        采用前向衰减：越晚的观测权重越大，权重每half_life秒翻一倍，相当于旧数据每half_life秒减半，
+        更新时不需要改动已有的桶，复杂度O(1)。权重过大时整体缩小一次。
+
+        Args:
+            relative_accuracy: 分位数的相对误差
+            half_life: 旧数据权重减半的时间(秒)
+            buckets: 可选，恢复保存的 {桶序号: 权重}
+            start: 可选，恢复保存的权重基准时间
+        """
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.half_life = half_life
+        self.buckets = buckets or {}
+        self.start = start if start is not None else time.time()
+        self.total = sum(self.buckets.values())
+        # 分位数缓存：(计算时的总权重, {q: 值})，总权重增加超过5%才重新计算
+        self._cache = (0.0, {})
+
+    def _rescale(self, now):
+        factor = 2 ** ((now - self.start) / self.half_life)
+        self.buckets = {index: weight / factor for index, weight in self.buckets.items()
+                        if weight / factor > 1e-9}
+        self.total = sum(self.buckets.values())
+        self.start = now
+        self._cache = (0.0, {})
+
+    def add(self, value, now=None):
+        if value <= 0:
+            return
+        now = now if now is not None else time.time()
+        weight = 2 ** ((now - self.start) / self.half_life)
+        if weight > 1e12:
+            self._rescale(now)
+            weight = 1.0
+        index = math.ceil(math.log(value) / self._log_gamma)
+        self.buckets[index] = self.buckets.get(index, 0.0) + weight
+        self.total += weight
+
+    def quantile(self, q):
+        """估计分位数，没有数据时返回None"""
+        if not self.total:
+            return None
+        cached_total, values = self._cache
+        if self.total > cached_total * 1.05:
+            values = {}
+            self._cache = (self.total, values)
+        value = values.get(q)
+        if value is None:
+            rank = q * self.total
+            cumulative = 0.0
+            for index in sorted(self.buckets):
+                cumulative += self.buckets[index]
+                if cumulative >= rank:
+                    break
+            # 桶内的相对误差不超过relative_accuracy
+            value = values[q] = 2 * self.gamma ** index / (self.gamma + 1)
+        return value
+
+    def to_state(self):
+        return [self.start, {str(index): round(weight, 6) for index, weight in self.buckets.items()}]
+
+    @classmethod
+    def from_state(cls, state, relative_accuracy=0.02, half_life=30 * 86400):
+        start, buckets = state
+        return cls(relative_accuracy, half_life, {int(index): weight for index, weight in buckets.items()}, start)
+
+
+class RouteStats:
+    __slots__ = ('count', 'min', 'ewma', 'sketch')
+
+    def __init__(self, sketch, count=0, min=None, ewma=None):
+        self.count = count
+        self.min = min
+        self.ewma = ewma
+        self.sketch = sketch
+
+
+class PriceStats:
+    def __init__(self, state_path=None, alpha=0.2, half_life=30 * 86400, drop_ratio=0.2, min_samples=20,
+                 relative_accuracy=0.02):
+        """按航线和日期对增量维护的价格统计，用来发现真正的降价
+
+        - 每条航线：观测次数、历史最低价、EWMA和带时间衰减的分位数草图(中位数近似最近half_life内的中位数)
+        - 每个日期对：历史最低价、EWMA和观测次数
+        每次observe的开销是O(1)，不需要查询t_flight_price_history。
+
+        一个价格同时满足下面两个条件时记为异常低价：
+        - 航线已有至少min_samples次观测，且价格不高于航线中位数的(1 - drop_ratio)
+        - 价格低于这个日期对之前的最低价，同一个低价在之后的扫描中不会重复通知
+
+        统计只包括扫描提取出的价格(符合tripPatterns且低于targetPrice)，
+        使用异常低价通知时targetPrice应设置为价格上限而不是期望价格。
+
+        统计保存在state_path中，save时写入，已出发的日期对会被清理。
+
+        Args:
+            state_path: 可选，保存统计的JSON文件路径
+            alpha: EWMA的平滑系数
+            half_life: 分位数草图中旧价格权重减半的时间(秒)
+            drop_ratio: 低于航线中位数多少比例算作异常低价
+            min_samples: 航线至少有多少次观测才判断异常
+            relative_accuracy: 分位数草图的相对误差
+        """
+        self.state_path = state_path
+        self.alpha = alpha
+        self.half_life = half_life
+        self.drop_ratio = drop_ratio
+        self.min_samples = min_samples
+        self.relative_accuracy = relative_accuracy
+        self.logger = logging.getLogger(self.__class__.__name__)
+        # (place_from, place_to) -> RouteStats
+        self.routes = {}
+        # (place_from, place_to, dep_date, arr_date) -> [最低价, EWMA, 观测次数]
+        self.pairs = {}
+        # (place_from, place_to) -> {(dep_date, arr_date): price}，结构与PriceManager.update_price_info相同
+        self.anomalies = defaultdict(dict)
+        self._dirty = False
+        # 异步扫描时多个线程同时写入价格
+        self._lock = threading.Lock()
+        self._load()
+
+    def _new_sketch(self):
+        return QuantileSketch(self.relative_accuracy, self.half_life)
+
+    def _load(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path, 'r') as f:
+                state = json.load(f)
+            for key, (count, min_price, ewma, sketch) in state['routes'].items():
+                place_from, place_to = key.split('-')
+                self.routes[(place_from, place_to)] = RouteStats(
+                    QuantileSketch.from_state(sketch, self.relative_accuracy, self.half_life), count, min_price, ewma)
+            for key, entry in state['pairs'].items():
+                self.pairs[tuple(key.split('-'))] = entry
+            self.logger.info(f"Loaded price statistics for {len(self.routes)} routes and {len(self.pairs)} date pairs")
+        except Exception as e:
+            self.logger.error(f"Failed to load price statistics: {e}")
+            self.routes = {}
+            self.pairs = {}
+
+    def observe(self, place_from, place_to, dep_date, arr_date, price, now=None):
+        """记录一个价格，返回它是否是异常低价
+
+        Args:
+            dep_date: 出发日期，格式为YYYYMMDD
+            arr_date: 返回日期，格式为YYYYMMDD
+
+        Returns:
+            bool: 是否是异常低价
+        """
+        price = float(price)
+        with self._lock:
+            route_key = (place_from, place_to)
+            pair_key = (place_from, place_to, dep_date, arr_date)
+            route = self.routes.get(route_key)
+            if route is None:
+                route = self.routes[route_key] = RouteStats(self._new_sketch())
+            pair = self.pairs.get(pair_key)
+
+            anomaly = False
+            if route.count >= self.min_samples and (pair is None or price < pair[0]):
+                median = route.sketch.quantile(0.5)
+                anomaly = median is not None and price <= median * (1 - self.drop_ratio)
+
+            route.sketch.add(price, now)
+            route.count += 1
+            route.min = price if route.min is None else min(route.min, price)
+            route.ewma = price if route.ewma is None else route.ewma + self.alpha * (price - route.ewma)
+            if pair is None:
+                self.pairs[pair_key] = [price, price, 1]
+            else:
+                pair[0] = min(pair[0], price)
+                pair[1] += self.alpha * (price - pair[1])
+                pair[2] += 1
+            self._dirty = True
+
+            if anomaly:
+                self.anomalies[route_key][(dep_date, arr_date)] = price
+        return anomaly
+
+    def route_summary(self, place_from, place_to):
+        """返回航线的统计：观测次数、最低价、EWMA、中位数和p10"""
+        route = self.routes.get((place_from, place_to))
+        if route is None:
+            return None
+        return {'count': route.count, 'min': route.min, 'ewma': route.ewma,
+                'median': route.sketch.quantile(0.5), 'p10': route.sketch.quantile(0.1)}
+
+    def pop_anomalies(self):
+        """取出并清空异常低价
+
+        Returns:
+            dict: {(place_from, place_to): {(dep_date, arr_date): price}}
+        """
+        with self._lock:
+            anomalies = self.anomalies
+            self.anomalies = defaultdict(dict)
+        return anomalies
+
+    def save(self):
+        """写入state_path，同时清理已经出发的日期对"""
+        if not self.state_path or not self._dirty:
+            return
+        today = date.today().strftime('%Y%m%d')
+        with self._lock:
+            self.pairs = {key: entry for key, entry in self.pairs.items() if key[2] >= today}
+            state = {
+                'routes': {f"{place_from}-{place_to}": [route.count, route.min, round(route.ewma, 2),
+                                                        route.sketch.to_state()]
+                           for (place_from, place_to), route in self.routes.items()},
+                'pairs': {'-'.join(key): [entry[0], round(entry[1], 2), entry[2]]
+                          for key, entry in self.pairs.items()},
+            }
+        tmp_path = f"{self.state_path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(state, f, separators=(',', ':'))
+            os.replace(tmp_path, self.state_path)
+            self._dirty = False
+        except OSError as e:
+            self.logger.error(f"Failed to save price statistics: {e}")
@@ -0,0 +1,216 @@
+import time
+import threading
+import logging
+from datetime import datetime
+from price_index import PriceIndex
+from metrics import DB_SECONDS
+
+
+class PriceWriter:
+    def __init__(self, pool, batch_size=500, flush_interval=5.0, touch_interval=60.0,
+                 sync_interval=30.0, index_size=200000, best_deals=None):
+        """缓冲写入器，把一次扫描中的价格更新攒起来批量写库
+
+        每次flush在同一个事务里执行：
+        - 一条多行 INSERT ... ON DUPLICATE KEY UPDATE 写入新价格和变化的价格
+        - 一条多行 INSERT 把价格变化写入t_flight_price_history
+        - 可选，用BestDeals重新计算有变化航线的最优价格
+
+        是否变化由PriceIndex在内存中判断。价格未变的记录不进入写缓冲，
+        只记下来，每touch_interval秒用一条UPDATE批量刷新last_checked。
+
+        Args:
+            pool: db_pool.ConnectionPool
+            batch_size: 缓冲的记录数达到该值时自动flush
+            flush_interval: 距离上次flush超过该秒数时自动flush
+            touch_interval: 批量刷新未变价格last_checked的间隔(秒)
+            sync_interval: 从数据库同步其他执行器写入的价格变化的间隔(秒)
+            index_size: PriceIndex最多保存的价格记录数
+            best_deals: 可选，best_deals.BestDeals，在同一个事务中维护t_flight_best_deal
+        """
+        self.pool = pool
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.touch_interval = touch_interval
+        self.sync_interval = sync_interval
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._lock = threading.RLock()
+        self.index = PriceIndex(pool, max_entries=index_size)
+        self.best_deals = best_deals
+        self._index_loaded = False
+        # 待写入t_flight_price_current的记录，同一个key只保留最新一次
+        self._pending = {}
+        # 待写入t_flight_price_history的价格变化
+        self._history = []
+        # 价格未变、只需要刷新last_checked的记录
+        self._touched = set()
+        self._last_flush = self._last_touch = self._last_sync = time.monotonic()
+        self.stats = {'submitted': 0, 'inserted': 0, 'changed': 0, 'unchanged': 0,
+                      'flushes': 0, 'flush_time': 0.0, 'touched': 0}
+
+    def _ensure_index(self):
+        if not self._index_loaded:
+            self.index.load()
+            self._index_loaded = True
+        elif time.monotonic() - self._last_sync >= self.sync_interval:
+            self._last_sync = time.monotonic()
+            # 写缓冲中的价格比数据库新，同步时不覆盖
+            self.index.sync(skip=self._pending)
+
+    def submit(self, place_from, place_to, dep_date, arr_date, new_price, is_roundtrip=1, currency='CNY',
+               observed_at=None):
+        """加入一条价格更新
+
+        自动flush失败时抛出异常，此时这条记录已经在写缓冲中。
+
+        Args:
+            dep_date: 出发日期，格式为YYYY-MM-DD
+            arr_date: 返回日期，格式为YYYY-MM-DD
+            observed_at: 可选，价格的查询时间，默认为当前时间
+
+        Returns:
+            bool: 新价格或价格变化返回True，价格未变返回False
+        """
+        with self._lock:
+            self._ensure_index()
+            self.index.load_route(place_from, place_to, is_roundtrip)
+
+            key = (place_from, place_to, dep_date, arr_date, is_roundtrip)
+            now = observed_at or datetime.now()
+            current_price = self.index.get(*key)
+            new_price = float(new_price)
+            self.stats['submitted'] += 1
+
+            if current_price != new_price:
+                self._pending[key] = (place_from, place_to, dep_date, arr_date, new_price, now, now, is_roundtrip, currency)
+                self._touched.discard(key)
+                self.index.set(place_from, place_to, dep_date, arr_date, is_roundtrip, new_price)
+
+            if current_price is None:
+                changed = True
+                self.stats['inserted'] += 1
+                self.logger.info(f"New price entry for {place_from}->{place_to}, {dep_date}->{arr_date}: {new_price}")
+            elif current_price != new_price:
+                changed = True
+                self.stats['changed'] += 1
+                self._history.append((place_from, place_to, dep_date, arr_date, current_price, new_price,
+                                      now, is_roundtrip, currency))
+                self.logger.info(f"Updated price for {place_from}->{place_to}, {dep_date}->{arr_date}: {current_price} -> {new_price}")
+            else:
+                changed = False
+                self.stats['unchanged'] += 1
+                if key not in self._pending:
+                    self._touched.add(key)
+                self.logger.debug(f"Price unchanged for {place_from}->{place_to}, {dep_date}->{arr_date}: {new_price}")
+
+            now_mono = time.monotonic()
+            if (len(self._pending) >= self.batch_size
+                    or now_mono - self._last_flush >= self.flush_interval):
+                self.flush(touch=now_mono - self._last_touch >= self.touch_interval)
+
+            return changed
+
+    def _touch(self):
+        """用一条UPDATE批量刷新价格未变记录的last_checked"""
+        self._last_touch = time.monotonic()
+        if not self._touched:
+            return 0
+
+        keys = list(self._touched)
+        now = datetime.now()
+        start = time.monotonic()
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                for i in range(0, len(keys), self.batch_size):
+                    chunk = keys[i:i + self.batch_size]
+                    placeholders = ', '.join(['(%s, %s, %s, %s, %s)'] * len(chunk))
+                    params = [now]
+                    for key in chunk:
+                        params.extend(key)
+                    cursor.execute(f"""
+                        UPDATE t_flight_price_current SET last_checked = %s
+                        WHERE (place_from, place_to, dep_date, arr_date, is_roundtrip) IN ({placeholders})
+                    """, params)
+                if self.best_deals:
+                    self.best_deals.touch_routes(cursor, {(key[0], key[1], key[4]) for key in keys}, now)
+                conn.commit()
+                cursor.close()
+        except Exception as e:
+            self.logger.error(f"Error refreshing last_checked for {len(keys)} prices: {e}")
+            return 0
+
+        DB_SECONDS.observe(time.monotonic() - start, 'mysql', 'touch')
+        self._touched.difference_update(keys)
+        self.stats['touched'] += len(keys)
+        return len(keys)
+
+    def flush(self, touch=True):
+        """把缓冲的记录在一个事务中批量写入数据库
+
+        写入失败时缓冲区保留并抛出异常，可以稍后重试或用drain取出。
+
+        Args:
+            touch: 是否同时批量刷新价格未变记录的last_checked
+
+        Returns:
+            int: 写入t_flight_price_current的记录数
+        """
+        with self._lock:
+            self._last_flush = time.monotonic()
+            if touch:
+                self._touch()
+            if not self._pending:
+                return 0
+
+            rows = list(self._pending.values())
+            history = list(self._history)
+            start = time.monotonic()
+            try:
+                with self.pool.connection() as conn:
+                    cursor = conn.cursor()
+                    cursor.executemany("""
+                        INSERT INTO t_flight_price_current
+                        (place_from, place_to, dep_date, arr_date, price, last_checked, first_seen, is_roundtrip, currency)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                        ON DUPLICATE KEY UPDATE price = VALUES(price), last_checked = VALUES(last_checked)
+                    """, rows)
+                    if history:
+                        cursor.executemany("""
+                            INSERT INTO t_flight_price_history
+                            (place_from, place_to, dep_date, arr_date, old_price, new_price, changed_at, is_roundtrip, currency)
+                            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                        """, history)
+                    if self.best_deals:
+                        self.best_deals.update_routes(
+                            cursor, {(row[0], row[1], row[7]): row[8] for row in rows}, self.index, datetime.now())
+                    conn.commit()
+                    cursor.close()
+            except Exception as e:
+                self.logger.error(f"Error flushing {len(rows)} price updates to database: {e}")
+                raise
+
+            elapsed = time.monotonic() - start
+            DB_SECONDS.observe(elapsed, 'mysql', 'flush')
+            self._pending.clear()
+            del self._history[:len(history)]
+            self.stats['flushes'] += 1
+            self.stats['flush_time'] += elapsed
+            self.logger.info(f"Flushed {len(rows)} prices and {len(history)} history rows in {elapsed * 1000:.1f}ms")
+            return len(rows)
+
+    def drain(self):
+        """取出写缓冲中所有未写入的记录并清空缓冲
+
+        这些记录对应的航线会从PriceIndex中移除，因为索引里已经是未写入数据库的新价格。
+
+        Returns:
+            list: t_flight_price_current的待写入记录元组
+        """
+        with self._lock:
+            rows = list(self._pending.values())
+            for place_from, place_to, _, _, _, _, _, is_roundtrip, _ in rows:
+                self.index.invalidate(place_from, place_to)
+            self._pending.clear()
+            self._history.clear()
+            return rows
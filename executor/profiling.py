@@ -0,0 +1,224 @@
+import os
+import sys
+import json
+import time
+import logging
+import threading
+from collections import Counter
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# 扫描中的阶段，按一条航线的处理顺序
+# rules为订阅规则匹配完整价格矩阵的时间，在解析之前
+PHASES = ('fetch', 'rules', 'parse', 'persist', 'alert')
+
+# 当前运行的SweepProfiler，未开启时为None
+_profiler = None
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(phase, route=None):
+    """记录一个阶段的耗时
+
+    未开启profile时返回共用的空上下文管理器，只多一次函数调用。
+
+    Args:
+        phase: 阶段名，见PHASES
+        route: 可选，航线，例如'SZX-KMG'
+    """
+    if _profiler is None:
+        return _NULL_SPAN
+    return _Span(_profiler, phase, route)
+
+
+class _Span:
+    __slots__ = ('profiler', 'phase', 'route', 'start')
+
+    def __init__(self, profiler, phase, route):
+        self.profiler = profiler
+        self.phase = phase
+        self.route = route
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.record(self.phase, self.route, self.start, time.perf_counter() - self.start)
+        return False
+
+
+class SamplingProfiler:
+    def __init__(self, interval=0.005):
+        """采样调用栈的后台线程
+
+        每interval秒用sys._current_frames()读取其他所有线程的调用栈，
+        按 线程名;函数 (文件);... 的形式合并计数，输出flamegraph.pl和speedscope可以读取的collapsed格式。
+
+        Args:
+            interval: 采样间隔(秒)
+        """
+        self.interval = interval
+        self.samples = Counter()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _frame_name(frame):
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)})"
+
+    def _sample(self, own_id):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_name(frame))
+                frame = frame.f_back
+            stack.append(names.get(thread_id, str(thread_id)))
+            self.samples[';'.join(reversed(stack))] += 1
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            self._sample(own_id)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+
+    def write_collapsed(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class SweepProfiler:
+    def __init__(self, output_dir, sample_interval=0.005):
+        """--profile模式：记录每条航线各阶段的耗时，可选同时采样调用栈
+
+        flush(常驻模式下每次扫描结束时)和stop时把上次写出之后的记录写入output_dir并清空，
+        常驻进程的内存不会随运行时间增长：
+        - profile-<时间>.json: 各阶段的次数、总耗时、平均、p50/p99和占运行时间的比例
+        - profile-<时间>-trace.json: 每个阶段一条记录的Chrome trace格式，可以用Perfetto或chrome://tracing查看
+        - profile-<时间>.collapsed: 采样的调用栈，可以用flamegraph.pl或speedscope生成火焰图
+
+        Args:
+            output_dir: 结果目录
+            sample_interval: 调用栈采样间隔(秒)，0表示不采样
+        """
+        self.output_dir = output_dir
+        self.sampler = SamplingProfiler(sample_interval) if sample_interval else None
+        # (阶段, 航线, 开始时间, 耗时, 线程id)
+        self.spans = []
+        self._started = None
+        self._wall_time = None
+
+    def record(self, phase, route, start, duration):
+        self.spans.append((phase, route, start, duration, threading.get_ident()))
+
+    def start(self):
+        global _profiler
+        self._started = time.perf_counter()
+        _profiler = self
+        if self.sampler:
+            self.sampler.start()
+        return self
+
+    def breakdown(self):
+        """按阶段汇总上次写出之后的耗时
+
+        异步扫描中多条航线同时处理，各阶段耗时之和可能超过运行时间。
+        """
+        wall_time = self._wall_time or (time.perf_counter() - self._started)
+        durations = {}
+        for phase, _, _, duration, _ in self.spans:
+            durations.setdefault(phase, []).append(duration)
+        result = {}
+        for phase in sorted(durations, key=lambda name: PHASES.index(name) if name in PHASES else len(PHASES)):
+            values = sorted(durations[phase])
+            total = sum(values)
+            result[phase] = {
+                'count': len(values),
+                'total': total,
+                'avg': total / len(values),
+                'p50': values[len(values) // 2],
+                'p99': values[min(len(values) - 1, int(len(values) * 0.99))],
+                'max': values[-1],
+                'share': total / wall_time if wall_time else 0.0,
+            }
+        return {'wall_time': wall_time, 'routes': len({span[1] for span in self.spans if span[1]}),
+                'phases': result}
+
+    def _write_trace(self, path):
+        events = []
+        for phase, route, start, duration, thread_id in self.spans:
+            events.append({'name': phase, 'cat': 'sweep', 'ph': 'X', 'pid': os.getpid(), 'tid': thread_id,
+                           'ts': (start - self._started) * 1e6, 'dur': duration * 1e6,
+                           'args': {'route': route} if route else {}})
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+    def flush(self):
+        """写出上次写出之后的记录并清空，开始下一段记录
+
+        Returns:
+            dict: breakdown()的结果，没有任何记录时为None
+        """
+        self._wall_time = time.perf_counter() - self._started
+        summary = None
+        if self.spans:
+            summary = self.breakdown()
+            os.makedirs(self.output_dir, exist_ok=True)
+            prefix = os.path.join(self.output_dir, f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+            with open(f"{prefix}.json", 'w', encoding='utf-8') as f:
+                json.dump(summary, f, indent=2)
+            self._write_trace(f"{prefix}-trace.json")
+            if self.sampler:
+                self.sampler.write_collapsed(f"{prefix}.collapsed")
+
+            lines = [f"Profile: {summary['routes']} routes in {summary['wall_time']:.2f}s, written to {prefix}.*"]
+            for phase, stats in summary['phases'].items():
+                lines.append(f"  {phase:<8} {stats['count']:>7} spans, total {stats['total']:8.2f}s "
+                             f"({stats['share'] * 100:5.1f}%), avg {stats['avg'] * 1000:7.2f}ms, "
+                             f"p99 {stats['p99'] * 1000:7.2f}ms")
+            print('\n'.join(lines))
+            logger.info('\n'.join(lines))
+
+        self.spans = []
+        if self.sampler:
+            self.sampler.samples = Counter()
+        self._started = time.perf_counter()
+        self._wall_time = None
+        return summary
+
+    def stop(self):
+        """停止记录并写出上次flush之后的结果
+
+        Returns:
+            dict: breakdown()的结果，上次flush之后没有记录时为None
+        """
+        global _profiler
+        _profiler = None
+        if self.sampler:
+            self.sampler.stop()
+        return self.flush()
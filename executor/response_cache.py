@@ -0,0 +1,78 @@
+import os
+import json
+import time
+import hashlib
+import logging
+
+
+class ResponseFingerprints:
+    def __init__(self, state_path=None, ttl=21600):
+        """按航线记录上一次价格矩阵的指纹
+
+        价格矩阵与上一次完全相同时可以跳过解析、比较和写库。
+        影响解析结果的配置(目标价格、出行模式)作为extra参与指纹计算，配置修改后不会被跳过。
+        指纹保存在内存中，并在save时写入state_path，重启后继续使用。
+        超过ttl秒的指纹视为过期，以便定期刷新数据库中的last_checked。
+
+        Args:
+            state_path: 可选，保存指纹的JSON文件路径
+            ttl: 指纹有效期(秒)
+        """
+        self.state_path = state_path
+        self.ttl = ttl
+        self.logger = logging.getLogger(self.__class__.__name__)
+        # "place_from-place_to-flight_way" -> [指纹, 记录时间]
+        self._fingerprints = self._load()
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return {}
+        try:
+            with open(self.state_path, 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            self.logger.error(f"Failed to load response fingerprints: {e}")
+            return {}
+
+    @staticmethod
+    def fingerprint(payload, *extra):
+        """计算payload的指纹，extra中的值(如目标价格)也会参与计算"""
+        content = json.dumps([payload, extra], sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+        return hashlib.blake2b(content.encode('utf-8'), digest_size=16).hexdigest()
+
+    def is_unchanged(self, key, fingerprint):
+        """判断指纹是否和上一次相同且未过期，并统计命中次数"""
+        entry = self._fingerprints.get(key)
+        if entry and entry[0] == fingerprint and time.time() - entry[1] < self.ttl:
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def remember(self, key, fingerprint):
+        """处理完成后记录新的指纹"""
+        self._fingerprints[key] = [fingerprint, time.time()]
+        self._dirty = True
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def save(self):
+        if not self.state_path or not self._dirty:
+            return
+        # 顺便清理过期的指纹
+        now = time.time()
+        self._fingerprints = {key: entry for key, entry in self._fingerprints.items()
+                              if now - entry[1] < self.ttl}
+        tmp_path = f"{self.state_path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(self._fingerprints, f)
+            os.replace(tmp_path, self.state_path)
+            self._dirty = False
+        except OSError as e:
+            self.logger.error(f"Failed to save response fingerprints: {e}")
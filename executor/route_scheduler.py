@@ -0,0 +1,163 @@
+import os
+import json
+import math
+import time
+import logging
+
+
+class RouteScheduler:
+    def __init__(self, pool, target_price, budget_per_hour=3000, sweep_interval=600,
+                 min_interval=600, max_interval=86400, history_days=14, horizon_days=60,
+                 refresh_interval=3600, state_path=None):
+        """根据价格波动自适应安排每条航线的查询频率
+
+        每条(place_from, place_to)的优先级由三部分组成：
+        - 最近history_days天在t_flight_price_history中的价格变化次数
+        - 最近的出发日期离今天有多近
+        - 当前最低价离targetPrice有多近
+
+        每小时的请求预算按优先级分给各条航线，得到每条航线的查询间隔，
+        并限制在[min_interval, max_interval]之间。
+
+        Args:
+            pool: db_pool.ConnectionPool
+            target_price: 目标价格，用于计算价格优先级
+            budget_per_hour: 每小时最多发出的查询次数
+            sweep_interval: 两次扫描的间隔(秒)，用于计算每次扫描的请求上限
+            min_interval: 单条航线的最短查询间隔(秒)
+            max_interval: 单条航线的最长查询间隔(秒)
+            history_days: 统计价格变化次数的天数
+            horizon_days: 出发日期超过该天数的航线不再加分
+            refresh_interval: 重新从数据库计算优先级的间隔(秒)
+            state_path: 可选，保存每条航线上次查询时间的JSON文件
+        """
+        self.pool = pool
+        self.target_price = target_price
+        self.budget_per_hour = budget_per_hour
+        self.sweep_interval = sweep_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.history_days = history_days
+        self.horizon_days = horizon_days
+        self.refresh_interval = refresh_interval
+        self.state_path = state_path
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.priorities = {}
+        self._refreshed_at = None
+        self._last_polled = self._load_state()
+        self._dirty = False
+
+    def _load_state(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return {}
+        try:
+            with open(self.state_path, 'r') as f:
+                return {tuple(key.split('-', 1)): polled_at for key, polled_at in json.load(f).items()}
+        except Exception as e:
+            self.logger.error(f"Failed to load route schedule state: {e}")
+            return {}
+
+    def _save_state(self):
+        if not self.state_path:
+            return
+        tmp_path = f"{self.state_path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({f"{place_from}-{place_to}": polled_at
+                           for (place_from, place_to), polled_at in self._last_polled.items()}, f)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            self.logger.error(f"Failed to save route schedule state: {e}")
+
+    def refresh(self):
+        """用两条聚合查询重新计算所有航线的优先级"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT place_from, place_to, COUNT(*) FROM t_flight_price_history
+                WHERE changed_at >= NOW() - INTERVAL %s DAY
+                GROUP BY place_from, place_to
+            """, (self.history_days,))
+            changes = {(place_from, place_to): count for place_from, place_to, count in cursor.fetchall()}
+
+            cursor.execute("""
+                SELECT place_from, place_to, MIN(price), DATEDIFF(MIN(dep_date), CURDATE())
+                FROM t_flight_price_current
+                WHERE dep_date >= CURDATE()
+                GROUP BY place_from, place_to
+            """)
+            current = {(place_from, place_to): (float(min_price), days)
+                       for place_from, place_to, min_price, days in cursor.fetchall()}
+            cursor.close()
+
+        max_changes = max(changes.values(), default=0)
+        priorities = {}
+        for route in set(changes) | set(current):
+            change_score = math.log1p(changes.get(route, 0)) / math.log1p(max_changes) if max_changes else 0.0
+            min_price, days = current.get(route, (None, None))
+            proximity_score = 1 - min(days, self.horizon_days) / self.horizon_days if days is not None else 0.0
+            price_score = min(1.0, self.target_price / min_price) if min_price else 0.0
+            # 留一个下限，冷门航线也会偶尔被查询到
+            priorities[route] = max(0.05, 0.5 * change_score + 0.25 * proximity_score + 0.25 * price_score)
+
+        self.priorities = priorities
+        self._refreshed_at = time.monotonic()
+        self.logger.info(f"Refreshed priorities for {len(priorities)} routes")
+
+    def priority(self, route):
+        # 没有任何记录的新航线给一个中等优先级，先探查一下
+        return self.priorities.get(route, 0.5)
+
+    def interval(self, route, total_priority):
+        """按预算分配得到的查询间隔(秒)"""
+        polls_per_hour = self.budget_per_hour * self.priority(route) / total_priority
+        interval = 3600 / polls_per_hour if polls_per_hour > 0 else self.max_interval
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def select(self, routes):
+        """从routes中选出本次扫描需要查询的航线，按优先级从高到低排列
+
+        选出时不记录查询时间，航线实际请求成功后由扫描调用mark_polled，
+        扫描中断或请求失败的航线下次仍然会被选中。
+
+        Args:
+            routes: (place_from, place_to)列表
+
+        Returns:
+            list: 本次应查询的(place_from, place_to)列表
+        """
+        if self._refreshed_at is None or time.monotonic() - self._refreshed_at >= self.refresh_interval:
+            try:
+                self.refresh()
+            except Exception as e:
+                self.logger.error(f"Failed to refresh route priorities: {e}")
+
+        if not routes:
+            return []
+
+        now = time.time()
+        total_priority = sum(self.priority(route) for route in routes)
+        due = []
+        for route in routes:
+            elapsed = now - self._last_polled.get(route, 0)
+            interval = self.interval(route, total_priority)
+            if elapsed >= interval:
+                due.append((elapsed / interval * self.priority(route), route))
+
+        due.sort(reverse=True)
+        limit = max(1, int(self.budget_per_hour * self.sweep_interval / 3600))
+        selected = [route for _, route in due[:limit]]
+
+        self.logger.info(f"Scheduled {len(selected)} of {len(routes)} routes ({len(due)} due, limit {limit})")
+        return selected
+
+    def mark_polled(self, place_from, place_to):
+        """记录一条航线已经查询成功，下次按它的查询间隔再选中"""
+        self._last_polled[(place_from, place_to)] = time.time()
+        self._dirty = True
+
+    def save(self):
+        """扫描结束时写出各航线的上次查询时间"""
+        if self._dirty:
+            self._save_state()
+            self._dirty = False
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TokenBucket:
+    """异步令牌桶限速器
+
+    以rate个/秒的速度补充令牌，最多积攒capacity个，用来代替每条航线之后固定的随机sleep。
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1, rate))
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self):
+        """获取一个令牌，令牌不足时等待"""
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AsyncScanEngine:
+    def __init__(self, flight_alert, concurrency=None, per_host_concurrency=None, rate=None, burst=None):
+        """并发扫描所有航线
+
+        HTTP请求仍然通过FlightAlert.get_flight_response发出，放在线程池中并发执行；
+        结果由单独的一个线程按顺序交给FlightAlert._handle_flight_info处理，
+        因此价格写库和update_price_info的更新依旧是串行的。
+
+        Args:
+            flight_alert: FlightAlert实例
+            concurrency: 全局最大并发请求数，默认读取配置scanConcurrency
+            per_host_concurrency: 机票接口host(baseUrl)的最大并发请求数，默认读取配置scanPerHostConcurrency。
+                                  扫描的所有航线都请求baseUrl这一个host，实际并发上限为它和concurrency中较小的一个
+            rate: 每秒允许发出的请求数，默认读取配置scanRatePerSecond
+            burst: 令牌桶容量，默认读取配置scanBurst
+        """
+        config = flight_alert.config_manager
+        self.flight_alert = flight_alert
+        self.concurrency = concurrency or config.get_config('scanConcurrency') or 8
+        self.per_host_concurrency = per_host_concurrency or config.get_config('scanPerHostConcurrency') or self.concurrency
+        self.rate = rate or config.get_config('scanRatePerSecond') or 2
+        self.burst = burst or config.get_config('scanBurst') or self.rate
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    async def _scan_route(self, place_from, place_to, loop, fare_api_limit, bucket, fetch_pool, process_pool,
+                          on_route_done=None, on_route_failed=None):
+        await bucket.acquire()
+        if self.flight_alert.stop_event.is_set():
+            return None
+        async with fare_api_limit:
+            flight_info = await loop.run_in_executor(
+                fetch_pool, self.flight_alert.get_flight_response, place_from, place_to
+            )
+        await loop.run_in_executor(
+            process_pool, self.flight_alert._handle_flight_info, flight_info, place_from, place_to
+        )
+        succeeded = self.flight_alert.fetch_succeeded(flight_info)
+        callback = on_route_done if succeeded else on_route_failed
+        if callback:
+            await loop.run_in_executor(process_pool, callback, place_from, place_to)
+        return succeeded
+
+    async def scan(self, routes, on_route_done=None, on_route_failed=None):
+        """并发扫描routes中的所有(出发地, 目的地)
+
+        Args:
+            routes: (place_from, place_to)列表
+            on_route_done: 可选，每条航线请求成功并处理完后调用，参数为place_from, place_to
+            on_route_failed: 可选，航线请求失败(熔断、限流、HTTP错误)时调用，参数同上
+
+        Returns:
+            dict: 扫描统计，包括航线数、失败数、耗时和每秒航线数
+        """
+        loop = asyncio.get_running_loop()
+        # 所有请求都发往baseUrl，全局上限和该host的上限合并为一个信号量
+        fare_api_limit = asyncio.Semaphore(min(self.concurrency, self.per_host_concurrency))
+        bucket = TokenBucket(self.rate, self.burst)
+        failed = 0
+
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as fetch_pool, \
+                ThreadPoolExecutor(max_workers=1) as process_pool:
+            tasks = [
+                self._scan_route(place_from, place_to, loop, fare_api_limit, bucket, fetch_pool, process_pool,
+                                 on_route_done, on_route_failed)
+                for place_from, place_to in routes
+            ]
+            for result in await asyncio.gather(*tasks, return_exceptions=True):
+                if isinstance(result, Exception):
+                    self.logger.error(f"Route scan failed: {result}")
+                if result is False or isinstance(result, Exception):
+                    failed += 1
+        elapsed = time.monotonic() - start
+
+        stats = {
+            'routes': len(routes),
+            'failed': failed,
+            'elapsed': elapsed,
+            'routes_per_second': len(routes) / elapsed if elapsed > 0 else 0.0,
+        }
+        return stats
+
+    def run(self, routes, on_route_done=None, on_route_failed=None):
+        """同步入口，扫描完成后打印并记录吞吐量"""
+        stats = asyncio.run(self.scan(routes, on_route_done, on_route_failed))
+        message = (f"Scanned {stats['routes']} routes in {stats['elapsed']:.1f}s "
+                   f"({stats['routes_per_second']:.2f} routes/s, {stats['failed']} failed)")
+        print(message)
+        self.logger.info(message)
+
+        sleep_time = self.flight_alert.config_manager.get_config('sleepTime')
+        if sleep_time and stats['elapsed'] > sleep_time:
+            self.logger.warning(f"Sweep took {stats['elapsed']:.1f}s, longer than sleepTime {sleep_time}s")
+        return stats
@@ -0,0 +1,163 @@
+import os
+import socket
+import zlib
+import math
+import logging
+import threading
+
+
+def default_node_id():
+    """节点ID，默认是 主机名-进程号，可以用环境变量FLIGHT_NODE_ID指定"""
+    return os.environ.get('FLIGHT_NODE_ID') or f"{socket.gethostname()}-{os.getpid()}"
+
+
+def route_shard(place_from, place_to, shard_count):
+    """航线所属的分片，各节点用同样的算法计算，结果稳定"""
+    return zlib.crc32(f"{place_from}-{place_to}".encode('utf-8')) % shard_count
+
+
+class ShardCoordinator:
+    def __init__(self, pool, node_id=None, shard_count=64, lease_ttl=120):
+        """多个执行器通过MySQL中的租约表划分航线
+
+        航线按route_shard分到shard_count个分片。每个节点定期心跳并续租自己持有的分片，
+        存活节点数变化时，持有超过平均份额的节点释放多余分片，其他节点认领空闲或过期的分片。
+        节点挂掉后其租约在lease_ttl秒后过期，由其他节点接手。
+
+        Args:
+            pool: db_pool.ConnectionPool
+            node_id: 可选，节点ID，默认default_node_id()
+            shard_count: 分片数，所有节点必须一致
+            lease_ttl: 租约和心跳的有效期(秒)
+        """
+        self.pool = pool
+        self.node_id = node_id or default_node_id()
+        self.shard_count = shard_count
+        self.lease_ttl = lease_ttl
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.owned_shards = frozenset()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _create_tables(self, cursor):
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS t_executor_node (
+                node_id VARCHAR(64) PRIMARY KEY,
+                heartbeat_at TIMESTAMP NOT NULL
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS t_route_shard_lease (
+                shard_id INT PRIMARY KEY,
+                node_id VARCHAR(64) NULL,
+                lease_expires TIMESTAMP NULL,
+                KEY node_idx (node_id)
+            )
+        """)
+        cursor.executemany("INSERT IGNORE INTO t_route_shard_lease (shard_id) VALUES (%s)",
+                           [(shard_id,) for shard_id in range(self.shard_count)])
+
+    def heartbeat(self):
+        """心跳、续租并重新平衡分片
+
+        Returns:
+            frozenset: 本节点当前持有的分片
+        """
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO t_executor_node (node_id, heartbeat_at) VALUES (%s, NOW())
+                ON DUPLICATE KEY UPDATE heartbeat_at = NOW()
+            """, (self.node_id,))
+            cursor.execute("""
+                UPDATE t_route_shard_lease SET lease_expires = NOW() + INTERVAL %s SECOND
+                WHERE node_id = %s
+            """, (self.lease_ttl, self.node_id))
+
+            cursor.execute("SELECT COUNT(*) FROM t_executor_node WHERE heartbeat_at >= NOW() - INTERVAL %s SECOND",
+                           (self.lease_ttl,))
+            live_nodes = max(1, cursor.fetchone()[0])
+            fair_share = math.ceil(self.shard_count / live_nodes)
+
+            cursor.execute("SELECT shard_id FROM t_route_shard_lease WHERE node_id = %s ORDER BY shard_id",
+                           (self.node_id,))
+            owned = [row[0] for row in cursor.fetchall()]
+
+            if len(owned) > fair_share:
+                # 有新节点加入，释放多余的分片
+                released = owned[fair_share:]
+                cursor.executemany("""
+                    UPDATE t_route_shard_lease SET node_id = NULL, lease_expires = NULL
+                    WHERE shard_id = %s AND node_id = %s
+                """, [(shard_id, self.node_id) for shard_id in released])
+                owned = owned[:fair_share]
+                self.logger.info(f"Released {len(released)} shards, {live_nodes} live nodes")
+            elif len(owned) < fair_share:
+                # 认领空闲或租约过期的分片，每个分片单独用条件UPDATE抢占
+                cursor.execute("""
+                    SELECT shard_id FROM t_route_shard_lease
+                    WHERE node_id IS NULL OR lease_expires < NOW()
+                    ORDER BY shard_id
+                """)
+                candidates = [row[0] for row in cursor.fetchall()]
+                for shard_id in candidates:
+                    if len(owned) >= fair_share:
+                        break
+                    cursor.execute("""
+                        UPDATE t_route_shard_lease
+                        SET node_id = %s, lease_expires = NOW() + INTERVAL %s SECOND
+                        WHERE shard_id = %s AND (node_id IS NULL OR lease_expires < NOW())
+                    """, (self.node_id, self.lease_ttl, shard_id))
+                    if cursor.rowcount == 1:
+                        owned.append(shard_id)
+
+            conn.commit()
+            cursor.close()
+
+        if frozenset(owned) != self.owned_shards:
+            self.logger.info(f"Node {self.node_id} now holds {len(owned)}/{self.shard_count} shards")
+        self.owned_shards = frozenset(owned)
+        return self.owned_shards
+
+    def _heartbeat_loop(self):
+        while not self._stop_event.wait(self.lease_ttl / 3):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                self.logger.error(f"Shard heartbeat failed: {e}")
+
+    def start(self):
+        """建表并开始后台心跳"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            self._create_tables(cursor)
+            conn.commit()
+            cursor.close()
+        self.heartbeat()
+        self._thread = threading.Thread(target=self._heartbeat_loop, name='shard-heartbeat', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止心跳并释放持有的所有分片，其他节点可以马上接手"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("UPDATE t_route_shard_lease SET node_id = NULL, lease_expires = NULL WHERE node_id = %s",
+                               (self.node_id,))
+                cursor.execute("DELETE FROM t_executor_node WHERE node_id = %s", (self.node_id,))
+                conn.commit()
+                cursor.close()
+        except Exception as e:
+            self.logger.error(f"Failed to release shards: {e}")
+        self.owned_shards = frozenset()
+
+    def filter_routes(self, routes):
+        """只保留本节点持有分片中的航线"""
+        owned = self.owned_shards
+        selected = [(place_from, place_to) for place_from, place_to in routes
+                    if route_shard(place_from, place_to, self.shard_count) in owned]
+        self.logger.info(f"Node {self.node_id} owns {len(selected)} of {len(routes)} routes")
+        return selected
@@ -0,0 +1,302 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import logging
+import threading
+from datetime import date, datetime
+from storage import PriceStorage
+from metrics import DB_SECONDS
+
+# DATE/TIMESTAMP列读出为date/datetime，与mysql.connector返回的类型一致
+sqlite3.register_converter('DATE', lambda value: date.fromisoformat(value.decode()))
+sqlite3.register_converter('TIMESTAMP', lambda value: datetime.fromisoformat(value.decode()))
+
+# 与best_deals.trip_pattern相同的出行模式键：出发星期(ISO)+住几晚
+_TRIP_PATTERN_SQL = ("((CAST(strftime('%w', dep_date) AS INTEGER) + 6) % 7 + 1) || '+' || "
+                     "CAST(julianday(arr_date) - julianday(dep_date) AS INTEGER)")
+
+
+class SQLiteStorage(PriceStorage):
+    name = 'sqlite'
+
+    def __init__(self, path, batch_size=500, flush_interval=5.0, iata_seed_paths=None):
+        """嵌入式SQLite存储后端，用于单机部署和不依赖外部服务的测试
+
+        数据库使用WAL模式和synchronous=NORMAL，提交时不等待fsync。
+        价格直接写入一个打开的事务，每batch_size条或flush_interval秒提交一次；
+        本地写入没有网络往返，不需要PriceIndex和批量SQL。
+        所有访问共用一个连接，由锁串行化。
+
+        Args:
+            path: 数据库文件路径
+            batch_size: 每多少条价格提交一次事务
+            flush_interval: 距离上次提交超过该秒数时提交
+            iata_seed_paths: t_iata_code为空时依次尝试导入的JSON文件，
+                             支持ConfigManager的IATA快照和init_db使用的 {代码: 名称} 格式
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.iata_seed_paths = iata_seed_paths or []
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._lock = threading.RLock()
+        self._conn = None
+        # 当前事务中价格有变化的记录，提交失败时由drain转存到本地日志
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self._stats = {'submitted': 0, 'inserted': 0, 'changed': 0, 'unchanged': 0,
+                       'flushes': 0, 'flush_time': 0.0, 'touched': 0}
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._create_tables(self._conn)
+        return self._conn
+
+    def ensure_schema(self):
+        with self._lock:
+            self.conn
+        return True
+
+    def _create_tables(self, conn):
+        """建表，t_iata_code为空时从iata_seed_paths导入"""
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS t_flight_price_current (
+                id INTEGER PRIMARY KEY,
+                place_from TEXT NOT NULL,
+                place_to TEXT NOT NULL,
+                dep_date DATE NOT NULL,
+                arr_date DATE NOT NULL,
+                price REAL NOT NULL,
+                last_checked TIMESTAMP NOT NULL,
+                first_seen TIMESTAMP NOT NULL,
+                is_roundtrip INTEGER NOT NULL,
+                currency TEXT DEFAULT 'CNY',
+                UNIQUE (place_from, place_to, dep_date, arr_date, is_roundtrip)
+            );
+            CREATE INDEX IF NOT EXISTS current_price_idx ON t_flight_price_current (place_from, price);
+
+            CREATE TABLE IF NOT EXISTS t_flight_price_history (
+                id INTEGER PRIMARY KEY,
+                place_from TEXT NOT NULL,
+                place_to TEXT NOT NULL,
+                dep_date DATE NOT NULL,
+                arr_date DATE NOT NULL,
+                old_price REAL NOT NULL,
+                new_price REAL NOT NULL,
+                changed_at TIMESTAMP NOT NULL,
+                is_roundtrip INTEGER NOT NULL,
+                currency TEXT DEFAULT 'CNY'
+            );
+            CREATE INDEX IF NOT EXISTS history_route_date_idx
+                ON t_flight_price_history (place_from, place_to, dep_date, arr_date, is_roundtrip, changed_at);
+
+            CREATE TABLE IF NOT EXISTS t_alert_rule (
+                id INTEGER PRIMARY KEY,
+                push_token TEXT NOT NULL,
+                origins TEXT,
+                destinations TEXT,
+                dep_start DATE,
+                dep_end DATE,
+                weekdays TEXT,
+                min_nights INTEGER,
+                max_nights INTEGER,
+                max_price REAL NOT NULL,
+                enabled INTEGER NOT NULL DEFAULT 1,
+                updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            );
+
+            CREATE TABLE IF NOT EXISTS t_iata_code (
+                iata_code TEXT PRIMARY KEY,
+                iata_name TEXT NOT NULL,
+                domestic INTEGER NOT NULL
+            );
+        """)
+        if conn.execute("SELECT COUNT(*) FROM t_iata_code").fetchone()[0] == 0:
+            self._seed_iata_codes()
+
+    def _seed_iata_codes(self):
+        for seed_path in self.iata_seed_paths:
+            if not os.path.exists(seed_path):
+                continue
+            with open(seed_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if 'code2city' in data:
+                domestic = set(data.get('domestic', []))
+                rows = [(code, name, 1 if code in domestic else 0) for code, name in data['code2city'].items()]
+            else:
+                rows = [(code, name, 1) for code, name in data.items()]
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO t_iata_code (iata_code, iata_name, domestic) VALUES (?, ?, ?)", rows)
+            self.logger.info(f"Seeded {len(rows)} IATA codes from {seed_path}")
+            return
+
+    def submit(self, place_from, place_to, dep_date, arr_date, price, is_roundtrip=1, currency='CNY',
+               observed_at=None):
+        price = float(price)
+        observed_at = observed_at or datetime.now()
+        now = observed_at.isoformat(sep=' ', timespec='seconds')
+        key = (place_from, place_to, dep_date, arr_date, is_roundtrip)
+        with self._lock:
+            conn = self.conn
+            self._stats['submitted'] += 1
+            row = conn.execute("""
+                SELECT price FROM t_flight_price_current
+                WHERE place_from = ? AND place_to = ? AND dep_date = ? AND arr_date = ? AND is_roundtrip = ?
+            """, key).fetchone()
+
+            if row is None:
+                conn.execute("""
+                    INSERT INTO t_flight_price_current
+                    (place_from, place_to, dep_date, arr_date, price, last_checked, first_seen, is_roundtrip, currency)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, (place_from, place_to, dep_date, arr_date, price, now, now, is_roundtrip, currency))
+                changed = True
+                self._stats['inserted'] += 1
+                self.logger.info(f"New price entry for {place_from}->{place_to}, {dep_date}->{arr_date}: {price}")
+            elif row['price'] != price:
+                conn.execute("""
+                    UPDATE t_flight_price_current SET price = ?, last_checked = ?
+                    WHERE place_from = ? AND place_to = ? AND dep_date = ? AND arr_date = ? AND is_roundtrip = ?
+                """, (price, now) + key)
+                conn.execute("""
+                    INSERT INTO t_flight_price_history
+                    (place_from, place_to, dep_date, arr_date, old_price, new_price, changed_at, is_roundtrip, currency)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, (place_from, place_to, dep_date, arr_date, row['price'], price, now, is_roundtrip, currency))
+                changed = True
+                self._stats['changed'] += 1
+                self.logger.info(f"Updated price for {place_from}->{place_to}, {dep_date}->{arr_date}: {row['price']} -> {price}")
+            else:
+                conn.execute("""
+                    UPDATE t_flight_price_current SET last_checked = ?
+                    WHERE place_from = ? AND place_to = ? AND dep_date = ? AND arr_date = ? AND is_roundtrip = ?
+                """, (now,) + key)
+                changed = False
+                self._stats['unchanged'] += 1
+                self._stats['touched'] += 1
+
+            if changed:
+                self._pending.append((place_from, place_to, dep_date, arr_date, price, observed_at, observed_at,
+                                      is_roundtrip, currency))
+            if (len(self._pending) >= self.batch_size
+                    or time.monotonic() - self._last_flush >= self.flush_interval):
+                self.flush()
+            return changed
+
+    def flush(self):
+        with self._lock:
+            self._last_flush = time.monotonic()
+            if self._conn is None or not self._conn.in_transaction:
+                return 0
+            start = time.monotonic()
+            self._conn.commit()
+            elapsed = time.monotonic() - start
+            DB_SECONDS.observe(elapsed, 'sqlite', 'flush')
+            written = len(self._pending)
+            self._pending.clear()
+            self._stats['flushes'] += 1
+            self._stats['flush_time'] += elapsed
+            return written
+
+    def drain(self):
+        with self._lock:
+            if self._conn is not None and self._conn.in_transaction:
+                self._conn.rollback()
+            rows = list(self._pending)
+            self._pending.clear()
+            return rows
+
+    def _fetch(self, query, params=()):
+        with self._lock:
+            return [dict(row) for row in self.conn.execute(query, params).fetchall()]
+
+    def get_price_history(self, place_from, place_to, dep_date, arr_date, is_roundtrip=1):
+        return self._fetch("""
+            SELECT old_price, new_price, changed_at
+            FROM t_flight_price_history
+            WHERE place_from = ? AND place_to = ? AND dep_date = ? AND arr_date = ? AND is_roundtrip = ?
+            ORDER BY changed_at ASC
+        """, (place_from, place_to, dep_date, arr_date, is_roundtrip))
+
+    def get_latest_prices(self, place_from=None, place_to=None, limit=10):
+        query = """
+            SELECT place_from, place_to, dep_date, arr_date, price, last_checked, is_roundtrip, currency
+            FROM t_flight_price_current
+            WHERE 1=1
+        """
+        params = []
+        if place_from:
+            query += " AND place_from = ?"
+            params.append(place_from)
+        if place_to:
+            query += " AND place_to = ?"
+            params.append(place_to)
+        query += " ORDER BY last_checked DESC LIMIT ?"
+        params.append(limit)
+        return self._fetch(query, params)
+
+    def get_best_deals(self, place_from=None, max_price=None, limit=5):
+        if isinstance(place_from, str):
+            place_from = [place_from]
+        # SQLite中与MIN()一起查询的其他列取自价格最低的那一行
+        query = f"""
+            SELECT place_from, place_to, dep_date, arr_date, MIN(price) AS price, last_checked, is_roundtrip,
+                   {_TRIP_PATTERN_SQL} AS trip_pattern
+            FROM t_flight_price_current
+            WHERE dep_date >= date('now', 'localtime')
+        """
+        params = []
+        if place_from:
+            query += f" AND place_from IN ({', '.join(['?'] * len(place_from))})"
+            params.extend(place_from)
+        if max_price:
+            query += " AND price <= ?"
+            params.append(max_price)
+        query += " GROUP BY place_from, place_to, is_roundtrip, trip_pattern ORDER BY price ASC LIMIT ?"
+        params.append(limit)
+        return self._fetch(query, params)
+
+    def iata_version(self):
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT iata_code, iata_name, domestic FROM t_iata_code ORDER BY iata_code").fetchall()
+        return hashlib.md5(json.dumps([tuple(row) for row in rows], ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def load_iata_codes(self):
+        code2city = {}
+        domestic_codes = []
+        with self._lock:
+            for iata_code, iata_name, domestic in self.conn.execute(
+                    "SELECT iata_code, iata_name, domestic FROM t_iata_code"):
+                code2city[iata_code] = iata_name
+                if domestic == 1:
+                    domestic_codes.append(iata_code)
+        return code2city, domestic_codes
+
+    def load_alert_rules(self):
+        return self._fetch("""
+            SELECT id, push_token, origins, destinations, dep_start, dep_end, weekdays,
+                   min_nights, max_nights, max_price
+            FROM t_alert_rule
+            WHERE enabled = 1 AND (dep_end IS NULL OR dep_end >= date('now', 'localtime'))
+        """)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self.flush()
+                self._conn.close()
+                self._conn = None
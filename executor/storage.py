@@ -0,0 +1,136 @@
+import os
+
+
+class PriceStorage:
+    """价格存储后端接口
+
+    PriceManager通过这个接口读写价格，ConfigManager通过它读取IATA代码，
+    本地日志和降级逻辑在PriceManager中，与后端无关。
+    后端出错时直接抛出异常，由调用方处理。
+
+    日期参数和返回值中的日期格式都是YYYY-MM-DD。
+    pool为MySQL连接池，只有MySQL后端有；分片、自适应调度和增量导出依赖它。
+    """
+
+    name = None
+    pool = None
+    batch_size = 500
+
+    def ensure_schema(self):
+        """建表或升级表结构，只在第一次访问数据库时调用
+
+        Returns:
+            bool: 表结构是否可用
+        """
+        raise NotImplementedError
+
+    def submit(self, place_from, place_to, dep_date, arr_date, price, is_roundtrip=1, currency='CNY',
+               observed_at=None):
+        """写入一条价格观测，可以先缓冲
+
+        Returns:
+            bool: 新价格或价格变化返回True，价格未变返回False
+        """
+        raise NotImplementedError
+
+    def flush(self):
+        """把缓冲的价格写入存储，失败时抛出异常并保留缓冲"""
+        raise NotImplementedError
+
+    def drain(self):
+        """取出并清空未写入的缓冲记录，用于转存到本地日志
+
+        Returns:
+            list: (place_from, place_to, dep_date, arr_date, price, observed_at, first_seen, is_roundtrip, currency)
+        """
+        raise NotImplementedError
+
+    def invalidate(self, place_from=None, place_to=None):
+        """丢弃缓存的当前价格"""
+
+    def get_price_history(self, place_from, place_to, dep_date, arr_date, is_roundtrip=1):
+        raise NotImplementedError
+
+    def get_latest_prices(self, place_from=None, place_to=None, limit=10):
+        raise NotImplementedError
+
+    def get_best_deals(self, place_from=None, max_price=None, limit=5):
+        raise NotImplementedError
+
+    def iata_version(self):
+        """IATA代码表的版本，表内容变化时版本随之变化"""
+        raise NotImplementedError
+
+    def load_iata_codes(self):
+        """读取IATA代码表
+
+        Returns:
+            tuple: ({iata_code: iata_name}, [国内机场代码, ...])
+        """
+        raise NotImplementedError
+
+    def load_alert_rules(self):
+        """读取t_alert_rule中启用的用户订阅规则
+
+        Returns:
+            list: 字典列表，字段见alert_rules.parse_rule
+        """
+        raise NotImplementedError
+
+    def maintain_history(self, stop_event=None):
+        """价格历史的汇总和归档，后端不需要时什么都不做"""
+        return None
+
+    def stats(self):
+        """写入统计，字段至少包括inserted/changed/unchanged/touched/flushes/flush_time"""
+        return {}
+
+    def close(self):
+        pass
+
+
+def create_storage(config, db_config=None, base_dir=None):
+    """根据配置storageBackend创建存储后端
+
+    Args:
+        config: config.json的内容
+        db_config: MySQL数据库配置字典，只有mysql后端使用
+        base_dir: 相对路径的基准目录，默认是本模块所在目录
+
+    Returns:
+        PriceStorage
+    """
+    base_dir = base_dir or os.path.dirname(os.path.realpath(__file__))
+    backend = config.get('storageBackend') or 'mysql'
+
+    if backend == 'sqlite':
+        from sqlite_storage import SQLiteStorage
+        path = config.get('sqlitePath') or os.path.join('data', 'flights.db')
+        seed = config.get('sqliteIataSeed') or 'iata_code_domestic.json'
+        return SQLiteStorage(
+            os.path.join(base_dir, path),
+            batch_size=config.get('dbBatchSize') or 500,
+            flush_interval=config.get('dbFlushInterval') or 5.0,
+            iata_seed_paths=[os.path.join(base_dir, seed),
+                             os.path.join(base_dir, 'data', 'iata_snapshot.json')]
+        )
+
+    if backend == 'mysql':
+        from credentials import get_database_config
+        from db_pool import get_pool
+        from mysql_storage import MySQLStorage
+        return MySQLStorage(
+            get_pool(db_config or get_database_config()),
+            batch_size=config.get('dbBatchSize') or 500,
+            flush_interval=config.get('dbFlushInterval') or 5.0,
+            touch_interval=config.get('dbTouchInterval') or 60.0,
+            index_size=config.get('priceIndexSize') or 200000,
+            history_options=dict(
+                batch_size=config.get('historyBatchSize') or 2000,
+                batch_pause=config.get('historyBatchPause') or 0.2,
+                max_run_seconds=config.get('historyMaxRunSeconds') or 60,
+                interval=config.get('historyMaintenanceInterval') or 3600
+            )
+        )
+
+    raise ValueError(f"Unknown storageBackend: {backend}")
@@ -0,0 +1,173 @@
+import os
+import json
+import uuid
+import hashlib
+import logging
+import threading
+from datetime import datetime
+
+
+class SweepCheckpoint:
+    def __init__(self, state_path, save_every=20, rotate_fraction=0.1, on_save=None, max_attempts=3):
+        """保存扫描进度，中断后下次运行从断点继续
+
+        进度按sweep_id保存在state_path中，记录本次扫描的起始偏移、已完成的航线和失败的航线。
+        只有请求成功的航线才记为完成；请求失败(熔断、限流、HTTP错误)的航线在下次运行时重试，
+        同一次扫描中失败max_attempts次后放弃，避免一直无法访问的航线让扫描永远无法完成。
+        下次运行时如果航线集合没有变化且上次扫描没有完成，就跳过已完成的航线继续扫描；
+        否则开始新的扫描，起始偏移向后移动航线总数的rotate_fraction，
+        让排在末尾的航线轮流排到前面。
+
+        Args:
+            state_path: 进度文件路径
+            save_every: 每完成多少条航线写一次进度文件
+            rotate_fraction: 每次新扫描起始偏移移动的比例
+            on_save: 可选，写进度文件之前调用，例如先把缓冲的价格写入数据库，
+                     保证记录为已完成的航线的价格不会丢失
+            max_attempts: 一条航线在同一次扫描中最多尝试的次数
+        """
+        self.state_path = state_path
+        self.save_every = save_every
+        self.rotate_fraction = rotate_fraction
+        self.on_save = on_save
+        self.max_attempts = max_attempts
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._lock = threading.Lock()
+        self._state = self._load()
+        self._unsaved = 0
+
+    def _load(self):
+        if not os.path.exists(self.state_path):
+            return {}
+        try:
+            with open(self.state_path, 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            self.logger.error(f"Failed to load sweep checkpoint: {e}")
+            return {}
+
+    def _save(self):
+        if self.on_save:
+            try:
+                self.on_save()
+            except Exception as e:
+                self.logger.error(f"Checkpoint pre-save hook failed: {e}")
+                return
+        tmp_path = f"{self.state_path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(self._state, f)
+            os.replace(tmp_path, self.state_path)
+            self._unsaved = 0
+        except OSError as e:
+            self.logger.error(f"Failed to save sweep checkpoint: {e}")
+
+    @staticmethod
+    def _route_key(place_from, place_to):
+        return f"{place_from}-{place_to}"
+
+    @staticmethod
+    def _routes_hash(routes):
+        content = ','.join(f"{place_from}-{place_to}" for place_from, place_to in routes)
+        return hashlib.md5(content.encode('utf-8')).hexdigest()
+
+    @property
+    def sweep_id(self):
+        return self._state.get('sweep_id')
+
+    def begin(self, routes, route_set=None, rotate=True):
+        """开始或恢复一次扫描
+
+        Args:
+            routes: 本次扫描的(place_from, place_to)列表
+            route_set: 可选，用来判断能否恢复的完整航线集合，默认为routes。
+                       自适应调度和分片每次选出的航线不同，用全部航线作为键才能恢复上次的进度
+            rotate: 是否按起始偏移轮转，routes已经按优先级排好序时传False
+
+        Returns:
+            list: 按起始偏移轮转(rotate为True时)、并去掉已完成航线后的待扫描列表
+        """
+        with self._lock:
+            routes_hash = self._routes_hash(sorted(route_set if route_set is not None else routes))
+            state = self._state
+            if state.get('routes_hash') == routes_hash and not state.get('completed'):
+                done = set(state.get('done', []))
+                # 本次没有选中的失败航线不再等待重试，否则这次扫描永远无法完成
+                route_keys = {self._route_key(*route) for route in routes}
+                state['failed'] = {key: count for key, count in state.get('failed', {}).items() if key in route_keys}
+                self.logger.info(f"Resuming sweep {state['sweep_id']}: {len(done)}/{len(routes)} routes already done, "
+                                 f"{len(state.get('failed', {}))} failed routes to retry")
+            else:
+                step = max(1, int(len(routes) * self.rotate_fraction))
+                offset = (state.get('offset', 0) + step) % len(routes) if routes else 0
+                self._state = state = {
+                    'sweep_id': f"{datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}",
+                    'routes_hash': routes_hash,
+                    'offset': offset,
+                    'started_at': datetime.now().isoformat(timespec='seconds'),
+                    'completed': False,
+                    'done': [],
+                    'failed': {},
+                }
+                done = set()
+                self._save()
+                self.logger.info(f"Starting sweep {state['sweep_id']} at offset {offset} of {len(routes)} routes")
+
+            offset = state['offset'] if rotate else 0
+            rotated = routes[offset:] + routes[:offset]
+            return [route for route in rotated if self._route_key(*route) not in done]
+
+    def _record(self):
+        self._unsaved += 1
+        if self._unsaved >= self.save_every:
+            self._save()
+
+    def mark_done(self, place_from, place_to):
+        """记录一条航线已完成，每save_every条写一次文件"""
+        key = self._route_key(place_from, place_to)
+        with self._lock:
+            self._state.setdefault('done', []).append(key)
+            self._state.get('failed', {}).pop(key, None)
+            self._record()
+
+    def mark_failed(self, place_from, place_to):
+        """记录一条航线请求失败，下次运行时重试，失败max_attempts次后放弃"""
+        key = self._route_key(place_from, place_to)
+        with self._lock:
+            failed = self._state.setdefault('failed', {})
+            failed[key] = failed.get(key, 0) + 1
+            if failed[key] >= self.max_attempts:
+                self.logger.warning(f"Giving up on {key} for sweep {self.sweep_id} after {failed[key]} failed attempts")
+                del failed[key]
+                self._state.setdefault('done', []).append(key)
+            self._record()
+
+    def finish(self):
+        """扫描结束：没有待重试的航线时记为完成，否则保存进度，下次运行重试失败的航线
+
+        Returns:
+            bool: 扫描是否已完成
+        """
+        with self._lock:
+            failed = self._state.get('failed')
+        if failed:
+            self.logger.info(f"Sweep {self.sweep_id} has {len(failed)} failed routes, will retry them on the next run")
+            self.flush()
+            return False
+        self.complete()
+        return True
+
+    def complete(self):
+        """扫描正常结束，下次运行开始新的扫描"""
+        with self._lock:
+            self._state['completed'] = True
+            self._state['done'] = []
+            self._state['failed'] = {}
+            self._state['finished_at'] = datetime.now().isoformat(timespec='seconds')
+            self._save()
+
+    def flush(self):
+        """扫描被中断时写出最新进度"""
+        with self._lock:
+            if self._unsaved:
+                self._save()
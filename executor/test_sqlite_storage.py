@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+from datetime import date, timedelta
+from price_manager import PriceManager
+from sqlite_storage import SQLiteStorage
+
+
+class SQLiteStorageTest(unittest.TestCase):
+    """用临时SQLite文件验证价格写入、读取和提醒规则加载，不需要MySQL"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, 'flight.db')
+        self.manager = PriceManager(storage=SQLiteStorage(self.db_path),
+                                    journal_path=os.path.join(self.tmp_dir.name, 'price_journal.ndjson'))
+        self.dep_date = date.today() + timedelta(days=30)
+        self.arr_date = self.dep_date + timedelta(days=3)
+
+    def tearDown(self):
+        self.manager.close()
+        self.tmp_dir.cleanup()
+
+    def _update(self, price):
+        return self.manager.update_price('PEK', self.dep_date.strftime('%Y%m%d'), self.arr_date.strftime('%Y%m%d'),
+                                         price, place_from='SZX')
+
+    def test_save_and_read_latest_prices(self):
+        self.assertTrue(self._update(1200))
+        self.assertTrue(self._update(980))
+        self.assertFalse(self._update(980))
+        self.manager.save_prices()
+
+        # 重新打开数据库文件，确认价格已经提交
+        storage = SQLiteStorage(self.db_path)
+        try:
+            prices = storage.get_latest_prices('SZX', 'PEK')
+            history = storage.get_price_history('SZX', 'PEK', self.dep_date.isoformat(), self.arr_date.isoformat())
+        finally:
+            storage.close()
+        self.assertEqual(len(prices), 1)
+        self.assertEqual(prices[0]['dep_date'], self.dep_date)
+        self.assertEqual(prices[0]['arr_date'], self.arr_date)
+        self.assertEqual(prices[0]['price'], 980.0)
+        self.assertEqual([(row['old_price'], row['new_price']) for row in history], [(1200.0, 980.0)])
+        self.assertEqual(self.manager.get_latest_prices('SZX', 'PEK')[0]['price'], 980.0)
+
+    def test_load_alert_rules(self):
+        storage = self.manager.storage
+        with storage.conn:
+            storage.conn.executemany("""
+                INSERT INTO t_alert_rule (push_token, origins, destinations, dep_start, dep_end, max_price, enabled)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, [
+                ('token-a', 'SZX', 'PEK,SHA', self.dep_date.isoformat(), self.arr_date.isoformat(), 1000, 1),
+                ('token-b', 'SZX', None, None, None, 800, 0),
+                ('token-c', 'SZX', None, None, (date.today() - timedelta(days=1)).isoformat(), 800, 1),
+            ])
+
+        rules = storage.load_alert_rules()
+        self.assertEqual(len(rules), 1)
+        self.assertEqual(rules[0]['push_token'], 'token-a')
+        self.assertEqual(rules[0]['destinations'], 'PEK,SHA')
+        self.assertEqual(rules[0]['dep_start'], self.dep_date)
+        self.assertEqual(rules[0]['max_price'], 1000.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
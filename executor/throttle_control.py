@@ -0,0 +1,183 @@
+import time
+import logging
+import threading
+import requests
+
+
+class CircuitOpenError(Exception):
+    """接口熔断中，请求没有发出"""
+
+
+class EndpointGuard:
+    def __init__(self, name, min_limit=1, max_limit=16, initial_limit=2, increase_every=10,
+                 decrease_factor=0.5, latency_factor=3.0, failure_threshold=5, reset_timeout=60,
+                 is_throttled=None):
+        """单个机票接口的AIMD并发控制和熔断
+
+        - 连续increase_every次正常响应后并发上限加1(加性增)
+        - 遇到限流状态、429/5xx、超时、连接错误或延迟超过平均值latency_factor倍时上限乘以decrease_factor(乘性减)
+        - 连续failure_threshold次失败后熔断，reset_timeout秒后放行一个探测请求，探测成功则恢复；
+          熔断前发出、之后才返回的请求不影响熔断状态
+
+        Args:
+            name: 接口名称，用于日志和统计
+            min_limit: 并发上限的最小值
+            max_limit: 并发上限的最大值
+            initial_limit: 初始并发上限
+            increase_every: 每多少次连续正常响应增加一次上限
+            decrease_factor: 限流时上限的缩减比例
+            latency_factor: 延迟超过平均延迟多少倍视为延迟突增
+            failure_threshold: 触发熔断的连续失败次数
+            reset_timeout: 熔断持续时间(秒)
+            is_throttled: 可选，根据解析后的响应判断是否被限流的函数
+        """
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.initial_limit = max(min_limit, min(max_limit, initial_limit))
+        self.limit = self.initial_limit
+        self.increase_every = increase_every
+        self.decrease_factor = decrease_factor
+        self.latency_factor = latency_factor
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.is_throttled = is_throttled or (lambda result: False)
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._healthy_streak = 0
+        self._consecutive_failures = 0
+        self._state = 'closed'
+        self._opened_at = 0.0
+        # 当前探测请求的编号，没有探测请求时为None
+        self._probe_in_flight = None
+        self._probe_seq = 0
+        self._latency_ewma = None
+        self._stats = {'requests': 0, 'successes': 0, 'failures': 0, 'throttled': 0,
+                       'rejected': 0, 'circuit_opens': 0}
+
+    def _acquire(self):
+        """占用一个并发名额
+
+        Returns:
+            int: 半开状态下放行的探测请求编号，普通请求为None
+        """
+        probe = None
+        with self._cond:
+            if self._state == 'open':
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    self._stats['rejected'] += 1
+                    raise CircuitOpenError(f"{self.name} circuit open")
+                self._state = 'half_open'
+                self.logger.info(f"{self.name}: circuit half-open, probing")
+
+            if self._state == 'half_open':
+                # 半开状态只放行一个探测请求
+                if self._probe_in_flight is not None:
+                    self._stats['rejected'] += 1
+                    raise CircuitOpenError(f"{self.name} circuit half-open, probe in flight")
+                self._probe_seq += 1
+                probe = self._probe_in_flight = self._probe_seq
+
+            while self._in_flight >= int(self.limit):
+                self._cond.wait()
+            self._in_flight += 1
+            self._stats['requests'] += 1
+        return probe
+
+    def _release(self, probe, ok, throttled, latency):
+        with self._cond:
+            self._in_flight -= 1
+            is_probe = probe is not None and probe == self._probe_in_flight
+            if is_probe:
+                self._probe_in_flight = None
+            # 熔断或半开时只有探测请求的结果决定状态，之前发出的慢请求只计入统计
+            decides_state = self._state == 'closed' or is_probe
+
+            spike = False
+            if ok and latency is not None:
+                if self._latency_ewma is not None and latency > self._latency_ewma * self.latency_factor:
+                    spike = True
+                self._latency_ewma = latency if self._latency_ewma is None else \
+                    0.8 * self._latency_ewma + 0.2 * latency
+
+            if throttled or spike:
+                self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                self._healthy_streak = 0
+                if throttled:
+                    self._stats['throttled'] += 1
+                self.logger.info(f"{self.name}: {'throttled' if throttled else 'latency spike'}, "
+                                 f"concurrency limit -> {self.limit:.1f}")
+            elif ok:
+                self._healthy_streak += 1
+                if self._healthy_streak >= self.increase_every and self.limit < self.max_limit:
+                    self.limit = min(self.max_limit, int(self.limit) + 1)
+                    self._healthy_streak = 0
+
+            if ok and not throttled:
+                self._stats['successes'] += 1
+                if decides_state:
+                    self._consecutive_failures = 0
+                    if self._state != 'closed':
+                        self.logger.info(f"{self.name}: circuit closed")
+                    self._state = 'closed'
+            else:
+                self._stats['failures'] += 1
+                if decides_state:
+                    self._consecutive_failures += 1
+                if decides_state and (self._state == 'half_open'
+                                      or self._consecutive_failures >= self.failure_threshold):
+                    if self._state != 'open':
+                        self._stats['circuit_opens'] += 1
+                        self.logger.warning(f"{self.name}: circuit open for {self.reset_timeout}s "
+                                            f"after {self._consecutive_failures} failures")
+                    self._state = 'open'
+                    self._opened_at = time.monotonic()
+
+            self._cond.notify_all()
+
+    def call(self, fetch, *args, **kwargs):
+        """在并发上限和熔断保护下调用fetch
+
+        Raises:
+            CircuitOpenError: 接口熔断中
+            requests.RequestException: fetch抛出的请求异常
+        """
+        probe = self._acquire()
+        start = time.monotonic()
+        try:
+            result = fetch(*args, **kwargs)
+        except requests.HTTPError as e:
+            status = e.response.status_code if e.response is not None else None
+            self._release(probe, False, status == 429 or (status is not None and status >= 500), None)
+            raise
+        except (requests.Timeout, requests.ConnectionError):
+            # 超时和连接错误通常说明接口过载或在丢弃连接，同样减小并发
+            self._release(probe, False, True, None)
+            raise
+        except Exception:
+            self._release(probe, False, False, None)
+            raise
+        self._release(probe, True, bool(self.is_throttled(result)), time.monotonic() - start)
+        return result
+
+    @property
+    def pacing_factor(self):
+        """串行扫描时的sleep缩放比例
+
+        以初始并发上限为基准：上限没有超过初始值时为1，保持原来的间隔；
+        上限增长后按比例缩短sleep。
+        """
+        return self.initial_limit / max(self.initial_limit, self.limit)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'state': self._state,
+                'limit': round(self.limit, 2),
+                'in_flight': self._in_flight,
+                'latency_ewma_ms': round(self._latency_ewma * 1000, 1) if self._latency_ewma is not None else None,
+            })
+        return stats
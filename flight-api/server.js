@@ -57,10 +57,10 @@ app.get('/api/departure-cities', async (req, res) => {
   try {
     const [rows] = await pool.execute(`
       SELECT DISTINCT 
-        c.place_from as iata_code,
+        d.place_from as iata_code,
         i.iata_name as city_name
-      FROM t_flight_price_current c
-      JOIN t_iata_code i ON c.place_from = i.iata_code
+      FROM t_flight_best_deal d
+      JOIN t_iata_code i ON d.place_from = i.iata_code
       ORDER BY i.iata_name
     `);
 
@@ -81,33 +81,36 @@ app.get('/api/flights', async (req, res) => {
   const { departure } = req.query; // 获取出发地参数
   
   try {
+    // 读执行器维护的最优价格表(每个目的地、出行模式一条)，不再扫描t_flight_price_current
     let query = `
       SELECT
-        c.place_from,
-        c.place_to,
-        c.dep_date,
-        c.arr_date,
-        c.price,
-        c.last_checked,
-        c.is_roundtrip,
+        d.place_from,
+        d.place_to,
+        d.dep_date,
+        d.arr_date,
+        d.price,
+        d.last_checked,
+        d.is_roundtrip,
+        d.trip_pattern,
         to_city.iata_name as city_name,
         from_city.iata_name as from_city_name
       FROM
-        t_flight_price_current c
+        t_flight_best_deal d
       JOIN
-        t_iata_code to_city ON c.place_to = to_city.iata_code
+        t_iata_code to_city ON d.place_to = to_city.iata_code
       JOIN
-        t_iata_code from_city ON c.place_from = from_city.iata_code
+        t_iata_code from_city ON d.place_from = from_city.iata_code
+      WHERE d.dep_date >= CURDATE()
     `;
     
     const params = [];
     
     if (departure) {
-      query += ` WHERE c.place_from = ?`;
+      query += ` AND d.place_from = ?`;
       params.push(departure);
     }
     
-    query += ` ORDER BY c.last_checked DESC`;
+    query += ` ORDER BY d.price ASC`;
 
     const [rows] = await pool.execute(query, params);
 